@@ -1,11 +1,19 @@
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from typing import Any, Awaitable, Callable
 import uvicorn
 import logging
+import asyncio
+import hashlib
+import os
+import uuid
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from src.graph import graph, END
 from utils.logger import setup_logging
 from utils.helper import (
     parse_file,
@@ -13,13 +21,102 @@ from utils.helper import (
     update_session,
     get_stage_content,
     async_time_logger,
-    LLM
+    evict_idle_sessions,
+    evict_session,
+    register_session_eviction_hook,
+    append_session_message,
+    share_session_history,
+    restore_target,
+    retained_checkpoint_ids,
+    list_sessions,
+    peek_session,
+    STAGE_CONTENT_KEYS,
+    get_session_messages,
+    warm_up_clients,
+    document_addition,
+)
+from utils.singleflight import AsyncSingleFlight
+from utils.models import STAGE_LATENCY
+from utils.rate_limiter import LLM_RATE_LIMITER
+from utils.resilience import LLM_RESILIENCE, PARSE_RESILIENCE
+from utils.transport import PARSE_TRANSPORT
+from utils.tokens import TOKEN_USAGE
+from utils.job_queue import JOB_QUEUE_PATH, FINISHED_STATUSES, get_job_queue
+from utils.near_duplicates import NEAR_DUPLICATES, approved_outputs
+from utils.triage import triage_reply
+from utils.diagnostics import MEMORY_DIAGNOSTICS_SAMPLER, authorized, memory_report
+from utils.context_cache import (
+    create_document_cache,
+    refresh_document_cache,
+    release_document_cache,
+    retain_document_cache,
+)
+from utils.retrieval import should_index, build_session_index, extend_session_index, drop_session_index, share_session_index
+from utils.session_control import (
+    SessionRunGuard,
+    IdempotencyCache,
+    IdempotencyKeyReusedError,
+    SupersededError,
+    request_fingerprint,
 )
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Work Scope Generator")
+SESSION_SWEEP_INTERVAL_SECONDS = 60
+SESSION_NAME_CHARS = 30
+# Replies whose checkpoints are kept for back/undo; the first reply is always kept for reset.
+CHECKPOINT_HISTORY_TURNS = int(os.getenv("CHECKPOINT_HISTORY_TURNS", "20"))
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "true").lower() == "true"
+# With a queue file, parsing and graph steps run on worker.py processes and turns return 202.
+QUEUE_MODE = bool(JOB_QUEUE_PATH)
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "900"))
+
+
+def workflow_graph():
+    """The compiled workflow. Imported on first use so the app starts serving /health without it."""
+    from src.graph import get_graph
+    return get_graph()
+
+
+def warm_up():
+    """Import the workflow, build upstream clients and open their connections off the request path."""
+    start_time = time.time()
+    workflow_graph()
+    warm_up_clients()
+    logger.info(f"Warm-up finished in {time.time() - start_time:.2f} seconds")
+
+
+async def sweep_idle_sessions():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        evicted = await asyncio.to_thread(evict_idle_sessions)
+        if evicted:
+            logger.info(f"Evicted {evicted} idle sessions")
+        if QUEUE_MODE:
+            purged = await asyncio.to_thread(get_job_queue().purge)
+            if purged:
+                logger.info(f"Purged {purged} finished jobs")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweeper = asyncio.create_task(sweep_idle_sessions())
+    MEMORY_DIAGNOSTICS_SAMPLER.start()
+    if WARM_UP_ON_STARTUP:
+        asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    sweeper.cancel()
+    turns = list(background_turns)
+    for task in turns:
+        task.cancel()
+    # Let cancelled turns record their failure before the executor shuts down.
+    await asyncio.gather(*turns, return_exceptions=True)
+    await asyncio.to_thread(PARSE_TRANSPORT.close)
+    await asyncio.to_thread(MEMORY_DIAGNOSTICS_SAMPLER.stop)
+
+
+app = FastAPI(title="Work Scope Generator", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,10 +124,207 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1000"))
+try:
+    from brotli_asgi import BrotliMiddleware
+
+    app.add_middleware(BrotliMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_BYTES, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_BYTES)
+
 load_dotenv()
 
+input_flights = AsyncSingleFlight("session-input")
+session_runs = SessionRunGuard()
+idempotency_cache = IdempotencyCache()
+
+
+@app.exception_handler(IdempotencyKeyReusedError)
+async def idempotency_key_reused(request: Request, e: IdempotencyKeyReusedError):
+    return JSONResponse(status_code=422, content={"detail": str(e)})
+
+
+def release_session_resources(session_id: str, session: dict):
+    session_runs.forget(session_id)
+    idempotency_cache.forget(session_id)
+    release_document_cache(session.get("context_cache"))
+    drop_session_index(session["thread_id"])
+    TOKEN_USAGE.forget(session["thread_id"])
+    workflow_graph().checkpointer.delete_thread(session["thread_id"])
+
+
+register_session_eviction_hook(release_session_resources)
+
+
+async def prepare_document_context(session_id: str, thread_id: str, file_content: str) -> dict:
+    """
+    Large documents get a retrieval index so each stage sees only its top-k
+    passages; smaller ones are sent whole, from a provider cache when possible.
+    Returns the context cache handles for the graph state.
+    """
+    if should_index(file_content):
+        # In queue mode the workers index the document where the stages run.
+        if not QUEUE_MODE:
+            await asyncio.to_thread(build_session_index, thread_id, file_content)
+        return {}
+
+    context_cache = await asyncio.to_thread(create_document_cache, file_content)
+    update_session(session_id, {"context_cache": context_cache})
+    return context_cache
+
+async def extend_document_context(session_id: str, thread_id: str, file_content: str, addition: str) -> dict:
+    """
+    Context for a document that grew by `addition`. An existing retrieval
+    index gets only the new chunks. A provider cache holds a fixed prefix,
+    so it is replaced by one for the merged document.
+    """
+    await asyncio.to_thread(release_document_cache, get_session(session_id).get("context_cache"))
+    if should_index(file_content):
+        if not QUEUE_MODE:
+            await asyncio.to_thread(extend_session_index, thread_id, file_content, addition)
+        context_cache = {}
+    else:
+        context_cache = await asyncio.to_thread(create_document_cache, file_content)
+    update_session(session_id, {"context_cache": context_cache})
+    return context_cache
+
+async def await_job(job_id: str) -> Any:
+    """Wait for a worker to finish a queued job and return its result; a failed job raises its error."""
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    delay = 0.05
+    while True:
+        job = await asyncio.to_thread(get_job_queue().get, job_id)
+        if job["status"] == "succeeded":
+            return job["result"]
+        if job["status"] == "failed":
+            raise HTTPException(status_code=job["error"]["status_code"], detail=job["error"]["detail"])
+        if time.monotonic() > deadline:
+            raise HTTPException(status_code=504, detail=f"Job {job_id} did not finish within {JOB_TIMEOUT_SECONDS:.0f} seconds.")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+async def execute_parse(session_id: str, file_bytes: bytes, filename: str) -> str:
+    if not QUEUE_MODE:
+        return await asyncio.to_thread(parse_file, file_bytes, filename)
+    job_id = await asyncio.to_thread(
+        get_job_queue().submit, "parse", {"filename": filename}, session_id, file_bytes
+    )
+    return (await await_job(job_id))["file_content"]
+
+
+async def execute_graph(session_id: str, thread_id: str, graph_input: dict) -> dict:
+    """
+    Run the workflow on a thread from its latest checkpoint. In queue mode a
+    worker runs it from a copy of the state, and the fields it changed are
+    written back here as one checkpoint, so history and ETags work the same.
+    """
+    graph = workflow_graph()
+    session = get_session(session_id)
+    concise = bool(session.get("concise"))
+    config = {"configurable": {"thread_id": thread_id, "concise": concise}}
+    await asyncio.to_thread(refresh_document_cache, session.get("context_cache"))
+    if not QUEUE_MODE:
+        return await asyncio.to_thread(graph.invoke, graph_input, config=config)
+
+    from src.graph import END
+    from src.checkpoints import latest_checkpoint_id, load_state_values
+
+    state = None
+    if latest_checkpoint_id(graph.checkpointer, thread_id):
+        state = await asyncio.to_thread(load_state_values, graph, thread_id)
+    job_id = await asyncio.to_thread(
+        get_job_queue().submit,
+        "graph",
+        # Queued turns are polled for rather than awaited, so they take the limiter's batch lane.
+        {"thread_id": thread_id, "state": state, "input": graph_input, "concise": concise, "priority": "batch"},
+        session_id,
+    )
+    outcome = await await_job(job_id)
+
+    TOKEN_USAGE.absorb(thread_id, outcome["usage"])
+    update = {**graph_input, **outcome["changes"]}
+    await asyncio.to_thread(graph.update_state, config, update, as_node="pause_node")
+    result_values = {**(state or {}), **update}
+    if outcome["completed"]:
+        result_values[END] = True
+    return result_values
+
+
+background_turns: set = set()
+
+
+async def dispatch_turn(session_id: str, run: Callable[[], Awaitable["SimplifiedSessionResponse"]]):
+    """
+    Run a turn and return its response. In queue mode, start it in the
+    background instead and return 202 with a job to poll at /jobs/{id}.
+    """
+    if not QUEUE_MODE:
+        return await run()
+
+    job_id = await asyncio.to_thread(get_job_queue().create_turn, session_id)
+    task = asyncio.create_task(track_turn(job_id, run))
+    background_turns.add(task)
+    task.add_done_callback(background_turns.discard)
+    status_url = f"/jobs/{job_id}"
+    return JSONResponse(
+        status_code=202,
+        content=JobAccepted(job_id=job_id, status="running", status_url=status_url).model_dump(),
+        headers={"Location": status_url},
+    )
+
+
+async def track_turn(job_id: str, run: Callable[[], Awaitable["SimplifiedSessionResponse"]]):
+    queue = get_job_queue()
+    try:
+        response = await run()
+    except asyncio.CancelledError:
+        await asyncio.to_thread(
+            queue.fail, job_id, {"status_code": 503, "detail": "The server stopped before the turn finished."}
+        )
+        raise
+    except HTTPException as e:
+        await asyncio.to_thread(queue.fail, job_id, {"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        logger.error(f"Turn {job_id} failed: {e}", exc_info=True)
+        await asyncio.to_thread(queue.fail, job_id, {"status_code": 500, "detail": str(e)})
+    else:
+        await asyncio.to_thread(queue.complete, job_id, response.model_dump())
+
+
+def record_turn(
+    session_id: str,
+    thread_id: str,
+    user_input: str | None,
+    current_stage: str,
+    response_data: dict,
+    action: str | None = None,
+    restores_seq: int | None = None,
+):
+    """
+    Append the user's input (if any) and the reply to the session history,
+    then prune the thread's checkpoints to those time travel can still reach.
+    """
+    from src.checkpoints import latest_checkpoint_id, prune_thread
+
+    checkpointer = workflow_graph().checkpointer
+    if user_input is not None:
+        append_session_message(session_id, "user", user_input)
+    append_session_message(
+        session_id,
+        "assistant",
+        response_data["content"],
+        current_stage,
+        response_data["follow_up_question"],
+        checkpoint_id=latest_checkpoint_id(checkpointer, thread_id),
+        action=action,
+        restores_seq=restores_seq,
+    )
+    prune_thread(checkpointer, thread_id, retained_checkpoint_ids(session_id, CHECKPOINT_HISTORY_TURNS))
+
 class SimplifiedSessionResponse(BaseModel):
     content: str
     current_stage: str
@@ -40,133 +334,780 @@ class UserInputRequest(BaseModel):
     user_input: str
 
 
+class SessionSummary(BaseModel):
+    id: str
+    name: str
+    type: str
+    file_name: str | None = None
+    current_stage: str | None = None
+    message_count: int
+    updated_at: float
+
+
+class SessionStateResponse(SessionSummary):
+    workflow_active: bool
+    workflow_completed: bool
+    concise: bool = False
+    checkpoint_id: str | None = None
+    content: str | None = None
+    follow_up_question: str | None = None
+
+
+class StageContentResponse(BaseModel):
+    stage: str
+    content: str
+    follow_up_question: str | None = None
+    checkpoint_id: str
+
+
+class ForkRequest(BaseModel):
+    checkpoint_id: str | None = None
+    new_session_id: str | None = None
+
+
+class ForkResponse(BaseModel):
+    session_id: str
+    forked_from: str
+    checkpoint_id: str
+    content: str
+    current_stage: str
+    follow_up_question: str | None = None
+
+
+class SessionListResponse(BaseModel):
+    sessions: list[SessionSummary]
+    total: int
+    next_offset: int | None = None
+
+
+class SessionMessage(BaseModel):
+    seq: int
+    role: str
+    content: str
+    current_stage: str | None = None
+    follow_up_question: str | None = None
+    checkpoint_id: str | None = None
+    created_at: float
+
+
+class SessionMessagesResponse(BaseModel):
+    messages: list[SessionMessage]
+    next_after: int
+    has_more: bool
+
+
+class TokenCounters(BaseModel):
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    estimated_input_tokens: int = 0
+    trimmed_tokens: int = 0
+    trimmed_calls: int = 0
+    over_budget_calls: int = 0
+    early_stopped_calls: int = 0
+    truncated_calls: int = 0
+    coalesced_calls: int = 0
+
+
+class SessionUsageResponse(BaseModel):
+    session_id: str
+    stages: dict[str, TokenCounters]
+    totals: TokenCounters
+
+
 class InitialInputRequest(BaseModel):
     initial_input: str
 
 
-@app.post("/sessions/{session_id}/upload", response_model=SimplifiedSessionResponse)
+class JobAccepted(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+
+class JobError(BaseModel):
+    status_code: int
+    detail: Any
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    session_id: str | None = None
+    status: str
+    result: SimplifiedSessionResponse | None = None
+    error: JobError | None = None
+    created_at: float
+    updated_at: float
+
+
+QUEUED_RESPONSES = {202: {"model": JobAccepted, "description": "Queued (JOB_QUEUE_PATH set); poll status_url."}}
+
+
+@app.post("/sessions/{session_id}/upload", response_model=SimplifiedSessionResponse, responses=QUEUED_RESPONSES)
 @async_time_logger
-async def upload_file(session_id: str, file: UploadFile = File(...)):
+async def upload_file(
+    session_id: str,
+    file: UploadFile = File(...),
+    idempotency_key: str | None = Header(default=None),
+):
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
 
-    session = get_session(session_id)
-    if session.get("workflow_active"):
-        raise HTTPException(
-            status_code=409,
-            detail=f"Session with ID '{session_id}' already has an active workflow."
-        )
+    # Read now: the upload is closed once the response is sent, before a queued turn runs.
+    file_bytes = await file.read()
+    return await idempotency_cache.run(
+        session_id,
+        idempotency_key,
+        lambda: dispatch_turn(session_id, lambda: run_upload(session_id, file.filename, file_bytes)),
+        request_fingerprint("upload", file.filename, file_bytes),
+    )
 
-    try:
-        file_bytes = await file.read()
-        file_content = parse_file(file_bytes, file.filename)
 
-        initial_state = {"file_content": file_content, "LLM": LLM}
-        config = {"configurable": {"thread_id": session["thread_id"]}}
+async def run_upload(session_id: str, filename: str, file_bytes: bytes) -> SimplifiedSessionResponse:
+    async with session_runs.exclusive(session_id):
+        session = get_session(session_id)
+        if session.get("workflow_active"):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Session with ID '{session_id}' already has an active workflow. "
+                       f"Add more files with POST /sessions/{session_id}/documents."
+            )
 
-        graph.invoke(initial_state, config=config)
-        result_state = graph.get_state(config=config)
+        try:
+            file_content = await execute_parse(session_id, file_bytes, filename)
 
-        current_stage = result_state.values.get("current_stage", "initial_summary")
-        response_data = get_stage_content(result_state.values, current_stage)
+            context_cache = await prepare_document_context(session_id, session["thread_id"], file_content)
+            warm_start = await asyncio.to_thread(NEAR_DUPLICATES.warm_start, file_content, session_id)
+            initial_state = {"file_content": file_content, "context_cache": context_cache, "warm_start": warm_start}
 
-        session_updates = {
-            "workflow_active": True,
-            "current_state": result_state,
-        }
-        update_session(session_id, session_updates)
+            result_values = await execute_graph(session_id, session["thread_id"], initial_state)
 
-        return SimplifiedSessionResponse(
-            content=response_data["content"],
-            current_stage=current_stage,
-            follow_up_question=response_data["follow_up_question"]
-        )
-    except Exception as e:
-        logger.error(f"PDF processing failed for session {session_id}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+            current_stage = result_values.get("current_stage", "initial_summary")
+            response_data = get_stage_content(result_values, current_stage)
+
+            session_updates = {
+                "workflow_active": True,
+                "current_stage": current_stage,
+                "name": os.path.splitext(filename)[0],
+                "type": "folder",
+                "file_name": filename,
+            }
+            update_session(session_id, session_updates)
+            record_turn(session_id, session["thread_id"], None, current_stage, response_data)
 
-@app.post("/sessions/{session_id}/initial-input", response_model=SimplifiedSessionResponse)
+            return SimplifiedSessionResponse(
+                content=response_data["content"],
+                current_stage=current_stage,
+                follow_up_question=response_data["follow_up_question"]
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"PDF processing failed for session {session_id}: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+
+@app.post("/sessions/{session_id}/initial-input", response_model=SimplifiedSessionResponse, responses=QUEUED_RESPONSES)
 @async_time_logger
-async def process_initial_input(session_id: str, request: InitialInputRequest):
-    session = get_session(session_id)
-    if session.get("workflow_active"):
-        raise HTTPException(
-            status_code=409,
-            detail=f"Session with ID '{session_id}' already has an active workflow."
-        )
+async def process_initial_input(
+    session_id: str,
+    request: InitialInputRequest,
+    idempotency_key: str | None = Header(default=None),
+):
+    return await idempotency_cache.run(
+        session_id,
+        idempotency_key,
+        lambda: dispatch_turn(session_id, lambda: run_initial_input(session_id, request)),
+        request_fingerprint("initial-input", request.initial_input),
+    )
 
-    try:
-        file_content = request.initial_input.strip()
-        if not file_content:
-            raise HTTPException(status_code=400, detail="Input cannot be empty.")
 
-        initial_state = {"file_content": file_content, "LLM": LLM}
-        config = {"configurable": {"thread_id": session["thread_id"]}}
+async def run_initial_input(session_id: str, request: InitialInputRequest) -> SimplifiedSessionResponse:
+    async with session_runs.exclusive(session_id):
+        session = get_session(session_id)
+        if session.get("workflow_active"):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Session with ID '{session_id}' already has an active workflow."
+            )
 
-        graph.invoke(initial_state, config=config)
-        result_state = graph.get_state(config=config)
+        try:
+            file_content = request.initial_input.strip()
+            if not file_content:
+                raise HTTPException(status_code=400, detail="Input cannot be empty.")
 
-        current_stage = result_state.values.get("current_stage", "initial_summary")
-        response_data = get_stage_content(result_state.values, current_stage)
+            context_cache = await prepare_document_context(session_id, session["thread_id"], file_content)
+            warm_start = await asyncio.to_thread(NEAR_DUPLICATES.warm_start, file_content, session_id)
+            initial_state = {"file_content": file_content, "context_cache": context_cache, "warm_start": warm_start}
 
-        session_updates = {
-            "workflow_active": True,
-            "current_state": result_state,
-        }
-        update_session(session_id, session_updates)
+            result_values = await execute_graph(session_id, session["thread_id"], initial_state)
+
+            current_stage = result_values.get("current_stage", "initial_summary")
+            response_data = get_stage_content(result_values, current_stage)
+
+            session_updates = {
+                "workflow_active": True,
+                "current_stage": current_stage,
+                "name": file_content[:SESSION_NAME_CHARS] + ("..." if len(file_content) > SESSION_NAME_CHARS else ""),
+                "type": "chat",
+            }
+            update_session(session_id, session_updates)
+            record_turn(session_id, session["thread_id"], request.initial_input, current_stage, response_data)
+
+            return SimplifiedSessionResponse(
+                content=response_data["content"],
+                current_stage=current_stage,
+                follow_up_question=response_data["follow_up_question"],
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Initial input processing failed for session {session_id}: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Error processing initial input: {str(e)}")
+
+
+@app.post("/sessions/{session_id}/documents", response_model=SimplifiedSessionResponse, responses=QUEUED_RESPONSES)
+@async_time_logger
+async def add_documents(
+    session_id: str,
+    files: list[UploadFile] = File(...),
+    idempotency_key: str | None = Header(default=None),
+):
+    """
+    Append documents, such as RFP addenda, to an active session. They are
+    parsed concurrently and added to the end of the session's document, and
+    the stages they affect are revised in place (see merge_documents_node).
+    """
+    if any(not file.filename.endswith('.pdf') for file in files):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported")
+
+    uploads = [(file.filename, await file.read()) for file in files]
+    return await idempotency_cache.run(
+        session_id,
+        idempotency_key,
+        lambda: dispatch_turn(session_id, lambda: run_add_documents(session_id, uploads)),
+        request_fingerprint("documents", *(part for upload in uploads for part in upload)),
+    )
 
-        return SimplifiedSessionResponse(
-            content=response_data["content"],
-            current_stage=current_stage,
-            follow_up_question=response_data["follow_up_question"],
-        )
-    except Exception as e:
-        logger.error(f"Initial input processing failed for session {session_id}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error processing initial input: {str(e)}")
 
+async def run_add_documents(session_id: str, uploads: list) -> SimplifiedSessionResponse:
+    from src.checkpoints import load_state_values
 
-@app.post("/sessions/{session_id}/input", response_model=SimplifiedSessionResponse)
+    async with session_runs.exclusive(session_id):
+        session = get_session(session_id)
+        if not session.get("workflow_active"):
+            raise HTTPException(status_code=400, detail="No active workflow for this session. Upload the main document first.")
+
+        try:
+            parsed = await asyncio.gather(*(execute_parse(session_id, data, filename) for filename, data in uploads))
+            names = [filename for filename, _ in uploads]
+            addition = document_addition(list(zip(names, parsed)))
+
+            state = await asyncio.to_thread(load_state_values, workflow_graph(), session["thread_id"])
+            if state.get("awaiting_description"):
+                # Only a greeting or too little text so far; the documents replace it.
+                file_content, addition = addition.strip(), addition.strip()
+            else:
+                file_content = state.get("file_content", "") + addition
+
+            context_cache = await extend_document_context(session_id, session["thread_id"], file_content, addition)
+            graph_input = {
+                "file_content": file_content,
+                "context_cache": context_cache,
+                "document_update": {"names": names, "text": addition},
+            }
+            result_values = await execute_graph(session_id, session["thread_id"], graph_input)
+
+            current_stage = result_values.get("current_stage", "initial_summary")
+            response_data = get_stage_content(result_values, current_stage)
+
+            update_session(session_id, {"current_stage": current_stage})
+            record_turn(session_id, session["thread_id"], f"Added documents: {', '.join(names)}", current_stage, response_data)
+
+            return SimplifiedSessionResponse(
+                content=response_data["content"],
+                current_stage=current_stage,
+                follow_up_question=response_data["follow_up_question"],
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Adding documents failed for session {session_id}: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Error adding documents: {str(e)}")
+
+
+@app.post("/sessions/{session_id}/input", response_model=SimplifiedSessionResponse, responses=QUEUED_RESPONSES)
 @async_time_logger
-async def process_user_input(session_id: str, request: UserInputRequest):
+async def process_user_input(
+    session_id: str,
+    request: UserInputRequest,
+    idempotency_key: str | None = Header(default=None),
+):
     session = get_session(session_id)
     if not session.get("workflow_active"):
         raise HTTPException(status_code=400, detail="No active workflow for this session")
 
     user_input = request.user_input.strip()
+    fingerprint = request_fingerprint("input", user_input)
     if user_input.lower() == "reset":
-        raise HTTPException(status_code=501, detail="Reset functionality not implemented.")
+        return await idempotency_cache.run(
+            session_id, idempotency_key, lambda: run_restore(session_id, "reset"), fingerprint
+        )
+
+    # Duplicate submissions of the same input share one graph run and response.
+    input_hash = hashlib.sha256(user_input.encode("utf-8")).hexdigest()
+    return await idempotency_cache.run(
+        session_id,
+        idempotency_key,
+        lambda: dispatch_turn(
+            session_id,
+            lambda: input_flights.do(
+                (session_id, input_hash),
+                lambda: run_user_input(session_id, session["thread_id"], user_input),
+            ),
+        ),
+        fingerprint,
+    )
+
+
+async def run_user_input(session_id: str, thread_id: str, user_input: str) -> SimplifiedSessionResponse:
+    try:
+        async with session_runs.exclusive(session_id, supersede=True):
+            return await advance_workflow(session_id, thread_id, user_input)
+    except SupersededError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-    config = {"configurable": {"thread_id": session["thread_id"]}}
+
+async def turn_input(session_id: str, thread_id: str, user_input: str) -> dict:
+    """
+    Graph input for a chat turn. While triage waits for a project description,
+    input that will pass triage becomes the document, so it is prepared like
+    an initial input: context cache or retrieval index, and warm start.
+    """
+    from src.checkpoints import load_state_values
+
+    graph_input = {"user_input": user_input}
+    if get_session(session_id).get("current_stage") != "initial_summary":
+        return graph_input
+    state = await asyncio.to_thread(load_state_values, workflow_graph(), thread_id)
+    if not state.get("awaiting_description") or triage_reply(user_input):
+        return graph_input
+
+    graph_input["context_cache"] = await prepare_document_context(session_id, thread_id, user_input)
+    graph_input["warm_start"] = await asyncio.to_thread(NEAR_DUPLICATES.warm_start, user_input, session_id)
+    return graph_input
+
+
+async def advance_workflow(session_id: str, thread_id: str, user_input: str) -> SimplifiedSessionResponse:
+    from src.graph import END
 
     try:
-        final_run_state = graph.invoke({"user_input": user_input, "LLM": LLM}, config=config)
-        workflow_completed = END in final_run_state
-        result_state = graph.get_state(config=config)
+        graph_input = await turn_input(session_id, thread_id, user_input)
+        result_values = await execute_graph(session_id, thread_id, graph_input)
+        workflow_completed = END in result_values
 
-        current_stage = result_state.values.get("current_stage", "scope_of_work" if workflow_completed else "initial_summary")
-        response_data = get_stage_content(result_state.values, current_stage)
+        current_stage = result_values.get("current_stage", "scope_of_work" if workflow_completed else "initial_summary")
+        response_data = get_stage_content(result_values, current_stage)
 
         session_updates = {
-            "current_state": result_state,
+            "current_stage": current_stage,
             "workflow_completed": workflow_completed
         }
         update_session(session_id, session_updates)
+        record_turn(session_id, thread_id, user_input, current_stage, response_data)
+        if current_stage == "scope_of_work":
+            # Every earlier stage is approved now, so later near-duplicate uploads can start from them.
+            await asyncio.to_thread(
+                NEAR_DUPLICATES.add,
+                session_id,
+                result_values.get("file_content", ""),
+                approved_outputs(result_values),
+                get_session(session_id).get("name"),
+            )
 
         return SimplifiedSessionResponse(
             content=response_data["content"],
             current_stage=current_stage,
             follow_up_question=response_data["follow_up_question"],
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception(f"Error processing input for session {session_id}")
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+class BackRequest(BaseModel):
+    stage: str
+
+
+class ResponseModeRequest(BaseModel):
+    concise: bool
+
+
+class ResponseModeResponse(BaseModel):
+    session_id: str
+    concise: bool
+
+
+@app.post("/sessions/{session_id}/reset", response_model=SimplifiedSessionResponse, tags=["History"])
+@async_time_logger
+async def reset_session(session_id: str, idempotency_key: str | None = Header(default=None)):
+    """
+    Return to the session's first reply without regenerating anything. That
+    is usually the initial summary. When the first message was answered by
+    triage (a greeting or too-short input), it is that reply, and the session
+    again waits for a project description.
+    """
+    return await idempotency_cache.run(
+        session_id, idempotency_key, lambda: run_restore(session_id, "reset"), request_fingerprint("reset")
+    )
+
+
+@app.post("/sessions/{session_id}/back", response_model=SimplifiedSessionResponse, tags=["History"])
+@async_time_logger
+async def back_to_stage(session_id: str, request: BackRequest, idempotency_key: str | None = Header(default=None)):
+    """Return to the latest reply at an earlier stage without regenerating anything."""
+    if request.stage not in STAGE_CONTENT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown stage '{request.stage}'.")
+    return await idempotency_cache.run(
+        session_id,
+        idempotency_key,
+        lambda: run_restore(session_id, "back", request.stage),
+        request_fingerprint("back", request.stage),
+    )
+
+
+@app.post("/sessions/{session_id}/undo", response_model=SimplifiedSessionResponse, tags=["History"])
+@async_time_logger
+async def undo_last_turn(session_id: str, idempotency_key: str | None = Header(default=None)):
+    """Return to the state before the last reply. Repeated undos keep stepping back."""
+    return await idempotency_cache.run(
+        session_id, idempotency_key, lambda: run_restore(session_id, "undo"), request_fingerprint("undo")
+    )
+
+
+async def run_restore(session_id: str, action: str, stage: str | None = None) -> SimplifiedSessionResponse:
+    from src.checkpoints import restore_checkpoint, load_state_values
+
+    async with session_runs.exclusive(session_id):
+        session = get_session(session_id)
+        if not session.get("workflow_active"):
+            raise HTTPException(status_code=400, detail="No active workflow for this session")
+
+        target = restore_target(session_id, action, stage)
+        if target is None:
+            detail = f"No earlier reply at stage '{stage}'." if action == "back" else "Nothing to undo."
+            raise HTTPException(status_code=409, detail=detail)
+
+        graph = workflow_graph()
+        try:
+            restore_checkpoint(graph.checkpointer, session["thread_id"], target["checkpoint_id"])
+        except KeyError:
+            raise HTTPException(
+                status_code=410,
+                detail=f"The state of reply {target['seq']} is older than the retained history.",
+            )
+
+        values = await asyncio.to_thread(load_state_values, graph, session["thread_id"])
+        current_stage = values.get("current_stage") or target["current_stage"]
+        response_data = get_stage_content(values, current_stage)
+
+        update_session(session_id, {"current_stage": current_stage, "workflow_completed": False})
+        user_input = f"back to {stage}" if action == "back" else action
+        record_turn(
+            session_id, session["thread_id"], user_input, current_stage, response_data,
+            action=action, restores_seq=target["seq"],
+        )
+        logger.info(f"Session {session_id}: {user_input} restored reply {target['seq']}")
+
+        return SimplifiedSessionResponse(
+            content=response_data["content"],
+            current_stage=current_stage,
+            follow_up_question=response_data["follow_up_question"],
+        )
+
+
+@app.post("/sessions/{session_id}/fork", response_model=ForkResponse, status_code=201, tags=["History"])
+@async_time_logger
+async def fork_session(session_id: str, request: ForkRequest | None = None):
+    """
+    Branch a new session from a checkpoint of this one (the latest by default;
+    assistant messages carry the checkpoint_id of each reply). The fork shares
+    the parent's checkpoint data, document cache and retrieval index and makes
+    no LLM calls.
+    """
+    from src.checkpoints import fork_thread, latest_checkpoint_id, load_state_values
+
+    request = request or ForkRequest()
+    source = require_session(session_id)
+    new_session_id = request.new_session_id or str(uuid.uuid4())
+    if peek_session(new_session_id) is not None:
+        raise HTTPException(status_code=409, detail=f"Session with ID '{new_session_id}' already exists.")
+
+    async with session_runs.exclusive(new_session_id):
+        target = get_session(new_session_id)
+        graph = workflow_graph()
+        try:
+            checkpoint_id = fork_thread(
+                graph.checkpointer, source["thread_id"], target["thread_id"], request.checkpoint_id
+            )
+        except KeyError as e:
+            evict_session(new_session_id)
+            raise HTTPException(status_code=404, detail=str(e))
+
+        values = await asyncio.to_thread(load_state_values, graph, target["thread_id"])
+        current_stage = values.get("current_stage") or "initial_summary"
+        response_data = get_stage_content(values, current_stage)
+
+        context_cache = values.get("context_cache") or {}
+        retain_document_cache(context_cache)
+        share_session_index(source["thread_id"], target["thread_id"])
+        is_latest = checkpoint_id == latest_checkpoint_id(graph.checkpointer, source["thread_id"])
+        update_session(new_session_id, {
+            "workflow_active": True,
+            "workflow_completed": source["workflow_completed"] and is_latest,
+            "current_stage": current_stage,
+            "context_cache": context_cache,
+            "name": f"{source['name'] or 'Session'} (fork)",
+            "type": source["type"],
+            "file_name": source["file_name"],
+            "concise": source["concise"],
+        })
+        share_session_history(session_id, new_session_id, checkpoint_id)
+        # Earlier replies in the shared history stay reachable by back/undo in the fork.
+        for earlier_id in retained_checkpoint_ids(new_session_id, CHECKPOINT_HISTORY_TURNS):
+            if earlier_id != checkpoint_id:
+                try:
+                    fork_thread(graph.checkpointer, source["thread_id"], target["thread_id"], earlier_id)
+                except KeyError:
+                    pass
+
+    logger.info(f"Forked session {session_id} at checkpoint {checkpoint_id} into {new_session_id}")
+    return ForkResponse(
+        session_id=new_session_id,
+        forked_from=session_id,
+        checkpoint_id=checkpoint_id,
+        content=response_data["content"],
+        current_stage=current_stage,
+        follow_up_question=response_data["follow_up_question"],
+    )
+
+
+@app.put("/sessions/{session_id}/response-mode", response_model=ResponseModeResponse, tags=["History"])
+def set_response_mode(session_id: str, request: ResponseModeRequest):
+    """
+    Switch the session between full and concise replies. Concise mode asks
+    for shorter answers under tighter output caps; it applies from the next
+    generated reply and is kept by forks.
+    """
+    require_session(session_id)
+    update_session(session_id, {"concise": request.concise})
+    logger.info(f"Session {session_id}: concise replies {'on' if request.concise else 'off'}")
+    return ResponseModeResponse(session_id=session_id, concise=request.concise)
+
+
+@app.get("/sessions", response_model=SessionListResponse, tags=["History"])
+def get_sessions(offset: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100)):
+    """Sessions with history, most recently updated first."""
+    page, total = list_sessions(offset, limit)
+    next_offset = offset + len(page)
+    return SessionListResponse(
+        sessions=page,
+        total=total,
+        next_offset=next_offset if next_offset < total else None,
+    )
+
+
+def state_etag(*parts) -> str:
+    return 'W/"' + ":".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def require_session(session_id: str) -> dict:
+    session = peek_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found.")
+    return session
+
+
+@app.get("/sessions/{session_id}", response_model=SessionStateResponse, tags=["History"])
+async def get_session_state(
+    session_id: str,
+    response: Response,
+    if_none_match: str | None = Header(default=None),
+):
+    """
+    Current stage and its content. The ETag follows the latest checkpoint, so
+    polling with If-None-Match returns 304 without loading any state.
+    """
+    from src.checkpoints import latest_checkpoint_id, load_state_values
+
+    session = require_session(session_id)
+    graph = workflow_graph()
+    checkpoint_id = latest_checkpoint_id(graph.checkpointer, session["thread_id"])
+    etag = state_etag(checkpoint_id or "empty", session["message_count"], int(session["concise"]))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    content = follow_up_question = None
+    if checkpoint_id and session["current_stage"]:
+        values = await asyncio.to_thread(load_state_values, graph, session["thread_id"], checkpoint_id)
+        stage_content = get_stage_content(values, session["current_stage"])
+        content, follow_up_question = stage_content["content"], stage_content["follow_up_question"]
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return SessionStateResponse(
+        **session,
+        checkpoint_id=checkpoint_id,
+        content=content,
+        follow_up_question=follow_up_question,
+    )
+
+
+@app.get("/sessions/{session_id}/stages/{stage}", response_model=StageContentResponse, tags=["History"])
+async def get_stage_output(
+    session_id: str,
+    stage: str,
+    response: Response,
+    if_none_match: str | None = Header(default=None),
+):
+    """
+    Latest output of one stage. The ETag is the version of that stage's state
+    field, so it stays valid while other stages change.
+    """
+    from src.checkpoints import latest_checkpoint_id, channel_version, load_state_values
+
+    if stage not in STAGE_CONTENT_KEYS:
+        raise HTTPException(status_code=404, detail=f"Unknown stage '{stage}'.")
+    session = require_session(session_id)
+    graph = workflow_graph()
+    content_key = STAGE_CONTENT_KEYS[stage]
+
+    checkpoint_id = latest_checkpoint_id(graph.checkpointer, session["thread_id"])
+    version = checkpoint_id and channel_version(graph.checkpointer, session["thread_id"], checkpoint_id, content_key)
+    if not version:
+        raise HTTPException(status_code=404, detail=f"Stage '{stage}' has no content yet.")
+
+    # The follow-up question belongs to the current stage only, so it is part of the validator there.
+    is_current = session["current_stage"] == stage
+    etag = state_etag(content_key, version, checkpoint_id if is_current else "")
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    values = await asyncio.to_thread(load_state_values, graph, session["thread_id"], checkpoint_id)
+    if not values.get(content_key):
+        raise HTTPException(status_code=404, detail=f"Stage '{stage}' has no content yet.")
+    stage_content = get_stage_content(values, stage)
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return StageContentResponse(
+        stage=stage,
+        content=stage_content["content"],
+        follow_up_question=stage_content["follow_up_question"] if is_current else None,
+        checkpoint_id=checkpoint_id,
+    )
+
+
+@app.get("/sessions/{session_id}/messages", response_model=SessionMessagesResponse, tags=["History"])
+def get_messages(session_id: str, after: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=200)):
+    """Messages with `seq` greater than `after`, oldest first. Pass the last seen seq to fetch only new ones."""
+    result = get_session_messages(session_id, after, limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found.")
+    messages, latest_seq = result
+    next_after = messages[-1]["seq"] if messages else min(after, latest_seq)
+    return SessionMessagesResponse(messages=messages, next_after=next_after, has_more=next_after < latest_seq)
+
+
+@app.get("/sessions/{session_id}/usage", response_model=SessionUsageResponse, tags=["Metrics"])
+def get_session_usage(session_id: str):
+    """Input and output tokens this session has used, per stage. Trimmed tokens were cut to fit a stage budget."""
+    session = require_session(session_id)
+    return SessionUsageResponse(session_id=session_id, **TOKEN_USAGE.thread_report(session["thread_id"]))
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse, tags=["Jobs"])
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=30)):
+    """
+    Status of a queued turn, with its response once it has succeeded. With
+    `wait`, the request is held until the turn finishes or `wait` seconds pass.
+    """
+    job = None
+    if QUEUE_MODE:
+        deadline = time.monotonic() + wait
+        while True:
+            job = await asyncio.to_thread(get_job_queue().get, job_id)
+            if job is None or job["status"] in FINISHED_STATUSES or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.1)
+    if job is None or job["kind"] != "turn":
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return JobStatusResponse(
+        job_id=job["id"],
+        session_id=job["session_id"],
+        status=job["status"],
+        result=job["result"],
+        error=job["error"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+    )
+
+
+@app.delete("/sessions/{session_id}", status_code=204, tags=["History"])
+async def delete_session(session_id: str):
+    NEAR_DUPLICATES.remove(session_id)
+    await asyncio.to_thread(evict_session, session_id)
+    return Response(status_code=204)
+
+
 @app.get("/", tags=["Health"])
 @app.get("/health", tags=["Health"])
 def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics/llm", tags=["Metrics"])
+def llm_metrics():
+    """Per-stage latency by model and token usage against budgets, plus rate limiter, resilience and pool state."""
+    return {
+        **STAGE_LATENCY.report(),
+        "tokens": TOKEN_USAGE.report(),
+        "rate_limiter": LLM_RATE_LIMITER.snapshot(),
+        "llm_resilience": LLM_RESILIENCE.snapshot(),
+        "parse_resilience": PARSE_RESILIENCE.snapshot(),
+        "parse_transport": PARSE_TRANSPORT.snapshot(),
+        "job_queue": get_job_queue().stats() if QUEUE_MODE else None,
+        "near_duplicates": NEAR_DUPLICATES.snapshot(),
+    }
+
+
+@app.get("/debug/memory", tags=["Metrics"])
+async def memory_diagnostics(
+    top: int = Query(20, ge=1, le=200),
+    sessions: int = Query(20, ge=0, le=1000),
+    x_diagnostics_token: str | None = Header(default=None),
+):
+    """
+    Process RSS, top tracemalloc allocation sites and their growth since the
+    previous snapshot (MEMORY_DIAGNOSTICS=trace or sample), and approximate
+    bytes per session and per checkpoint thread. Requires MEMORY_DIAGNOSTICS_TOKEN.
+    """
+    if not authorized(x_diagnostics_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    checkpointer = workflow_graph().checkpointer
+    return await asyncio.to_thread(memory_report, checkpointer, top, sessions)
+
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
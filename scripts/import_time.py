@@ -0,0 +1,106 @@
+"""
+Measure cold import time of the app with `python -X importtime`.
+
+    python scripts/import_time.py                       # median of 5 runs, top 15 modules
+    python scripts/import_time.py --record benchmarks/import_time.jsonl
+    python scripts/import_time.py --max-ms 800          # exit 1 when slower (CI gate)
+
+Each run is a fresh interpreter, so results reflect a cold start apart from
+the OS file cache. Recorded lines carry the git revision so numbers can be
+compared across releases.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_once(module: str) -> Dict[str, int]:
+    """Return {module: cumulative microseconds} for one cold import."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        name = name.strip()
+        cumulative[name] = max(cumulative.get(name, 0), int(cumulative_us))
+    return cumulative
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--tags", "--always", "--dirty"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(module: str, runs: int) -> Tuple[float, List[Tuple[str, float]]]:
+    samples = [run_once(module) for _ in range(runs)]
+    total_ms = statistics.median(sample[module] for sample in samples) / 1000
+    names = set().union(*samples)
+    per_module = {
+        name: statistics.median(sample.get(name, 0) for sample in samples) / 1000 for name in names
+    }
+    ranked = sorted(
+        ((name, ms) for name, ms in per_module.items() if name != module),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return total_ms, ranked
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--record", help="Append the result as a JSON line to this file.")
+    parser.add_argument("--max-ms", type=float, help="Exit non-zero when the median exceeds this.")
+    args = parser.parse_args()
+
+    total_ms, ranked = measure(args.module, args.runs)
+
+    print(f"import {args.module}: {total_ms:.1f} ms (median of {args.runs} runs)")
+    for name, ms in ranked[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    if args.record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.record)), exist_ok=True)
+        with open(args.record, "a") as f:
+            f.write(json.dumps({
+                "revision": git_revision(),
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": sys.version.split()[0],
+                "module": args.module,
+                "runs": args.runs,
+                "median_ms": round(total_ms, 1),
+                "top": [[name, round(ms, 1)] for name, ms in ranked[:args.top]],
+            }) + "\n")
+
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"import {args.module} took {total_ms:.1f} ms, above the {args.max_ms:.1f} ms budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
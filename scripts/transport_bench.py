@@ -0,0 +1,132 @@
+"""
+Compare per-call latency of a fresh HTTP client per call (what LlamaParse does
+by default) with the shared, pre-warmed pool in utils/transport.py, against a
+local HTTPS stand-in for the upstream API.
+
+    python scripts/transport_bench.py                  # 200 calls each
+    python scripts/transport_bench.py --calls 500 --delay-ms 5
+
+The stand-in uses a throwaway self-signed certificate made with the `openssl`
+CLI and answers every request after `--delay-ms`, so the difference between
+the two runs is connection setup: TCP connect plus the TLS handshake.
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.transport import UpstreamTransport  # noqa: E402
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay = 0.0
+
+    def _reply(self):
+        time.sleep(self.delay)
+        body = b'{"status": "SUCCESS"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    do_GET = do_HEAD = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(cert_dir: str, delay: float) -> ThreadingHTTPServer:
+    cert, key = os.path.join(cert_dir, "cert.pem"), os.path.join(cert_dir, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+        check=True,
+        capture_output=True,
+    )
+    StandInHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def per_call_client(url: str, calls: int) -> List[float]:
+    import httpx
+
+    async def one() -> float:
+        start = time.perf_counter()
+        async with httpx.AsyncClient(verify=False) as client:
+            (await client.get(url)).raise_for_status()
+        return time.perf_counter() - start
+
+    return [asyncio.run(one()) for _ in range(calls)]
+
+
+def shared_pool(url: str, calls: int, transport: UpstreamTransport) -> List[float]:
+    async def one() -> float:
+        start = time.perf_counter()
+        (await transport.client.get(url)).raise_for_status()
+        return time.perf_counter() - start
+
+    return [transport.run(one()) for _ in range(calls)]
+
+
+def summarize(label: str, samples: List[float]):
+    ms = sorted(sample * 1000 for sample in samples)
+    print(
+        f"{label:<22} p50 {statistics.median(ms):7.2f} ms   "
+        f"p95 {ms[min(len(ms) - 1, int(0.95 * len(ms)))]:7.2f} ms   mean {statistics.mean(ms):7.2f} ms"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Server-side delay per request.")
+    parser.add_argument("--connections", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cert_dir:
+        server = start_server(cert_dir, args.delay_ms / 1000)
+        url = f"https://127.0.0.1:{server.server_address[1]}/api/parsing/job/bench"
+
+        fresh = per_call_client(url, args.calls)
+
+        transport = UpstreamTransport(
+            name="bench", max_connections=args.connections, warm_urls=[url], verify=False
+        )
+        transport.warm()
+        pooled = shared_pool(url, args.calls, transport)
+        stats = transport.snapshot()
+        transport.close()
+        server.shutdown()
+
+    print(f"{args.calls} calls against a local TLS stand-in ({args.delay_ms:g} ms server delay)")
+    summarize("client per call", fresh)
+    summarize("shared warmed pool", pooled)
+    print(
+        f"pool: {stats['requests']} requests ({stats['warmed']} warm-up), "
+        f"{stats['connections_opened']} connections opened, reuse rate {stats['reuse_rate']:.2%}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.base.id import uuid6
+from langgraph.checkpoint.memory import InMemorySaver
+
+logger = logging.getLogger(__name__)
+
+
+def thread_config(thread_id: str, checkpoint_id: str | None = None) -> Dict[str, Any]:
+    configurable = {"thread_id": thread_id, "checkpoint_ns": ""}
+    if checkpoint_id:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"configurable": configurable}
+
+
+def latest_checkpoint_id(checkpointer: BaseCheckpointSaver, thread_id: str) -> str | None:
+    """
+    Id of the newest checkpoint on a thread, or None before the first run.
+    For the in-memory saver this reads the storage keys directly, so no
+    checkpoint is deserialized.
+    """
+    if isinstance(checkpointer, InMemorySaver):
+        checkpoints = checkpointer.storage.get(thread_id, {}).get("")
+        return max(checkpoints.keys()) if checkpoints else None
+    saved = checkpointer.get_tuple(thread_config(thread_id))
+    return saved.config["configurable"]["checkpoint_id"] if saved else None
+
+
+def channel_version(checkpointer: BaseCheckpointSaver, thread_id: str, checkpoint_id: str, channel: str) -> str | None:
+    """
+    Version of one state field at a checkpoint. It changes only when that
+    field is written, so it makes a stable validator for per-field content.
+    """
+    if isinstance(checkpointer, InMemorySaver):
+        saved = checkpointer.storage.get(thread_id, {}).get("", {}).get(checkpoint_id)
+        if saved is None:
+            return None
+        versions = checkpointer.serde.loads_typed(saved[0])["channel_versions"]
+    else:
+        saved = checkpointer.get_tuple(thread_config(thread_id, checkpoint_id))
+        if saved is None:
+            return None
+        versions = saved.checkpoint["channel_versions"]
+    version = versions.get(channel)
+    return str(version) if version is not None else None
+
+
+def load_state_values(graph, thread_id: str, checkpoint_id: str | None = None) -> Dict[str, Any]:
+    """State values at a checkpoint (the latest one by default)."""
+    return graph.get_state(thread_config(thread_id, checkpoint_id)).values
+
+
+def fork_thread(
+    checkpointer: BaseCheckpointSaver,
+    source_thread_id: str,
+    target_thread_id: str,
+    checkpoint_id: str | None = None,
+) -> str:
+    """
+    Start `target_thread_id` at a checkpoint of `source_thread_id` (the latest
+    by default) and return that checkpoint's id. The fork starts with no
+    history of its own.
+
+    With the in-memory saver, the target's entries point to the source's
+    serialized checkpoint and channel blobs. Nothing is copied, so large
+    fields such as file_content are stored once however many forks exist.
+    Blobs are immutable bytes, so new writes on either thread add entries
+    without touching what the other one reads. Raises KeyError for an
+    unknown checkpoint.
+    """
+    checkpoint_id = checkpoint_id or latest_checkpoint_id(checkpointer, source_thread_id)
+
+    if isinstance(checkpointer, InMemorySaver):
+        saved = checkpointer.storage.get(source_thread_id, {}).get("", {}).get(checkpoint_id) if checkpoint_id else None
+        if saved is None:
+            raise KeyError(f"Checkpoint '{checkpoint_id}' not found on thread '{source_thread_id}'.")
+        serialized_checkpoint, serialized_metadata, _ = saved
+        versions = checkpointer.serde.loads_typed(serialized_checkpoint)["channel_versions"]
+        for channel, version in versions.items():
+            blob = checkpointer.blobs.get((source_thread_id, "", channel, version))
+            if blob is not None:
+                checkpointer.blobs[(target_thread_id, "", channel, version)] = blob
+        pending_writes = checkpointer.writes.get((source_thread_id, "", checkpoint_id))
+        if pending_writes:
+            checkpointer.writes[(target_thread_id, "", checkpoint_id)] = dict(pending_writes)
+        checkpointer.storage[target_thread_id][""][checkpoint_id] = (serialized_checkpoint, serialized_metadata, None)
+        return checkpoint_id
+
+    saved = checkpointer.get_tuple(thread_config(source_thread_id, checkpoint_id)) if checkpoint_id else None
+    if saved is None:
+        raise KeyError(f"Checkpoint '{checkpoint_id}' not found on thread '{source_thread_id}'.")
+    checkpointer.put(
+        thread_config(target_thread_id),
+        saved.checkpoint,
+        saved.metadata,
+        saved.checkpoint["channel_versions"],
+    )
+    return saved.config["configurable"]["checkpoint_id"]
+
+
+def restore_checkpoint(checkpointer: BaseCheckpointSaver, thread_id: str, checkpoint_id: str) -> str:
+    """
+    Make an earlier checkpoint of a thread current again and return the id of
+    the new head. Nothing is replayed: the head is a fresh checkpoint whose
+    channel versions point at the earlier one's blobs, so the cost does not
+    depend on the size of the state. Later checkpoints stay in history, so a
+    restore can itself be undone. Raises KeyError for an unknown checkpoint.
+    """
+    head_id = latest_checkpoint_id(checkpointer, thread_id)
+    new_id = str(uuid6())
+    ts = datetime.now(timezone.utc).isoformat()
+
+    if isinstance(checkpointer, InMemorySaver):
+        saved = checkpointer.storage.get(thread_id, {}).get("", {}).get(checkpoint_id)
+        if saved is None:
+            raise KeyError(f"Checkpoint '{checkpoint_id}' not found on thread '{thread_id}'.")
+        serialized_checkpoint, serialized_metadata, _ = saved
+        checkpoint = {**checkpointer.serde.loads_typed(serialized_checkpoint), "id": new_id, "ts": ts}
+        metadata = {**checkpointer.serde.loads_typed(serialized_metadata), "source": "update", "restored_from": checkpoint_id}
+        checkpointer.storage[thread_id][""][new_id] = (
+            checkpointer.serde.dumps_typed(checkpoint),
+            checkpointer.serde.dumps_typed(metadata),
+            head_id,
+        )
+        return new_id
+
+    saved = checkpointer.get_tuple(thread_config(thread_id, checkpoint_id))
+    if saved is None:
+        raise KeyError(f"Checkpoint '{checkpoint_id}' not found on thread '{thread_id}'.")
+    checkpointer.put(
+        thread_config(thread_id, head_id),
+        {**saved.checkpoint, "id": new_id, "ts": ts},
+        {**saved.metadata, "source": "update", "restored_from": checkpoint_id},
+        saved.checkpoint["channel_versions"],
+    )
+    return new_id
+
+
+def prune_thread(checkpointer: BaseCheckpointSaver, thread_id: str, keep: Iterable[str]) -> int:
+    """
+    Delete every checkpoint of a thread except `keep` and the latest one,
+    along with their pending writes and any blobs no remaining checkpoint
+    uses. Returns the number of checkpoints deleted. Only the in-memory saver
+    is pruned; persistent savers manage their own retention.
+    """
+    if not isinstance(checkpointer, InMemorySaver):
+        return 0
+    checkpoints = checkpointer.storage.get(thread_id, {}).get("")
+    if not checkpoints:
+        return 0
+
+    keep = set(keep) | {max(checkpoints.keys())}
+    stale = [checkpoint_id for checkpoint_id in checkpoints if checkpoint_id not in keep]
+    if not stale:
+        return 0
+
+    def versions(checkpoint_id: str) -> set:
+        return set(checkpointer.serde.loads_typed(checkpoints[checkpoint_id][0])["channel_versions"].items())
+
+    candidates = set().union(*(versions(checkpoint_id) for checkpoint_id in stale))
+    live = set().union(*(versions(checkpoint_id) for checkpoint_id in checkpoints if checkpoint_id in keep))
+    for checkpoint_id in stale:
+        del checkpoints[checkpoint_id]
+        checkpointer.writes.pop((thread_id, "", checkpoint_id), None)
+    for channel, version in candidates - live:
+        checkpointer.blobs.pop((thread_id, "", channel, version), None)
+    return len(stale)
+
+
+def checkpoint_footprint(checkpointer: BaseCheckpointSaver) -> Dict[str, Dict[str, int]]:
+    """
+    Checkpoint count and serialized bytes (checkpoints, pending writes and
+    channel blobs) per thread. Forked threads reference their parent's
+    bytes, which then count toward both. Only the in-memory saver is
+    measured; other savers return an empty map.
+    """
+    if not isinstance(checkpointer, InMemorySaver):
+        return {}
+    footprint: Dict[str, Dict[str, int]] = {}
+
+    def entry(thread_id: str) -> Dict[str, int]:
+        return footprint.setdefault(thread_id, {"checkpoints": 0, "bytes": 0})
+
+    for thread_id, namespaces in list(checkpointer.storage.items()):
+        for checkpoints in list(namespaces.values()):
+            for serialized_checkpoint, serialized_metadata, _ in list(checkpoints.values()):
+                thread = entry(thread_id)
+                thread["checkpoints"] += 1
+                thread["bytes"] += len(serialized_checkpoint[1]) + len(serialized_metadata[1])
+    for (thread_id, _, _), writes in list(checkpointer.writes.items()):
+        entry(thread_id)["bytes"] += sum(len(write[2][1]) for write in list(writes.values()))
+    for (thread_id, _, _, _), (_, blob) in list(checkpointer.blobs.items()):
+        entry(thread_id)["bytes"] += len(blob)
+    return footprint
@@ -1,28 +1,35 @@
 
 from pydantic import BaseModel
+from threading import Lock
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, END
 from src.nodes import *
+from utils.schemas import Feature, TechStack, ScopeOfWork, FinalAdjustment
 
 class State(BaseModel):
     file_content: str = ""
     initial_summary: str = ""
     overview: str = ""
-    extracted_features: str = ""
-    tech_stack: str = ""
-    scope_of_work: str = ""
-    final_adjustment_response: str = "" 
+    extracted_features: list[Feature] | str = []
+    tech_stack: TechStack | str = {}
+    scope_of_work: ScopeOfWork | str = ""
+    final_adjustment_response: FinalAdjustment | str = "" 
     current_stage: str = "initial_summary"
     user_input: str = ""
     user_feedback: str = ""
     routing_decision: str | None = None
     follow_up_questions: str = "" 
-    LLM: object = None 
+    priority: str = "interactive"
+    context_cache: dict = {}
+    warm_start: dict = {}
+    awaiting_description: bool = False
+    document_update: dict = {}
 
 memory = MemorySaver()
 workflow = StateGraph(State)
 
 workflow.add_node("load_initial_state", load_initial_state_node)
+workflow.add_node("triage", triage_node)
 workflow.add_node("generate_initial_summary", generate_initial_summary_node)
 workflow.add_node("generate_overview", generate_overview_node)
 workflow.add_node("feature_extraction", feature_extraction_node)
@@ -32,24 +39,36 @@ workflow.add_node("router", router_node)
 workflow.add_node("regenerate_current", regenerate_current)
 workflow.add_node("pause_node", pause_node)
 workflow.add_node("handle_final_adjustments", handle_final_adjustments_node) 
+workflow.add_node("merge_documents", merge_documents_node)
 workflow.set_entry_point("load_initial_state")
 
 workflow.add_conditional_edges(
     "load_initial_state",
-    lambda state: "router" if getattr(state, "user_input", None) else "generate_initial_summary",
+    should_continue_from_load,
     {
-        "generate_initial_summary": "generate_initial_summary",
+        "merge_documents": "merge_documents",
+        "triage": "triage",
         "router": "router"
     }
 )
 
+workflow.add_conditional_edges(
+    "triage",
+    should_continue_from_triage,
+    {
+        "generate_initial_summary": "generate_initial_summary",
+        "pause_node": "pause_node"
+    }
+)
+
 workflow.add_edge("generate_initial_summary", "pause_node")
 workflow.add_edge("generate_overview", "pause_node")
 workflow.add_edge("feature_extraction", "pause_node")
 workflow.add_edge("generate_tech_stack", "pause_node")
 workflow.add_edge("generate_scope_of_work", "pause_node")
 workflow.add_edge("regenerate_current", "pause_node")
-workflow.add_edge("handle_final_adjustments", "pause_node") 
+workflow.add_edge("handle_final_adjustments", "pause_node")
+workflow.add_edge("merge_documents", "pause_node") 
 
 workflow.add_conditional_edges(
     "router",
@@ -66,4 +85,14 @@ workflow.add_conditional_edges(
     }
 )
 
-graph = workflow.compile(checkpointer=memory)
\ No newline at end of file
+_graph = None
+_graph_lock = Lock()
+
+
+def get_graph():
+    """Compile the workflow on first use; later calls return the same graph."""
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = workflow.compile(checkpointer=memory)
+        return _graph
\ No newline at end of file
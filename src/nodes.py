@@ -2,7 +2,6 @@
 
 import logging
 import json
-from langchain.prompts import ChatPromptTemplate
 from langgraph.graph import END
 from utils.prompts import (
     summary_prompt,
@@ -12,26 +11,131 @@ from utils.prompts import (
     work_scope_prompt,
     router_prompt,
     final_adjustment_prompt,  
+    feature_edit_prompt,
+    tech_stack_edit_prompt,
 )
-from utils.helper import time_logger
+from utils.helper import time_logger, invoke_llm, format_features, render_stage_value, strip_json_fences
+from utils.retrieval import document_for_stage
+from utils.near_duplicates import WARM_START_FIELDS, paragraph_stages
+from utils.triage import triage_reply
+from utils.schemas import ScopeOfWork, FinalAdjustment, Feature, TECH_STACK, artifact_json
+from pydantic import ValidationError
 import re
 
 logger = logging.getLogger(__name__)
 
 
+def config_thread_id(config) -> str | None:
+    return (config or {}).get("configurable", {}).get("thread_id")
+
+
+def config_concise(config) -> bool:
+    return bool((config or {}).get("configurable", {}).get("concise"))
+
+
+def stage_document(state, config, stage: str, feedback: str = "") -> str:
+    """The document text for a stage: retrieved passages for indexed sessions, else the full document."""
+    return document_for_stage(config_thread_id(config), state.file_content, stage, feedback)
+
+
+# Approved fields each stage's prompt depends on; a carried-over draft is valid only while they match.
+WARM_START_UPSTREAM = {
+    "initial_summary": [],
+    "overview": ["initial_summary"],
+    "features": ["overview"],
+    "tech_stack": ["overview", "extracted_features"],
+}
+
+
+def warm_start_update(state, stage: str, label: str) -> dict | None:
+    """
+    State update that carries over this stage's output from the earlier
+    session of a near-duplicate document, or None when the stage has to be
+    generated: the user gave feedback, the stage's part of the document
+    changed, or an upstream approval differs from the earlier session's.
+    """
+    warm_start = state.warm_start
+    if not warm_start or state.user_feedback or stage in warm_start["stale_stages"]:
+        return None
+    outputs = warm_start["outputs"]
+    if any(artifact_json(getattr(state, field)) != artifact_json(outputs.get(field)) for field in WARM_START_UPSTREAM[stage]):
+        return None
+    field = WARM_START_FIELDS[stage]
+    if not outputs.get(field) or str(outputs[field]).startswith("Error:"):
+        return None
+
+    logger.info(f"Carrying over {stage} from session {warm_start['source']} instead of calling the LLM")
+    return {
+        field: outputs[field],
+        "follow_up_questions": (
+            f"This document is {warm_start['similarity']:.0%} similar to one scoped earlier, so this {label} "
+            f"is carried over from it. Does it still fit, or what should change?"
+        ),
+        "current_stage": stage,
+        "user_feedback": "",
+    }
+
+
 @time_logger
 def load_initial_state_node(state):
     logger.info("Loading initial state.")
-    return state
+    # No update: returning the whole state would rewrite every field and
+    # bump its checkpoint version even though nothing changed.
+    return {}
 
 
 @time_logger
-def generate_initial_summary_node(state):
+def triage_node(state):
+    """
+    Answer greetings and empty or too-short input locally, before any model
+    call. After a canned reply the session waits for a description, and the
+    user's next input is triaged the same way and becomes the document.
+    """
+    text = state.user_input.strip() if state.awaiting_description else state.file_content
+    reply = triage_reply(text)
+    if reply:
+        logger.info(f"Triage answered input locally: '{text[:50]}'")
+        return {
+            "initial_summary": reply["summary"],
+            "follow_up_questions": reply["follow_up_question"],
+            "current_stage": "initial_summary",
+            "user_input": "",
+            "user_feedback": "",
+            "awaiting_description": True,
+        }
+    if state.awaiting_description:
+        return {"file_content": text, "user_input": "", "awaiting_description": False}
+    return {}
+
+
+def should_continue_from_load(state):
+    if state.document_update:
+        return "merge_documents"
+    if state.user_input and not state.awaiting_description:
+        return "router"
+    return "triage"
+
+
+def should_continue_from_triage(state):
+    return "pause_node" if state.awaiting_description else "generate_initial_summary"
+
+
+@time_logger
+def generate_initial_summary_node(state, config=None):
     user_feedback = getattr(state, 'user_feedback', "")
+    carried_over = warm_start_update(state, "initial_summary", "summary")
+    if carried_over:
+        return carried_over
     try:
-        prompt = ChatPromptTemplate.from_template(summary_prompt.template)
-        chain = prompt | state.LLM
-        output = chain.invoke({"parsed_data": state.file_content, "user_feedback": user_feedback})
+        output = invoke_llm(
+            summary_prompt.template,
+            {"parsed_data": stage_document(state, config, "initial_summary"), "user_feedback": user_feedback},
+            "initial_summary",
+            priority=state.priority,
+            thread_id=config_thread_id(config),
+            concise=config_concise(config),
+            context_cache=state.context_cache,
+        )
 
         raw = output.content.strip()
         logger.info(f"Raw LLM output for initial summary: {raw}")
@@ -68,7 +172,7 @@ def generate_initial_summary_node(state):
         }
     
 @time_logger
-def router_node(state):
+def router_node(state, config=None):
     user_input = getattr(state, 'user_input', "").strip()
     current_stage = getattr(state, 'current_stage', 'initial_summary')
     
@@ -78,13 +182,14 @@ def router_node(state):
         return {**state_updates, "routing_decision": "PAUSE", "current_stage": current_stage}
 
     try:
-        prompt = ChatPromptTemplate.from_template(router_prompt.template)
-        chain = prompt | state.LLM
-        
-        output = chain.invoke({
-            "user_input": user_input,
-            "current_stage": current_stage
-        })
+        output = invoke_llm(
+            router_prompt.template,
+            {"user_input": user_input, "current_stage": current_stage},
+            "router",
+            priority=state.priority,
+            thread_id=config_thread_id(config),
+            expect_json=False,
+        )
 
         raw_output = output.content.strip()
         logger.info(f"Router raw output:\n{raw_output}")
@@ -119,16 +224,25 @@ def router_node(state):
 
 
 @time_logger
-def generate_overview_node(state):
+def generate_overview_node(state, config=None):
     user_feedback = getattr(state, 'user_feedback', "")
+    carried_over = warm_start_update(state, "overview", "overview")
+    if carried_over:
+        return carried_over
     try:
-        prompt = ChatPromptTemplate.from_template(overview_prompt.template)
-        chain = prompt | state.LLM
-        output = chain.invoke({
-            "parsed_data": state.file_content,
-            "approved_summary": state.initial_summary,
-            "user_feedback": user_feedback
-        })
+        output = invoke_llm(
+            overview_prompt.template,
+            {
+                "parsed_data": stage_document(state, config, "overview", user_feedback),
+                "approved_summary": state.initial_summary,
+                "user_feedback": user_feedback
+            },
+            "overview",
+            priority=state.priority,
+            thread_id=config_thread_id(config),
+            concise=config_concise(config),
+            context_cache=state.context_cache,
+        )
 
         raw = output.content.strip()
         logger.info(f"Raw LLM output for overview: {raw}")
@@ -166,16 +280,25 @@ def generate_overview_node(state):
 
 
 @time_logger
-def feature_extraction_node(state):
+def feature_extraction_node(state, config=None):
     user_feedback = getattr(state, 'user_feedback', "")
+    carried_over = warm_start_update(state, "features", "feature list")
+    if carried_over:
+        return carried_over
     try:
-        prompt = ChatPromptTemplate.from_template(feature_suggestion_prompt.template)
-        chain = prompt | state.LLM
-        output = chain.invoke({
-            "parsed_data": state.file_content,
-            "approved_summary": state.overview,
-            "user_feedback": user_feedback
-        })
+        output = invoke_llm(
+            feature_suggestion_prompt.template,
+            {
+                "parsed_data": stage_document(state, config, "features", user_feedback),
+                "approved_summary": state.overview,
+                "user_feedback": user_feedback
+            },
+            "features",
+            priority=state.priority,
+            thread_id=config_thread_id(config),
+            concise=config_concise(config),
+            context_cache=state.context_cache,
+        )
 
         raw = output.content.strip()
         logger.info(f"Raw LLM output for features: {raw}")
@@ -193,18 +316,18 @@ def feature_extraction_node(state):
             logger.info(f"Follow-up questions for features: {follow_up}")
 
             if isinstance(features, list):
-                features_str = "\n".join(f"- {f.strip()}" for f in features)
+                features = [Feature.model_validate(f) for f in features]
             else:
-                features_str = str(features).strip()
+                features = str(features).strip()
 
             return {
-                "extracted_features": features_str,
+                "extracted_features": features,
                 "follow_up_questions": str(follow_up).strip(),  
                 "current_stage": "features",
                 "user_feedback": ""
             }
 
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, ValidationError):
             logger.warning(f"Feature extraction output not JSON:\n{raw}")
             return {
                 "extracted_features": raw,
@@ -223,18 +346,26 @@ def feature_extraction_node(state):
         }
 
 @time_logger
-def generate_tech_stack_node(state):
+def generate_tech_stack_node(state, config=None):
     user_feedback = getattr(state, 'user_feedback', "")
+    carried_over = warm_start_update(state, "tech_stack", "tech stack")
+    if carried_over:
+        return carried_over
     try:
-        prompt = ChatPromptTemplate.from_template(tech_stack_prompt.template)
-        chain = prompt | state.LLM
-
-        output = chain.invoke({
-            "parsed_data": state.file_content,
-            "approved_summary": state.overview,
-            "approved_features": state.extracted_features,
-            "user_feedback": user_feedback
-        })
+        output = invoke_llm(
+            tech_stack_prompt.template,
+            {
+                "parsed_data": stage_document(state, config, "tech_stack", user_feedback),
+                "approved_summary": state.overview,
+                "approved_features": format_features(state.extracted_features),
+                "user_feedback": user_feedback
+            },
+            "tech_stack",
+            priority=state.priority,
+            thread_id=config_thread_id(config),
+            concise=config_concise(config),
+            context_cache=state.context_cache,
+        )
 
         raw = output.content.strip()
         logger.info(f"Raw LLM output for tech stack: {raw}")
@@ -246,19 +377,19 @@ def generate_tech_stack_node(state):
             result = json.loads(raw)
             logger.info(f"Parsed tech stack result: {result}")
 
-            tech_stack_dict = result.get("tech_stack", {})
+            tech_stack_dict = TECH_STACK.validate_python(result.get("tech_stack") or {})
             follow_up_questions = result.get("follow_up_question", "")  
             
             logger.info(f"Follow-up questions for tech stack: {follow_up_questions}")
 
             return {
-                "tech_stack": json.dumps(tech_stack_dict, indent=2),
+                "tech_stack": tech_stack_dict,
                 "follow_up_questions": str(follow_up_questions).strip(),
                 "current_stage": "tech_stack",
                 "user_feedback": ""
             }
 
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, ValidationError):
             logger.warning("Tech stack output not JSON:\n%s", raw)
             return {
                 "tech_stack": raw,
@@ -278,24 +409,24 @@ def generate_tech_stack_node(state):
     
 
 @time_logger
-def generate_scope_of_work_node(state):
+def generate_scope_of_work_node(state, config=None):
     user_feedback = getattr(state, 'user_feedback', "")
     try:
-        prompt = ChatPromptTemplate.from_template(work_scope_prompt.template)
-        chain = prompt | state.LLM
-        
-        try:
-            tech_stack_for_prompt = json.loads(state.tech_stack)
-        except (json.JSONDecodeError, TypeError):
-            tech_stack_for_prompt = state.tech_stack
-
-        output = chain.invoke({
-            "parsed_data": state.file_content,
-            "approved_summary": state.overview,
-            "approved_features": state.extracted_features,
-            "approved_tech_stack": tech_stack_for_prompt,
-            "user_feedback": user_feedback
-        })
+        output = invoke_llm(
+            work_scope_prompt.template,
+            {
+                "parsed_data": stage_document(state, config, "scope_of_work", user_feedback),
+                "approved_summary": state.overview,
+                "approved_features": format_features(state.extracted_features),
+                "approved_tech_stack": render_stage_value(state.tech_stack),
+                "user_feedback": user_feedback
+            },
+            "scope_of_work",
+            priority=state.priority,
+            thread_id=config_thread_id(config),
+            concise=config_concise(config),
+            context_cache=state.context_cache,
+        )
 
         raw = output.content.strip()
         logger.info(f"Raw LLM output for scope of work: {raw}")
@@ -306,16 +437,16 @@ def generate_scope_of_work_node(state):
         try:
             result = json.loads(raw)
             logger.info(f"Parsed scope of work result: {result}")
-            follow_up = result.get("follow_up_question", "")
-            
+            follow_up = result.pop("follow_up_question", "")
+
             return {
-                "scope_of_work": json.dumps(result, indent=2),
+                "scope_of_work": ScopeOfWork.from_output(result),
                 "follow_up_questions": str(follow_up).strip(),
                 "current_stage": "scope_of_work",
                 "user_feedback": ""
             }
 
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, ValidationError, AttributeError):
             logger.warning(f"Scope of work output not JSON:\n{raw}")
             return {
                 "scope_of_work": raw,
@@ -333,8 +464,133 @@ def generate_scope_of_work_node(state):
             "user_feedback": ""
         }
 
+def apply_feature_operations(features: list, operations: list) -> list:
+    """Apply update/add/remove operations (1-based indices) to a feature list."""
+    updated = list(features)
+    removed = set()
+    added = []
+    for op in operations:
+        action = str(op.get("action", "")).lower()
+        index = op.get("index")
+        position = index - 1 if isinstance(index, int) else None
+        valid_position = position is not None and 0 <= position < len(updated)
+
+        if action == "update" and valid_position and op.get("feature"):
+            updated[position] = Feature.model_validate(op["feature"])
+        elif action == "remove" and valid_position:
+            removed.add(position)
+        elif action == "add" and op.get("feature"):
+            added.append(Feature.model_validate(op["feature"]))
+        else:
+            logger.warning(f"Ignoring invalid feature operation: {op}")
+
+    return [f for i, f in enumerate(updated) if i not in removed] + added
+
+
+def apply_tech_stack_operations(tech_stack: dict, operations: list) -> dict:
+    """Apply set/add/remove operations to a category -> technologies map."""
+    updated = {category: list(items) for category, items in tech_stack.items()}
+    for op in operations:
+        action = str(op.get("action", "")).lower()
+        category = op.get("category")
+        technologies = [str(t).strip() for t in op.get("technologies") or []]
+        if not category:
+            logger.warning(f"Ignoring tech stack operation without category: {op}")
+            continue
+
+        if action == "set":
+            updated[category] = technologies
+        elif action == "add":
+            current = updated.setdefault(category, [])
+            current.extend(t for t in technologies if t not in current)
+        elif action == "remove":
+            if not technologies:
+                updated.pop(category, None)
+            elif category in updated:
+                updated[category] = [t for t in updated[category] if t not in technologies]
+        else:
+            logger.warning(f"Ignoring invalid tech stack operation: {op}")
+    return updated
+
+
+@time_logger
+def edit_features_node(state, config=None):
+    """
+    Applies targeted feedback to the existing feature list with a small,
+    document-free LLM call, falling back to full extraction when needed.
+    """
+    user_feedback = getattr(state, 'user_feedback', "")
+    try:
+        output = invoke_llm(
+            feature_edit_prompt.template,
+            {
+                "current_features": "\n".join(f"{i}. {f}" for i, f in enumerate(state.extracted_features, 1)),
+                "user_feedback": user_feedback
+            },
+            "features_edit",
+            priority=state.priority,
+            thread_id=config_thread_id(config),
+        )
+        raw = strip_json_fences(output.content)
+        logger.info(f"Raw LLM output for feature edit: {raw}")
+        result = json.loads(raw)
+
+        if result.get("regenerate"):
+            logger.info("Feature edit requested full regeneration.")
+            return feature_extraction_node(state, config)
+
+        return {
+            "extracted_features": apply_feature_operations(state.extracted_features, result.get("operations", [])),
+            "follow_up_questions": str(result.get("follow_up_question", "")).strip(),
+            "current_stage": "features",
+            "user_feedback": ""
+        }
+
+    except Exception as e:
+        logger.warning(f"Incremental feature edit failed, regenerating the stage: {e}")
+        return feature_extraction_node(state, config)
+
+
 @time_logger
-def handle_final_adjustments_node(state):
+def edit_tech_stack_node(state, config=None):
+    """
+    Applies targeted feedback to the existing tech stack with a small,
+    document-free LLM call, falling back to full generation when needed.
+    """
+    user_feedback = getattr(state, 'user_feedback', "")
+    try:
+        output = invoke_llm(
+            tech_stack_edit_prompt.template,
+            {
+                "current_tech_stack": json.dumps(state.tech_stack, indent=2),
+                "user_feedback": user_feedback
+            },
+            "tech_stack_edit",
+            priority=state.priority,
+            thread_id=config_thread_id(config),
+        )
+        raw = strip_json_fences(output.content)
+        logger.info(f"Raw LLM output for tech stack edit: {raw}")
+        result = json.loads(raw)
+
+        if result.get("regenerate"):
+            logger.info("Tech stack edit requested full regeneration.")
+            return generate_tech_stack_node(state, config)
+
+        return {
+            "tech_stack": apply_tech_stack_operations(state.tech_stack, result.get("operations", [])),
+            "follow_up_questions": str(result.get("follow_up_question", "")).strip(),
+            "current_stage": "tech_stack",
+            "user_feedback": ""
+        }
+
+    except Exception as e:
+        logger.warning(f"Incremental tech stack edit failed, regenerating the stage: {e}")
+        return generate_tech_stack_node(state, config)
+
+
+@time_logger
+def handle_final_adjustments_node(state, config=None):
     """
     Handles final, small adjustments to the scope of work without regenerating the whole document.
     """
@@ -351,13 +607,14 @@ def handle_final_adjustments_node(state):
         }
 
     try:
-        prompt = ChatPromptTemplate.from_template(final_adjustment_prompt.template)
-        chain = prompt | state.LLM
-        
-        output = chain.invoke({
-            "scope_of_work": scope_of_work,
-            "user_feedback": user_feedback
-        })
+        output = invoke_llm(
+            final_adjustment_prompt.template,
+            {"scope_of_work": render_stage_value(scope_of_work), "user_feedback": user_feedback},
+            "final_review",
+            priority=state.priority,
+            thread_id=config_thread_id(config),
+            concise=config_concise(config),
+        )
 
         raw = output.content.strip()
         logger.info(f"Raw LLM output for final adjustment: {raw}")
@@ -369,20 +626,26 @@ def handle_final_adjustments_node(state):
             result = json.loads(raw)
             logger.info(f"Parsed final adjustment result: {result}")
             follow_up = result.pop("follow_up_question", "Does that look correct? Any other adjustments?")
-            
-            adjustment_response = json.dumps(result, indent=2)
-            
-            logger.info(f"Storing main content for final adjustment: {adjustment_response}")
+            adjustment = FinalAdjustment.model_validate(result)
+
+            logger.info(f"Storing main content for final adjustment: {adjustment}")
             logger.info(f"Storing new follow-up question: {follow_up}")
 
-            return {
-                "final_adjustment_response": adjustment_response,
+            update = {
+                "final_adjustment_response": adjustment,
                 "current_stage": "final_review",
                 "user_feedback": "",
                 "follow_up_questions": str(follow_up).strip() 
             }
-
-        except json.JSONDecodeError:
+            # Apply the changed field to the stored scope of work, so later adjustments build on it.
+            if isinstance(scope_of_work, ScopeOfWork) and adjustment.updated_component:
+                try:
+                    update["scope_of_work"] = scope_of_work.with_updates(adjustment.updated_component)
+                except ValidationError as e:
+                    logger.warning(f"Adjusted component doesn't fit the scope of work, keeping it unchanged: {e}")
+            return update
+
+        except (json.JSONDecodeError, ValidationError, AttributeError):
             logger.warning(f"Final adjustment output not JSON, treating as raw text:\n{raw}")
             return {
                 "final_adjustment_response": raw,
@@ -399,26 +662,93 @@ def handle_final_adjustments_node(state):
             "follow_up_questions": "Sorry, I ran into an error. Could you rephrase your request?"
         }
     
+# Document-bearing stages in workflow order, with the node that generates each.
+STAGE_GENERATORS = {
+    "initial_summary": generate_initial_summary_node,
+    "overview": generate_overview_node,
+    "features": feature_extraction_node,
+    "tech_stack": generate_tech_stack_node,
+    "scope_of_work": generate_scope_of_work_node
+}
+
+STAGE_LABELS = {
+    "initial_summary": "summary",
+    "overview": "overview",
+    "features": "feature list",
+    "tech_stack": "tech stack",
+    "scope_of_work": "scope of work",
+}
+
+
 @time_logger
-def regenerate_current(state):
+def regenerate_current(state, config=None):
     current_stage = getattr(state, 'current_stage', 'initial_summary')
-    stage_map = {
-        "initial_summary": generate_initial_summary_node,
-        "overview": generate_overview_node,
-        "features": feature_extraction_node,
-        "tech_stack": generate_tech_stack_node,
-        "scope_of_work": generate_scope_of_work_node
-    }
-    handler = stage_map.get(current_stage)
+    # Structured stages with existing items are edited in place instead of regenerated.
+    if current_stage == "features" and isinstance(state.extracted_features, list) and state.extracted_features:
+        handler = edit_features_node
+    elif current_stage == "tech_stack" and isinstance(state.tech_stack, dict) and state.tech_stack:
+        handler = edit_tech_stack_node
+    else:
+        handler = STAGE_GENERATORS.get(current_stage)
     logger.info(f"Regenerating stage '{current_stage}' with feedback.")
-    return handler(state) if handler else state
+    return handler(state, config) if handler else state
+
+
+def stages_touched(text: str) -> list:
+    """Stages whose retrieval query terms appear in a paragraph of `text`, in workflow order."""
+    mask = 0
+    for paragraph_mask in paragraph_stages(text).values():
+        mask |= paragraph_mask
+    return [stage for bit, stage in enumerate(WARM_START_FIELDS) if mask & (1 << bit)]
+
+
+@time_logger
+def merge_documents_node(state, config=None):
+    """
+    Bring the generated stages up to date after documents were appended to
+    the session. The stage under review is always revised. Earlier, already
+    approved stages are revised only from the first one the new text touches,
+    since every later stage builds on it; stages before that are kept. Each
+    revision sees the merged document and the updates made before it.
+    """
+    names = ", ".join(state.document_update.get("names", []))
+    reset = {"document_update": {}, "warm_start": {}}
+
+    if state.awaiting_description:
+        # Nothing was summarized yet, so the documents are the project description.
+        logger.info(f"Summarizing added documents {names} as the project description")
+        state = state.model_copy(update={**reset, "awaiting_description": False, "user_input": "", "user_feedback": ""})
+        return {**reset, "awaiting_description": False, "user_input": "", **generate_initial_summary_node(state, config)}
+
+    stages = list(STAGE_GENERATORS)
+    current = "scope_of_work" if state.current_stage == "final_review" else state.current_stage
+    reached = stages[:stages.index(current) + 1]
+    touched = [reached.index(stage) for stage in stages_touched(state.document_update.get("text", "")) if stage in reached]
+    refreshed = reached[min(touched + [len(reached) - 1]):]
+    logger.info(f"Documents {names} added; revising {', '.join(refreshed)}")
+
+    feedback = (
+        f"New documents were added to the project context: {names}. Revise this output to reflect anything "
+        f"in them that adds to or changes it, and keep everything they don't affect."
+    )
+    update = dict(reset)
+    for stage in refreshed:
+        result = STAGE_GENERATORS[stage](state.model_copy(update={**reset, "user_feedback": feedback}), config)
+        state = state.model_copy(update=result)
+        update.update(result)
+
+    update["follow_up_questions"] = (
+        f"I added {names} to the project context and updated the "
+        f"{', '.join(STAGE_LABELS[stage] for stage in refreshed)}. Does this look right, or what should change?"
+    )
+    return update
 
 
 @time_logger
 def pause_node(state):
     current_stage = getattr(state, 'current_stage', 'initial_summary')
     logger.info(f"Paused at stage {current_stage}")
-    return state
+    return {}
 
 
 @time_logger
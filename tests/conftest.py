@@ -0,0 +1,67 @@
+import json
+import os
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+# The API needs a key at import; no test reaches the provider.
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ["WARM_UP_ON_STARTUP"] = "false"
+os.environ["JOB_QUEUE_PATH"] = ""
+os.environ.setdefault("LLM_CONTEXT_CACHE", "memory")
+
+
+class FakeLLM:
+    """Answers each stage's prompt with a fixed, valid reply and records the prompts it saw."""
+
+    REPLIES = [
+        ("Router Agent", None),
+        ("Project Analyst", {"summary": "A summary", "follow_up_question": "Summary OK?"}),
+        ("Project Synthesizer", {"overview": "An overview", "follow_up_question": "Overview OK?"}),
+        ("Feature Consultant", {"features": ["Login", "Search"], "follow_up_question": "Features OK?"}),
+        ("Technical Architect", {"tech_stack": {"frontend": ["React"]}, "follow_up_question": "Stack OK?"}),
+        ("Work Scope Generator", {"overview": "Scope", "follow_up_question": "Final?"}),
+    ]
+
+    model = "models/fake"
+    temperature = 0.0
+
+    def __init__(self):
+        self.prompts = []
+
+    def reply(self, prompt: str) -> str:
+        for marker, reply in self.REPLIES:
+            if marker in prompt:
+                if reply is None:
+                    user_input = prompt.split("User's Input")[-1].lower()
+                    return "ACTION: EDIT\nFEEDBACK: change it" if "change" in user_input else "ACTION: APPROVE\nFEEDBACK:"
+                return json.dumps(reply)
+        return json.dumps({"operations": [], "follow_up_question": "Edited?"})
+
+    def invoke(self, messages, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages)
+        self.prompts.append(prompt)
+        return AIMessage(content=self.reply(prompt))
+
+    def stream(self, messages, **kwargs):
+        content = self.invoke(messages, **kwargs).content
+        for start in range(0, len(content), 8):
+            yield AIMessageChunk(content=content[start:start + 8])
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    import utils.helper
+
+    llm = FakeLLM()
+    monkeypatch.setattr(utils.helper, "get_llm", lambda tier: llm)
+    return llm
+
+
+@pytest.fixture
+def client(fake_llm):
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,141 @@
+import uuid
+
+import pytest
+
+DESCRIPTION = "Build a booking and billing CRM for dental clinics with reminders and reports."
+
+
+def start_session(client, *inputs):
+    session_id = uuid.uuid4().hex
+    response = client.post(f"/sessions/{session_id}/initial-input", json={"initial_input": DESCRIPTION})
+    assert response.status_code == 200
+    for user_input in inputs:
+        response = client.post(f"/sessions/{session_id}/input", json={"user_input": user_input})
+        assert response.status_code == 200
+    return session_id
+
+
+def thread_state(session_id):
+    import main
+    from src.checkpoints import load_state_values
+
+    return load_state_values(main.workflow_graph(), main.get_session(session_id)["thread_id"])
+
+
+def stored_checkpoints(thread_id):
+    import main
+
+    return main.workflow_graph().checkpointer.storage.get(thread_id, {}).get("", {})
+
+
+def test_a_restored_checkpoint_continues_with_a_new_turn(client, fake_llm):
+    session_id = start_session(client, "looks good", "great")
+    assert thread_state(session_id)["current_stage"] == "features"
+
+    response = client.post(f"/sessions/{session_id}/back", json={"stage": "overview"})
+    assert response.json()["content"] == "An overview"
+    assert thread_state(session_id)["current_stage"] == "overview"
+
+    prompts = len(fake_llm.prompts)
+    response = client.post(f"/sessions/{session_id}/input", json={"user_input": "approve"})
+
+    assert response.json()["current_stage"] == "features"
+    assert any("Feature Consultant" in prompt for prompt in fake_llm.prompts[prompts:])
+    state = thread_state(session_id)
+    assert state["file_content"] == DESCRIPTION
+    assert state["overview"] == "An overview"
+
+
+def test_undo_reverts_a_restore(client):
+    session_id = start_session(client, "looks good", "great")
+    before = thread_state(session_id)
+
+    client.post(f"/sessions/{session_id}/back", json={"stage": "initial_summary"})
+    assert thread_state(session_id)["current_stage"] == "initial_summary"
+    response = client.post(f"/sessions/{session_id}/undo")
+
+    assert response.status_code == 200
+    assert response.json()["current_stage"] == "features"
+    after = thread_state(session_id)
+    for field in ("current_stage", "initial_summary", "overview", "extracted_features", "file_content"):
+        assert after.get(field) == before.get(field)
+
+
+def test_prune_keeps_retained_replies_and_the_head_and_drops_orphans(client, monkeypatch):
+    import main
+    from src.checkpoints import latest_checkpoint_id
+    from utils.helper import retained_checkpoint_ids
+
+    monkeypatch.setattr(main, "CHECKPOINT_HISTORY_TURNS", 1)
+    session_id = start_session(client, "looks good", "great", "approve")
+    client.post(f"/sessions/{session_id}/undo")
+
+    checkpointer = main.workflow_graph().checkpointer
+    thread_id = main.get_session(session_id)["thread_id"]
+    checkpoints = stored_checkpoints(thread_id)
+    expected = set(retained_checkpoint_ids(session_id, 1)) | {latest_checkpoint_id(checkpointer, thread_id)}
+    assert set(checkpoints) == expected
+
+    live = set()
+    for serialized_checkpoint, _, _ in checkpoints.values():
+        live |= set(checkpointer.serde.loads_typed(serialized_checkpoint)["channel_versions"].items())
+    blobs = {(channel, version) for (thread, _, channel, version) in checkpointer.blobs if thread == thread_id}
+    assert blobs <= live
+    writes = {checkpoint_id for (thread, _, checkpoint_id) in checkpointer.writes if thread == thread_id}
+    assert writes <= set(checkpoints)
+
+
+def test_restoring_a_pruned_reply_is_gone(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "CHECKPOINT_HISTORY_TURNS", 1)
+    session_id = start_session(client, "looks good", "great", "approve")
+
+    response = client.post(f"/sessions/{session_id}/back", json={"stage": "overview"})
+
+    assert response.status_code == 410
+    # The first reply is always retained.
+    assert client.post(f"/sessions/{session_id}/reset").status_code == 200
+
+
+def test_a_fork_is_independent_of_its_parent_and_outlives_it(client):
+    import main
+
+    parent_id = start_session(client, "looks good")
+    response = client.post(f"/sessions/{parent_id}/fork", json={})
+    assert response.status_code == 201
+    fork_id = response.json()["session_id"]
+    parent_thread = main.get_session(parent_id)["thread_id"]
+    fork_thread_id = main.get_session(fork_id)["thread_id"]
+
+    client.post(f"/sessions/{parent_id}/input", json={"user_input": "approve"})
+    client.post(f"/sessions/{fork_id}/back", json={"stage": "initial_summary"})
+    client.post(f"/sessions/{fork_id}/input", json={"user_input": "looks good"})
+
+    assert thread_state(parent_id)["current_stage"] == "features"
+    assert thread_state(fork_id)["current_stage"] == "overview"
+    assert "extracted_features" not in thread_state(fork_id) or not thread_state(fork_id)["extracted_features"]
+    # Four shared messages, then each thread's own two turns.
+    assert len(client.get(f"/sessions/{parent_id}/messages").json()["messages"]) == 6
+    assert len(client.get(f"/sessions/{fork_id}/messages").json()["messages"]) == 8
+
+    assert client.delete(f"/sessions/{parent_id}").status_code == 204
+    assert not stored_checkpoints(parent_thread)
+
+    response = client.post(f"/sessions/{fork_id}/back", json={"stage": "initial_summary"})
+    assert response.status_code == 200
+    assert response.json()["content"] == "A summary"
+    response = client.post(f"/sessions/{fork_id}/undo")
+    assert response.status_code == 200
+    assert response.json()["current_stage"] == "overview"
+    assert thread_state(fork_id)["file_content"] == DESCRIPTION
+    assert stored_checkpoints(fork_thread_id)
+
+
+@pytest.mark.parametrize("stage", ["overview", "features"])
+def test_back_to_a_stage_without_a_reply_conflicts(client, stage):
+    session_id = start_session(client)
+
+    response = client.post(f"/sessions/{session_id}/back", json={"stage": stage})
+
+    assert response.status_code == 409
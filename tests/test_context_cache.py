@@ -0,0 +1,116 @@
+import pytest
+
+import utils.context_cache as context_cache
+from utils.context_cache import (
+    ContextCacheBackend,
+    InMemoryContextCacheBackend,
+    create_document_cache,
+    refresh_document_cache,
+    release_document_cache,
+    retain_document_cache,
+)
+
+DOCUMENT = "Clinics need booking, billing and reminders. " * 500
+
+
+class RecordingBackend(InMemoryContextCacheBackend):
+    def __init__(self):
+        super().__init__()
+        self.extended = []
+
+    def extend(self, name: str, ttl_seconds: int):
+        self.extended.append(name)
+        super().extend(name, ttl_seconds)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = RecordingBackend()
+    monkeypatch.setattr(context_cache, "_backend", backend)
+    monkeypatch.setattr(context_cache, "_refcounts", {})
+    monkeypatch.setattr(context_cache, "_refreshed_at", {})
+    return backend
+
+
+def test_backends_must_implement_every_operation():
+    class CreateOnly(ContextCacheBackend):
+        def create(self, model, text, ttl_seconds):
+            return "name"
+
+    with pytest.raises(TypeError):
+        CreateOnly()
+
+
+def test_in_memory_backend_creates_extends_and_deletes():
+    backend = InMemoryContextCacheBackend()
+
+    name = backend.create("models/fake", "text", 60)
+    expires_at = backend.entries[name]["expires_at"]
+    backend.extend(name, 600)
+    assert backend.entries[name]["expires_at"] > expires_at
+    backend.delete(name)
+    backend.delete(name)
+
+    assert name not in backend.entries
+    with pytest.raises(KeyError):
+        backend.extend(name, 60)
+
+
+def test_small_documents_are_not_cached(backend):
+    assert create_document_cache("A short brief.") == {}
+    assert not backend.entries
+
+
+def test_a_cache_is_deleted_when_its_last_holder_releases_it(backend):
+    handles = create_document_cache(DOCUMENT)
+    assert handles and set(handles.values()) == set(backend.entries)
+    assert all(DOCUMENT in entry["text"] for entry in backend.entries.values())
+
+    retain_document_cache(handles)
+    release_document_cache(handles)
+    assert set(handles.values()) == set(backend.entries)
+
+    release_document_cache(handles)
+    assert not backend.entries
+
+
+def test_refresh_extends_a_cache_at_most_once_per_interval(backend, monkeypatch):
+    handles = create_document_cache(DOCUMENT)
+
+    refresh_document_cache(handles)
+    assert backend.extended == []
+
+    monkeypatch.setattr(context_cache, "CONTEXT_CACHE_REFRESH_SECONDS", 0)
+    refresh_document_cache(handles)
+    assert sorted(backend.extended) == sorted(handles.values())
+
+    monkeypatch.setattr(context_cache, "CONTEXT_CACHE_REFRESH_SECONDS", 300)
+    refresh_document_cache(handles)
+    assert len(backend.extended) == len(handles)
+
+
+def test_a_failed_cached_call_is_retried_with_the_document_inline(fake_llm, monkeypatch):
+    from utils.helper import invoke_llm
+    from utils.prompts import summary_prompt
+
+    calls = []
+    reply = fake_llm.invoke
+
+    def invoke(messages, **kwargs):
+        calls.append(kwargs.get("cached_content"))
+        if kwargs.get("cached_content"):
+            raise ValueError("cached content not found")
+        return reply(messages, **kwargs)
+
+    monkeypatch.setattr(fake_llm, "invoke", invoke)
+    output = invoke_llm(
+        summary_prompt.template,
+        {"parsed_data": "Clinics need booking.", "user_feedback": ""},
+        "initial_summary",
+        expect_json=False,
+        context_cache={fake_llm.model: "cachedContents/expired"},
+    )
+
+    assert calls == ["cachedContents/expired", None]
+    assert "A summary" in output.content
+    assert "Clinics need booking." in fake_llm.prompts[-1]
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from utils.job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.1)
+    yield queue
+    queue.close()
+
+
+def test_a_claimed_job_is_not_claimed_again_while_leased(queue):
+    job_id = queue.submit("parse", {"filename": "a.pdf"}, "s1", b"%PDF")
+
+    job = queue.claim("w1")
+
+    assert job["id"] == job_id
+    assert job["payload"] == {"filename": "a.pdf"}
+    assert job["data"] == b"%PDF"
+    assert queue.claim("w2") is None
+    assert queue.heartbeat(job_id, "w1")
+    assert not queue.heartbeat(job_id, "w2")
+
+
+def test_an_expired_lease_is_reclaimed_and_only_the_new_holder_finishes_the_job(queue):
+    job_id = queue.submit("graph", {"thread_id": "t1"}, max_attempts=2)
+    queue.claim("w1")
+    time.sleep(0.15)
+
+    job = queue.claim("w2")
+
+    assert job["id"] == job_id
+    assert queue.get(job_id)["attempts"] == 2
+    assert not queue.heartbeat(job_id, "w1")
+    assert queue.complete(job_id, {"changes": {}}, "w2")
+    # The stale worker finishing late can no longer overwrite the result.
+    assert not queue.fail(job_id, {"status_code": 500, "detail": "late"}, "w1")
+    assert not queue.complete(job_id, {"changes": {"stale": True}}, "w1")
+    assert queue.get(job_id)["status"] == "succeeded"
+    assert queue.get(job_id)["result"] == {"changes": {}}
+
+
+def test_a_job_fails_once_its_attempts_are_used_up(queue):
+    job_id = queue.submit("parse", {"filename": "a.pdf"}, max_attempts=1)
+    queue.claim("w1")
+    time.sleep(0.15)
+
+    assert queue.claim("w2") is None
+
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert job["error"]["status_code"] == 500
+    assert not queue.complete(job_id, {"file_content": "late"}, "w1")
+
+
+def test_turns_are_never_claimed_and_are_finished_without_a_worker(queue):
+    job_id = queue.create_turn("s1")
+
+    assert queue.claim("w1") is None
+    assert not queue.complete(job_id, {"content": "x"}, "w1")
+    assert queue.complete(job_id, {"content": "x"})
+    assert queue.get(job_id)["result"] == {"content": "x"}
+
+
+def test_purge_deletes_only_finished_jobs_past_retention(queue):
+    done_id = queue.submit("parse", {})
+    queue.claim("w1")
+    queue.complete(done_id, {}, "w1")
+    queued_id = queue.submit("parse", {})
+    running_id = queue.create_turn("s1")
+
+    assert queue.purge(older_than_seconds=60) == 0
+    time.sleep(0.05)
+    assert queue.purge(older_than_seconds=0.01) == 1
+
+    assert queue.get(done_id) is None
+    assert queue.get(queued_id)["status"] == "queued"
+    assert queue.get(running_id)["status"] == "running"
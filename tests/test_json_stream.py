@@ -0,0 +1,110 @@
+import json
+import uuid
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from utils.helper import JsonObjectScanner, strip_json_fences, stream_json_object
+
+
+def scan(chunks):
+    """The text up to where the scanner says the object closed, or None if it never did."""
+    scanner = JsonObjectScanner()
+    text = ""
+    for chunk in chunks:
+        end = scanner.feed(chunk)
+        if end is not None:
+            return text + chunk[:end]
+        text += chunk
+    return None
+
+
+@pytest.mark.parametrize("chunks", [
+    ['{"a": 1}', ' trailing prose {"b": 2}'],
+    ['{"a": "brace } and bracket ] in a string"}'],
+    ['{"a": "escaped \\', '" quote }"}', "\nmore"],
+    ['{"a": "backslash \\\\', '"}', '{"b": 1}'],
+    ['{"a": [1, {"b": "]"}], "c": {}}', "]"],
+])
+def test_the_scanner_stops_right_after_the_first_object(chunks):
+    text = scan(chunks)
+
+    assert text is not None
+    json.loads(text)
+    assert text == "".join(chunks)[:len(text)]
+
+
+def test_text_before_the_object_is_skipped_even_with_brackets():
+    text = scan(["Note [draft", "]: here it is ", '{"a": ["x"]}', " done"])
+
+    assert text.endswith('{"a": ["x"]}')
+
+
+def test_a_fence_split_across_chunks_is_kept_for_the_parser():
+    text = scan(["``", "`js", "on\n{", '"a": "```"', "}\n```"])
+
+    assert json.loads(strip_json_fences(text)) == {"a": "```"}
+
+
+def test_an_unclosed_object_is_never_reported():
+    assert scan(['{"a": "unterminated }', '"b": [1, 2']) is None
+
+
+class StreamingLLM:
+    def __init__(self, chunks, finish_reason="STOP"):
+        self.chunks = chunks
+        self.finish_reason = finish_reason
+        self.closed = False
+        self.read = 0
+
+    def stream(self, messages, **kwargs):
+        try:
+            for index, content in enumerate(self.chunks):
+                self.read += 1
+                last = index == len(self.chunks) - 1
+                metadata = {"finish_reason": self.finish_reason} if last else {}
+                yield AIMessageChunk(content=content, response_metadata=metadata)
+        finally:
+            self.closed = True
+
+
+def test_the_stream_is_closed_once_the_object_is_complete():
+    llm = StreamingLLM(['{"a"', ': 1}', " Let me know if", " you need more."])
+
+    output = stream_json_object(llm, [])
+
+    assert output.content == '{"a": 1}'
+    assert output.response_metadata["early_stopped"]
+    assert llm.read == 2 and llm.closed
+
+
+def test_a_stream_that_ends_with_the_object_is_not_early_stopped():
+    llm = StreamingLLM(['{"a"', ": 1}"])
+
+    output = stream_json_object(llm, [])
+
+    assert output.content == '{"a": 1}'
+    assert not output.response_metadata.get("early_stopped")
+
+
+def test_outputs_cut_at_the_token_cap_are_counted_as_truncated(fake_llm, monkeypatch):
+    from utils.helper import invoke_llm
+    from utils.prompts import summary_prompt
+    from utils.tokens import TOKEN_USAGE
+
+    truncated = StreamingLLM(['{"summary": "A long', " summary that never"], finish_reason="MAX_TOKENS")
+    monkeypatch.setattr(fake_llm, "stream", truncated.stream)
+    thread_id = uuid.uuid4().hex
+
+    invoke_llm(
+        summary_prompt.template,
+        {"parsed_data": "Clinics need booking.", "user_feedback": ""},
+        "initial_summary",
+        thread_id=thread_id,
+    )
+
+    totals = TOKEN_USAGE.thread_report(thread_id)["totals"]
+    # The invalid output is retried on each stronger tier, and every capped call is counted.
+    assert totals["calls"] >= 1
+    assert totals["truncated_calls"] == totals["calls"]
+    assert totals["early_stopped_calls"] == 0
@@ -0,0 +1,188 @@
+import threading
+import time
+
+import pytest
+
+from utils.rate_limiter import AdaptiveRateLimiter
+
+
+class ResourceExhausted(Exception):
+    """Named like the provider's 429 error, which the limiter detects by name."""
+
+
+class FakeServer:
+    """Answers after `latency` seconds and returns 429 while more than `capacity` calls are in flight."""
+
+    def __init__(self, capacity: int, latency: float = 0.01):
+        self.capacity = capacity
+        self.latency = latency
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def call(self):
+        with self._lock:
+            self.in_flight += 1
+            overloaded = self.in_flight > self.capacity
+        try:
+            time.sleep(self.latency)
+            if overloaded:
+                with self._lock:
+                    self.rejected += 1
+                raise ResourceExhausted("429 RESOURCE_EXHAUSTED")
+            with self._lock:
+                self.completed += 1
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def make_limiter(max_concurrency=16, backoff_seconds=0.02):
+    return AdaptiveRateLimiter(
+        requests_per_minute=1_000_000,
+        tokens_per_minute=1_000_000_000,
+        max_concurrency=max_concurrency,
+        latency_target=5.0,
+        backoff_seconds=backoff_seconds,
+    )
+
+
+def call_once(limiter, server):
+    try:
+        with limiter.slot(100):
+            server.call()
+    except ResourceExhausted:
+        pass
+
+
+def test_rate_limits_halve_concurrency():
+    limiter = make_limiter(max_concurrency=16)
+    server = FakeServer(capacity=0)
+
+    call_once(limiter, server)
+    assert limiter.concurrency_limit == 8
+    call_once(limiter, server)
+    assert limiter.concurrency_limit == 4
+    assert limiter.stats["rate_limited"] == 2
+
+
+def test_successes_recover_about_one_slot_per_window():
+    limiter = make_limiter(max_concurrency=16, backoff_seconds=0)
+    limiter.concurrency_limit = 4.0
+    server = FakeServer(capacity=100, latency=0)
+
+    for _ in range(4):
+        call_once(limiter, server)
+    assert 4.9 < limiter.concurrency_limit < 5.0
+
+    for _ in range(200):
+        call_once(limiter, server)
+    assert limiter.concurrency_limit == 16
+
+
+def test_throughput_stays_stable_under_overload():
+    capacity = 4
+    limiter = make_limiter(max_concurrency=32)
+    server = FakeServer(capacity=capacity)
+    deadline = time.monotonic() + 1.5
+    timeline = []
+
+    def client():
+        while time.monotonic() < deadline:
+            call_once(limiter, server)
+
+    def monitor():
+        while time.monotonic() < deadline:
+            timeline.append((server.completed, server.rejected, limiter.concurrency_limit))
+            time.sleep(0.25)
+
+    threads = [threading.Thread(target=client) for _ in range(32)] + [threading.Thread(target=monitor)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Six quarter-second windows: after the first, each completes a similar number of calls
+    # and most attempts succeed, with the limit hovering around the server's capacity.
+    # Without the limiter 32 clients against 4 slots would see mostly 429s.
+    completed = [later[0] - earlier[0] for earlier, later in zip(timeline, timeline[1:])]
+    rejected = [later[1] - earlier[1] for earlier, later in zip(timeline, timeline[1:])]
+    steady = completed[1:]
+    assert min(steady) > 0.6 * max(steady)
+    assert sum(rejected[1:]) < 0.35 * sum(steady)
+    assert all(limit <= 4 * capacity for _, _, limit in timeline[2:])
+    # Close to what the server can do: `capacity` calls per `latency`.
+    assert sum(steady) / (0.25 * len(steady)) > 0.4 * capacity / server.latency
+
+
+def test_interactive_waiters_go_first():
+    limiter = make_limiter(max_concurrency=1)
+    order = []
+    limiter.acquire(1)
+
+    def waiter(priority):
+        limiter.acquire(1, priority=priority)
+        order.append(priority)
+        limiter.release(0.0)
+
+    batch = threading.Thread(target=waiter, args=("batch",))
+    batch.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=waiter, args=("interactive",))
+    interactive.start()
+    time.sleep(0.05)
+    limiter.release(0.0)
+    batch.join()
+    interactive.join()
+
+    assert order == ["interactive", "batch"]
+
+
+def test_slow_responses_shrink_concurrency():
+    limiter = make_limiter(max_concurrency=10)
+    limiter.acquire(1)
+    limiter.release(6.0)
+    assert limiter.concurrency_limit == pytest.approx(9.0)
+    assert limiter.stats["slow"] == 1
+
+
+def test_a_429_from_the_gemini_client_reaches_the_limiter_after_one_attempt(monkeypatch):
+    from google.api_core.exceptions import ResourceExhausted as GoogleResourceExhausted
+    from langchain_google_genai import chat_models
+
+    import utils.models
+
+    # Build a fresh client so the retry hook is installed, and undo it afterwards.
+    monkeypatch.setattr(chat_models, "_create_retry_decorator", chat_models._create_retry_decorator)
+    monkeypatch.setattr(utils.models, "_clients", {})
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    llm = utils.models.get_llm("fast")
+    attempts = []
+
+    def generate_content(**kwargs):
+        attempts.append(1)
+        raise GoogleResourceExhausted("Quota exceeded")
+
+    monkeypatch.setattr(llm.client, "generate_content", generate_content)
+    limiter = AdaptiveRateLimiter(600, 10**6, max_concurrency=4, backoff_seconds=0)
+
+    with pytest.raises(GoogleResourceExhausted):
+        with limiter.slot(10):
+            llm.invoke("Hello")
+
+    assert len(attempts) == 1
+    assert limiter.stats["rate_limited"] == 1
+    assert limiter.concurrency_limit == 2
+
+
+def test_a_missing_retry_hook_is_reported(monkeypatch, caplog):
+    from langchain_google_genai import chat_models
+
+    import utils.models
+
+    monkeypatch.delattr(chat_models, "_create_retry_decorator")
+
+    utils.models._single_attempt_client_calls()
+
+    assert "_create_retry_decorator" in caplog.text
@@ -0,0 +1,150 @@
+import time
+from threading import Lock
+
+import pytest
+
+from utils.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientCaller
+
+
+class ServiceUnavailable(Exception):
+    """Named like the provider's 503 error, which the caller treats as retryable."""
+
+
+class FakeUpstream:
+    """Stands in for a provider: records each request and answers after `latency` seconds."""
+
+    def __init__(self, latencies=(0.0,), errors=()):
+        self.latencies = list(latencies)
+        self.errors = list(errors)
+        self.requests = 0
+        self._lock = Lock()
+
+    def __call__(self, deadline):
+        deadline.start()
+        with self._lock:
+            index = self.requests
+            self.requests += 1
+        time.sleep(self.latencies[min(index, len(self.latencies) - 1)])
+        if index < len(self.errors) and self.errors[index] is not None:
+            raise self.errors[index]
+        return index
+
+
+def make_caller(deadline=1.0, max_retries=0, failure_threshold=2, reset_timeout=0.2):
+    return ResilientCaller(
+        name="test",
+        default_deadline=deadline,
+        stage_deadlines={},
+        max_retries=max_retries,
+        base_delay=0.01,
+        max_delay=0.02,
+        breaker=CircuitBreaker("test", failure_threshold=failure_threshold, reset_timeout=reset_timeout),
+        max_workers=4,
+    )
+
+
+def test_deadline_stops_waiting_for_slow_upstream():
+    caller = make_caller(deadline=0.2)
+    upstream = FakeUpstream(latencies=[1.0])
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        caller.call(upstream)
+    assert time.monotonic() - start < 0.5
+    assert caller.stats["timeouts"] == 1
+
+
+def test_deadline_passed_while_queued_sends_nothing():
+    caller = make_caller(deadline=0.2)
+    upstream = FakeUpstream()
+    slot = Lock()
+
+    def queued(deadline):
+        with slot:
+            return upstream(deadline)
+
+    slot.acquire()
+    with pytest.raises(DeadlineExceeded):
+        caller.call(queued)
+    slot.release()
+    time.sleep(0.1)
+
+    assert upstream.requests == 0
+    # A local queue timeout says nothing about the provider.
+    assert caller.breaker.failures == 0
+
+
+def test_hedge_fires_after_delay_and_wins():
+    caller = make_caller()
+    upstream = FakeUpstream(latencies=[0.5, 0.01])
+
+    start = time.monotonic()
+    result = caller.call(upstream, hedge_delay=0.05)
+    elapsed = time.monotonic() - start
+
+    assert result == 1
+    assert 0.05 <= elapsed < 0.3
+    assert caller.stats["hedges"] == 1
+    assert caller.stats["hedge_wins"] == 1
+
+
+def test_no_hedge_when_primary_is_fast():
+    caller = make_caller()
+    upstream = FakeUpstream(latencies=[0.01])
+
+    assert caller.call(upstream, hedge_delay=0.2) == 0
+    assert caller.stats["hedges"] == 0
+    assert upstream.requests == 1
+
+
+def test_breaker_opens_then_half_opens():
+    caller = make_caller(failure_threshold=2, reset_timeout=0.2)
+    upstream = FakeUpstream(errors=[ServiceUnavailable("503"), ServiceUnavailable("503")])
+
+    for _ in range(2):
+        with pytest.raises(ServiceUnavailable):
+            caller.call(upstream)
+    assert caller.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        caller.call(upstream)
+    assert upstream.requests == 2
+    assert caller.stats["fast_failures"] == 1
+
+    time.sleep(0.25)
+    assert caller.breaker.state == "half_open"
+    assert caller.call(upstream) == 2
+    assert caller.breaker.state == "closed"
+
+
+def test_failed_trial_reopens_breaker():
+    caller = make_caller(failure_threshold=1, reset_timeout=0.1)
+    upstream = FakeUpstream(errors=[ServiceUnavailable("503"), ServiceUnavailable("503")])
+
+    with pytest.raises(ServiceUnavailable):
+        caller.call(upstream)
+    time.sleep(0.15)
+    assert caller.breaker.state == "half_open"
+    with pytest.raises(ServiceUnavailable):
+        caller.call(upstream)
+    assert caller.breaker.state == "open"
+
+
+def test_client_errors_do_not_open_breaker():
+    caller = make_caller(failure_threshold=2)
+    upstream = FakeUpstream(errors=[ValueError("400 bad request")] * 5)
+
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            caller.call(upstream)
+    assert caller.breaker.state == "closed"
+    assert caller.breaker.failures == 0
+
+
+def test_retryable_failure_is_retried_within_deadline():
+    caller = make_caller(max_retries=2)
+    upstream = FakeUpstream(errors=[ServiceUnavailable("503"), None])
+
+    assert caller.call(upstream) == 1
+    assert caller.stats["retries"] == 1
+    assert caller.breaker.state == "closed"
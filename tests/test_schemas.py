@@ -0,0 +1,41 @@
+from utils.schemas import TECH_STACK, Feature, ScopeOfWork, artifact_json
+
+
+def test_feature_strings_round_trip_as_strings():
+    features = [Feature.model_validate("Login"), Feature.model_validate({"name": "Search", "description": "Full text"})]
+
+    assert artifact_json(features) == ["Login", {"name": "Search", "description": "Full text"}]
+    assert [str(feature) for feature in features] == ["Login", "Search: Full text"]
+
+
+def test_tech_stack_coerces_scalars_to_lists():
+    tech_stack = TECH_STACK.validate_python(
+        {"frontend": "React", "backend": ["FastAPI", {"name": "Celery", "purpose": "jobs"}], "versions": 3}
+    )
+
+    assert tech_stack == {"frontend": ["React"], "backend": ["FastAPI", "Celery"], "versions": ["3"]}
+
+
+def test_off_shape_fields_keep_the_rest_of_the_scope_of_work():
+    sow = ScopeOfWork.from_output({
+        "overview": "A CRM for dental clinics.",
+        "user_roles_and_key_features": ["Admin: manages staff", {"name": "Dentist", "description": "Books visits"}],
+        "tech_stack": "React and FastAPI",
+        "workflow": {"step 1": "Sign in"},
+        "effort_estimation_table": {"headers": ["Module"], "rows": "unknown"},
+    })
+
+    assert sow.overview == "A CRM for dental clinics."
+    assert str(sow.user_roles_and_key_features[1]) == "Dentist: Books visits"
+    assert sow.tech_stack == {"technologies": ["React and FastAPI"]}
+    assert '"step 1": "Sign in"' in sow.workflow
+    assert sow.effort_estimation_table is None
+
+
+def test_updates_are_validated_like_a_fresh_generation():
+    sow = ScopeOfWork.from_output({"overview": "Old", "tech_stack": {"frontend": ["React"]}})
+
+    updated = sow.with_updates({"tech_stack": {"frontend": "Vue"}})
+
+    assert updated.overview == "Old"
+    assert updated.tech_stack == {"frontend": ["Vue"]}
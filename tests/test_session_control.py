@@ -0,0 +1,148 @@
+import asyncio
+import uuid
+
+import pytest
+
+from utils.session_control import (
+    IdempotencyCache,
+    IdempotencyKeyReusedError,
+    SessionRunGuard,
+    SupersededError,
+    request_fingerprint,
+)
+
+
+def test_runs_on_one_session_never_overlap():
+    guard = SessionRunGuard()
+    events = []
+
+    async def run(name, session_id="s1"):
+        async with guard.exclusive(session_id):
+            events.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            events.append(f"{name} end")
+
+    async def main():
+        await asyncio.gather(run("a"), run("b"), run("other", "s2"))
+
+    asyncio.run(main())
+
+    session_events = [event for event in events if not event.startswith("other")]
+    assert session_events == ["a start", "a end", "b start", "b end"]
+    assert events.index("other start") < events.index("a end")
+
+
+def test_a_newer_submission_supersedes_one_still_waiting():
+    guard = SessionRunGuard()
+    finished = []
+
+    async def submit(name, delay=0.0):
+        await asyncio.sleep(delay)
+        async with guard.exclusive("s1", supersede=True):
+            await asyncio.sleep(0.02)
+            finished.append(name)
+
+    async def main():
+        return await asyncio.gather(
+            submit("running"), submit("waiting", 0.005), submit("newest", 0.01), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+
+    # The run that already held the lock finishes; only the one still waiting is dropped.
+    assert finished == ["running", "newest"]
+    assert isinstance(results[1], SupersededError)
+
+
+def test_a_retry_with_the_same_key_returns_the_first_response():
+    cache = IdempotencyCache()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        return {"reply": len(calls)}
+
+    async def main():
+        fingerprint = request_fingerprint("input", "approve")
+        first = await cache.run("s1", "k1", work, fingerprint)
+        retry = await cache.run("s1", "k1", work, fingerprint)
+        other_key = await cache.run("s1", "k2", work, fingerprint)
+        no_key = await cache.run("s1", None, work, fingerprint)
+        return first, retry, other_key, no_key
+
+    first, retry, other_key, no_key = asyncio.run(main())
+
+    assert first == retry == {"reply": 1}
+    assert other_key == {"reply": 2}
+    assert no_key == {"reply": 3}
+
+
+def test_concurrent_retries_share_the_in_flight_call():
+    cache = IdempotencyCache()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {"reply": "done"}
+
+    async def main():
+        fingerprint = request_fingerprint("input", "approve")
+        return await asyncio.gather(*(cache.run("s1", "k1", work, fingerprint) for _ in range(3)))
+
+    assert asyncio.run(main()) == [{"reply": "done"}] * 3
+    assert len(calls) == 1
+
+
+def test_a_key_reused_for_a_different_request_is_rejected():
+    cache = IdempotencyCache()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return {"reply": "done"}
+
+    async def main():
+        upload = request_fingerprint("upload", "brief.pdf", b"%PDF")
+        user_input = request_fingerprint("input", "approve")
+        in_flight = asyncio.create_task(cache.run("s1", "k1", work, upload))
+        await asyncio.sleep(0)
+        with pytest.raises(IdempotencyKeyReusedError):
+            await cache.run("s1", "k1", work, user_input)
+        await in_flight
+        with pytest.raises(IdempotencyKeyReusedError):
+            await cache.run("s1", "k1", work, user_input)
+        # The same key on another session is unrelated.
+        return await cache.run("s2", "k1", work, user_input)
+
+    assert asyncio.run(main()) == {"reply": "done"}
+
+
+def test_responses_expire_after_the_ttl():
+    cache = IdempotencyCache(ttl_seconds=0.01)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        first = await cache.run("s1", "k1", work, "a")
+        await asyncio.sleep(0.02)
+        # An expired key can be used again, even for a different request.
+        return first, await cache.run("s1", "k1", work, "b")
+
+    assert asyncio.run(main()) == (1, 2)
+
+
+def test_the_api_answers_422_for_a_reused_key(client):
+    session_id = uuid.uuid4().hex
+    headers = {"Idempotency-Key": "k1"}
+    description = {"initial_input": "Build a booking and billing CRM for dental clinics."}
+
+    first = client.post(f"/sessions/{session_id}/initial-input", json=description, headers=headers)
+    retry = client.post(f"/sessions/{session_id}/initial-input", json=description, headers=headers)
+    reused = client.post(f"/sessions/{session_id}/input", json={"user_input": "approve"}, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert reused.status_code == 422
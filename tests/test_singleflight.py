@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+
+from utils.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def run_threads(count, target):
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_threads_share_one_call_and_only_the_first_leads():
+    flight = SingleFlight("test")
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    results = run_threads(3, lambda: flight.do_shared("key", work))
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda result: result[1]) == [("result", False), ("result", True), ("result", True)]
+    # Nothing is cached once the call completes.
+    assert flight.do_shared("key", work) == ("result", False)
+    assert len(calls) == 2
+
+
+def test_joined_threads_get_the_leaders_exception():
+    flight = SingleFlight("test")
+
+    def work():
+        time.sleep(0.1)
+        raise ValueError("upstream failed")
+
+    results = run_threads(3, lambda: flight.do("key", work))
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_different_keys_do_not_share_calls():
+    flight = SingleFlight("test")
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.05)
+
+    keys = iter(["a", "b"])
+    run_threads(2, lambda: flight.do(next(keys), work))
+
+    assert len(calls) == 2
+
+
+def test_concurrent_coroutines_share_one_call():
+    flight = AsyncSingleFlight("test")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["result"] * 3
+    assert len(calls) == 1
+
+
+def test_joined_coroutines_get_the_leaders_exception():
+    flight = AsyncSingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.02)
+        raise ValueError("upstream failed")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(2)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(main()))
+
+
+@pytest.mark.parametrize("stage, upstream_calls", [("router", 1), ("features_edit", 2)])
+def test_only_coalescing_stages_share_llm_calls(fake_llm, monkeypatch, stage, upstream_calls):
+    from utils.helper import invoke_llm
+    from utils.prompts import router_prompt
+    from utils.tokens import TOKEN_USAGE
+
+    reply = fake_llm.invoke
+
+    def slow_invoke(messages, **kwargs):
+        time.sleep(0.1)
+        return reply(messages, **kwargs)
+
+    monkeypatch.setattr(fake_llm, "invoke", slow_invoke)
+    threads = [uuid.uuid4().hex for _ in range(2)]
+    keys = iter(threads)
+    run_threads(2, lambda: invoke_llm(
+        router_prompt.template,
+        {"user_input": "approve", "current_stage": "overview"},
+        stage,
+        expect_json=False,
+        thread_id=next(keys),
+    ))
+
+    assert len(fake_llm.prompts) == upstream_calls
+    # Every session records the call; a session that joined another's call counts it as coalesced.
+    totals = [TOKEN_USAGE.thread_report(thread_id)["totals"] for thread_id in threads]
+    assert [total["calls"] for total in totals] == [1, 1]
+    assert sum(total["coalesced_calls"] for total in totals) == 2 - upstream_calls
@@ -0,0 +1,93 @@
+import pytest
+
+import utils.tokens as tokens
+from utils.tokens import TOKEN_ESTIMATOR, TRIM_MARKER, fit_to_budget
+
+TEMPLATE = (
+    "Document: {parsed_data}\nSummary: {approved_summary}\nFeatures: {approved_features}\n"
+    "Stack: {approved_tech_stack}\nFeedback: {user_feedback}\nInput: {user_input}\nEditing: {current_features}"
+)
+MODEL = "models/budget-test"
+
+
+def words(count, word="doc"):
+    # Short words estimate at one token each.
+    return " ".join([word] * count)
+
+
+@pytest.fixture
+def inputs():
+    return {
+        "parsed_data": words(400),
+        "approved_summary": words(200, "sum"),
+        "approved_features": words(200, "feat"),
+        "approved_tech_stack": words(200, "stack"),
+        "user_feedback": words(100, "note"),
+        "user_input": words(100, "input"),
+        "current_features": words(100, "edit"),
+    }
+
+
+def fit(inputs, budget, monkeypatch, stage="budget_test"):
+    monkeypatch.setitem(tokens.STAGE_TOKEN_BUDGETS, stage, budget)
+    return fit_to_budget(TEMPLATE, inputs, stage, MODEL)
+
+
+def total(inputs):
+    return TOKEN_ESTIMATOR.raw(TEMPLATE) + sum(TOKEN_ESTIMATOR.raw(value) for value in inputs.values())
+
+
+def test_a_prompt_within_budget_is_unchanged(inputs, monkeypatch):
+    fitted, estimate, raw, trimmed = fit(inputs, total(inputs), monkeypatch)
+
+    assert fitted == inputs
+    assert estimate == raw == total(inputs)
+    assert trimmed == 0
+
+
+def test_the_document_is_trimmed_before_approved_artifacts(inputs, monkeypatch):
+    fitted, estimate, _, trimmed = fit(inputs, total(inputs) - 100, monkeypatch)
+
+    assert fitted["parsed_data"].endswith(TRIM_MARKER)
+    for key in ("approved_summary", "approved_features", "approved_tech_stack"):
+        assert fitted[key] == inputs[key]
+    assert trimmed >= 100
+    assert estimate <= total(inputs) - 100
+
+
+def test_artifacts_are_trimmed_in_order_once_the_document_is_gone(inputs, monkeypatch):
+    # Past the whole document and the summary, into the features.
+    fitted, _, _, _ = fit(inputs, total(inputs) - 700, monkeypatch)
+
+    assert fitted["parsed_data"] == TRIM_MARKER.strip()
+    assert fitted["approved_summary"] == TRIM_MARKER.strip()
+    assert fitted["approved_features"].endswith(TRIM_MARKER)
+    assert fitted["approved_tech_stack"] == inputs["approved_tech_stack"]
+
+
+def test_feedback_input_and_the_edited_artifact_are_never_trimmed(inputs, monkeypatch):
+    fitted, estimate, _, _ = fit(inputs, 10, monkeypatch)
+
+    for key in ("user_feedback", "user_input", "current_features"):
+        assert fitted[key] == inputs[key]
+    for key in tokens.TRIM_PRIORITY:
+        assert fitted[key] == TRIM_MARKER.strip()
+    # What cannot be trimmed is still sent, over budget.
+    assert estimate > 10
+
+
+def test_only_variables_in_the_template_count(inputs, monkeypatch):
+    monkeypatch.setitem(tokens.STAGE_TOKEN_BUDGETS, "budget_test", 50)
+
+    fitted, estimate, _, trimmed = fit_to_budget("Input: {user_input}", inputs, "budget_test", MODEL)
+
+    assert trimmed == 0
+    assert fitted["parsed_data"] == inputs["parsed_data"]
+    assert estimate == TOKEN_ESTIMATOR.raw("Input: {user_input}") + TOKEN_ESTIMATOR.raw(inputs["user_input"])
+
+
+def test_a_zero_budget_disables_trimming(inputs, monkeypatch):
+    fitted, _, _, trimmed = fit(inputs, 0, monkeypatch)
+
+    assert fitted == inputs
+    assert trimmed == 0
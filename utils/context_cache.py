@@ -0,0 +1,207 @@
+import logging
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+from utils.models import MODEL_TIERS, STAGE_TIERS
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Stages whose prompts start with DOCUMENT_PREFIX.
+DOCUMENT_STAGES = ["initial_summary", "overview", "features", "tech_stack", "scope_of_work"]
+
+# Gemini rejects caches below ~1-4k tokens depending on the model.
+CONTEXT_CACHE_MIN_CHARS = int(os.getenv("CONTEXT_CACHE_MIN_CHARS", "16000"))
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", os.getenv("SESSION_TTL_SECONDS", "21600")))
+# Active sessions push their caches' expiry back at most this often. Each refresh sets the
+# TTL to CONTEXT_CACHE_TTL_SECONDS plus this interval, so a cache outlives its session's idle timeout.
+CONTEXT_CACHE_REFRESH_SECONDS = int(os.getenv("CONTEXT_CACHE_REFRESH_SECONDS", "300"))
+
+
+def _model_path(model: str) -> str:
+    return model if model.startswith("models/") else f"models/{model}"
+
+
+class ContextCacheBackend(ABC):
+    """Creates and deletes provider-side cached content. Subclass to swap providers."""
+
+    @abstractmethod
+    def create(self, model: str, text: str, ttl_seconds: int) -> str:
+        """Cache `text` for `model` and return the cached content's name."""
+
+    @abstractmethod
+    def extend(self, name: str, ttl_seconds: int):
+        """Set the cache to expire `ttl_seconds` from now."""
+
+    @abstractmethod
+    def delete(self, name: str):
+        """Delete the cache."""
+
+
+class GeminiContextCacheBackend(ContextCacheBackend):
+    """Gemini explicit context caching via the generativelanguage CacheService."""
+
+    def __init__(self):
+        self._client = None
+        self._lock = Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                from google.ai import generativelanguage_v1beta as glm
+
+                self._client = glm.CacheServiceClient(
+                    client_options={"api_key": os.getenv("GOOGLE_API_KEY")}
+                )
+            return self._client
+
+    def create(self, model: str, text: str, ttl_seconds: int) -> str:
+        from google.ai import generativelanguage_v1beta as glm
+
+        cached = self._get_client().create_cached_content(
+            cached_content=glm.CachedContent(
+                model=model,
+                contents=[glm.Content(role="user", parts=[glm.Part(text=text)])],
+                ttl={"seconds": ttl_seconds},
+            )
+        )
+        return cached.name
+
+    def extend(self, name: str, ttl_seconds: int):
+        from google.ai import generativelanguage_v1beta as glm
+        from google.protobuf import field_mask_pb2
+
+        self._get_client().update_cached_content(
+            cached_content=glm.CachedContent(name=name, ttl={"seconds": ttl_seconds}),
+            update_mask=field_mask_pb2.FieldMask(paths=["ttl"]),
+        )
+
+    def delete(self, name: str):
+        self._get_client().delete_cached_content(name=name)
+
+
+class InMemoryContextCacheBackend(ContextCacheBackend):
+    """Offline stand-in that keeps cached content in a dict."""
+
+    def __init__(self):
+        self.entries: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, model: str, text: str, ttl_seconds: int) -> str:
+        name = f"cachedContents/local-{uuid.uuid4().hex}"
+        self.entries[name] = {"model": model, "text": text, "expires_at": time.time() + ttl_seconds}
+        return name
+
+    def extend(self, name: str, ttl_seconds: int):
+        if name not in self.entries:
+            raise KeyError(f"{name} not found")
+        self.entries[name]["expires_at"] = time.time() + ttl_seconds
+
+    def delete(self, name: str):
+        self.entries.pop(name, None)
+
+
+def _default_backend() -> ContextCacheBackend | None:
+    mode = os.getenv("LLM_CONTEXT_CACHE", "gemini").lower()
+    if mode == "gemini":
+        return GeminiContextCacheBackend()
+    if mode == "memory":
+        return InMemoryContextCacheBackend()
+    return None
+
+
+_backend = _default_backend()
+
+# Forked sessions share their parent's caches; a cache is deleted when its last holder releases it.
+_refcounts: Dict[str, int] = {}
+# Cache name -> time.monotonic() of its creation or last refresh.
+_refreshed_at: Dict[str, float] = {}
+_refcounts_lock = Lock()
+
+
+def _cache_ttl() -> int:
+    return CONTEXT_CACHE_TTL_SECONDS + CONTEXT_CACHE_REFRESH_SECONDS
+
+
+def set_context_cache_backend(backend: ContextCacheBackend | None):
+    """Replace the cache backend, e.g. with an in-memory one for offline runs. None disables caching."""
+    global _backend
+    _backend = backend
+
+
+def create_document_cache(document: str) -> Dict[str, str]:
+    """
+    Cache the rendered document prefix once per model used by the
+    document-bearing stages. Returns a {model: cached_content_name} map,
+    empty when caching is disabled, the document is too small, or creation fails.
+    """
+    if _backend is None or len(document) < CONTEXT_CACHE_MIN_CHARS:
+        return {}
+
+    from utils.prompts import DOCUMENT_PREFIX
+
+    text = DOCUMENT_PREFIX.replace("{parsed_data}", document)
+    models = {_model_path(MODEL_TIERS[STAGE_TIERS[stage]]["model"]) for stage in DOCUMENT_STAGES}
+
+    handles: Dict[str, str] = {}
+    for model in sorted(models):
+        try:
+            handles[model] = _backend.create(model, text, _cache_ttl())
+            with _refcounts_lock:
+                _refcounts[handles[model]] = 1
+                _refreshed_at[handles[model]] = time.monotonic()
+            logger.info(f"Created context cache {handles[model]} for {model}")
+        except Exception as e:
+            logger.warning(f"Context cache creation failed for {model}; prompts will inline the document: {e}")
+    return handles
+
+
+def retain_document_cache(handles: Dict[str, str] | None):
+    """Register another holder of existing cache handles, e.g. a forked session."""
+    with _refcounts_lock:
+        for name in (handles or {}).values():
+            _refcounts[name] = _refcounts.get(name, 1) + 1
+
+
+def refresh_document_cache(handles: Dict[str, str] | None):
+    """
+    Push back the expiry of a session's caches when it runs a turn. Caches
+    would otherwise expire a fixed time after creation while sessions are
+    evicted only after going idle, leaving long sessions on expired caches.
+    """
+    if not handles or _backend is None:
+        return
+    now = time.monotonic()
+    for model, name in handles.items():
+        with _refcounts_lock:
+            if now - _refreshed_at.get(name, float("-inf")) < CONTEXT_CACHE_REFRESH_SECONDS:
+                continue
+            _refreshed_at[name] = now
+        try:
+            _backend.extend(name, _cache_ttl())
+            logger.info(f"Extended context cache {name} for {model} by {_cache_ttl()}s")
+        except Exception as e:
+            logger.warning(f"Failed to extend context cache {name}: {e}")
+
+
+def release_document_cache(handles: Dict[str, str] | None):
+    if not handles or _backend is None:
+        return
+    for model, name in handles.items():
+        with _refcounts_lock:
+            remaining = _refcounts.get(name, 1) - 1
+            if remaining > 0:
+                _refcounts[name] = remaining
+                continue
+            _refcounts.pop(name, None)
+            _refreshed_at.pop(name, None)
+        try:
+            _backend.delete(name)
+            logger.info(f"Released context cache {name} for {model}")
+        except Exception as e:
+            logger.warning(f"Failed to release context cache {name}: {e}")
@@ -0,0 +1,251 @@
+import gc
+import hmac
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from threading import Event, Lock, Thread
+from types import FunctionType, ModuleType
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# "off" reports only sizes; "trace" keeps tracemalloc on from startup (noticeable
+# CPU and memory overhead, for debugging); "sample" traces one short window per
+# interval, so the overhead applies a small fraction of the time.
+MEMORY_DIAGNOSTICS = os.getenv("MEMORY_DIAGNOSTICS", "off").lower()
+# The report endpoint exists only when a token is set; send it as X-Diagnostics-Token.
+MEMORY_DIAGNOSTICS_TOKEN = os.getenv("MEMORY_DIAGNOSTICS_TOKEN", "")
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "10"))
+MEMORY_SAMPLE_FRAMES = int(os.getenv("MEMORY_SAMPLE_FRAMES", "1"))
+MEMORY_SAMPLE_WINDOW_SECONDS = float(os.getenv("MEMORY_SAMPLE_WINDOW_SECONDS", "30"))
+MEMORY_SAMPLE_INTERVAL_SECONDS = float(os.getenv("MEMORY_SAMPLE_INTERVAL_SECONDS", "600"))
+
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def authorized(token: str | None) -> bool:
+    return bool(MEMORY_DIAGNOSTICS_TOKEN and token) and hmac.compare_digest(token, MEMORY_DIAGNOSTICS_TOKEN)
+
+
+def deep_sizeof(obj: Any, seen: set | None = None) -> int:
+    """
+    Approximate bytes reachable from `obj` through containers and instance
+    attributes. Modules, classes and functions are not followed, and objects
+    already in `seen` are not counted again.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, (type, ModuleType, FunctionType)):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, "__dict__"):
+            stack.append(vars(current))
+    return total
+
+
+def process_rss_bytes() -> int | None:
+    """Resident set size of this process, from /proc where available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _site(trace: tracemalloc.Traceback) -> str:
+    frame = trace[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+class MemoryDiagnostics:
+    """
+    tracemalloc snapshots for the diagnostics report.
+
+    In trace mode each report takes a snapshot and compares it with the one
+    before. In sample mode a background thread turns tracing on for one
+    window per interval and keeps the snapshot taken as the window closes:
+    it holds the allocations made during the window that were still alive
+    at its end, so sites that grow window after window are leak candidates.
+    """
+
+    def __init__(
+        self,
+        mode: str = MEMORY_DIAGNOSTICS,
+        trace_frames: int = MEMORY_TRACE_FRAMES,
+        sample_frames: int = MEMORY_SAMPLE_FRAMES,
+        window_seconds: float = MEMORY_SAMPLE_WINDOW_SECONDS,
+        interval_seconds: float = MEMORY_SAMPLE_INTERVAL_SECONDS,
+    ):
+        self.mode = mode if mode in ("off", "trace", "sample") else "off"
+        self.trace_frames = trace_frames
+        self.sample_frames = sample_frames
+        self.window_seconds = window_seconds
+        self.interval_seconds = interval_seconds
+        self._lock = Lock()
+        self._stopping = Event()
+        self._thread: Thread | None = None
+        self._started_tracing = False
+        self._latest: Tuple[float, tracemalloc.Snapshot] | None = None
+        self._previous: Tuple[float, tracemalloc.Snapshot] | None = None
+        self.samples = 0
+
+    def start(self):
+        if self.mode == "trace" and not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self._started_tracing = True
+            logger.info(f"Memory tracing on ({self.trace_frames} frames)")
+        elif self.mode == "sample" and self._thread is None:
+            self._stopping.clear()
+            self._thread = Thread(target=self._sample_loop, name="memory-sampler", daemon=True)
+            self._thread.start()
+            logger.info(
+                f"Memory sampling on: {self.window_seconds:.0f}s window every {self.interval_seconds:.0f}s"
+            )
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _sample_loop(self):
+        while not self._stopping.wait(self.interval_seconds):
+            # Tracing someone else started (e.g. PYTHONTRACEMALLOC) is left running.
+            owned = not tracemalloc.is_tracing()
+            if owned:
+                tracemalloc.start(self.sample_frames)
+            try:
+                if self._stopping.wait(self.window_seconds):
+                    return
+                self._store(tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS))
+            finally:
+                if owned:
+                    tracemalloc.stop()
+
+    def _store(self, snapshot: tracemalloc.Snapshot):
+        with self._lock:
+            self._previous, self._latest = self._latest, (time.time(), snapshot)
+            self.samples += 1
+
+    def report(self, top: int = 20) -> Dict[str, Any]:
+        """Top allocation sites of the newest snapshot and the sites that grew most since the one before."""
+        if self.mode == "off":
+            return {"mode": "off"}
+        if self.mode == "trace":
+            if not tracemalloc.is_tracing():
+                return {"mode": "trace", "tracing": False}
+            self._store(tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS))
+
+        with self._lock:
+            latest, previous, samples = self._latest, self._previous, self.samples
+        report: Dict[str, Any] = {
+            "mode": self.mode,
+            "tracing": tracemalloc.is_tracing(),
+            "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+            "snapshots": samples,
+        }
+        if self.mode == "sample":
+            report["window_seconds"] = self.window_seconds
+            report["interval_seconds"] = self.interval_seconds
+        if latest is None:
+            return report
+
+        taken_at, snapshot = latest
+        report["snapshot_at"] = taken_at
+        report["traced_bytes"] = sum(stat.size for stat in snapshot.statistics("filename"))
+        report["top_sites"] = [
+            {"site": _site(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+            for stat in snapshot.statistics("lineno")[:top]
+        ]
+        if previous is not None:
+            report["growth_since"] = previous[0]
+            report["growth"] = [
+                {"site": _site(stat.traceback), "bytes": stat.size_diff, "blocks": stat.count_diff}
+                for stat in snapshot.compare_to(previous[1], "lineno")[:top]
+                if stat.size_diff > 0
+            ]
+        return report
+
+
+MEMORY_DIAGNOSTICS_SAMPLER = MemoryDiagnostics()
+
+
+def session_footprints(checkpointer=None, limit: int = 20) -> Dict[str, Any]:
+    """
+    Approximate bytes held per session: its record (messages included), its
+    thread's checkpoints and its retrieval index. Forks share history,
+    checkpoint bytes and indexes with their parent, so shared bytes count
+    toward each session that uses them.
+    """
+    from utils.helper import sessions, session_lock
+    from utils.retrieval import get_session_index
+
+    with session_lock:
+        records = list(sessions.items())
+
+    checkpoints: Dict[str, Dict[str, int]] = {}
+    if checkpointer is not None:
+        from src.checkpoints import checkpoint_footprint
+
+        checkpoints = checkpoint_footprint(checkpointer)
+
+    rows: List[Dict[str, Any]] = []
+    for session_id, session in records:
+        thread = checkpoints.get(session["thread_id"], {"checkpoints": 0, "bytes": 0})
+        index = get_session_index(session["thread_id"])
+        row = {
+            "session_id": session_id,
+            "record_bytes": deep_sizeof(session),
+            "messages": len(session["messages"]),
+            "checkpoints": thread["checkpoints"],
+            "checkpoint_bytes": thread["bytes"],
+            "index_bytes": deep_sizeof(index) if index is not None else 0,
+        }
+        row["total_bytes"] = row["record_bytes"] + row["checkpoint_bytes"] + row["index_bytes"]
+        rows.append(row)
+    rows.sort(key=lambda row: row["total_bytes"], reverse=True)
+
+    session_threads = {session["thread_id"] for _, session in records}
+    return {
+        "count": len(rows),
+        "record_bytes": sum(row["record_bytes"] for row in rows),
+        "index_bytes": sum(row["index_bytes"] for row in rows),
+        "checkpoint_threads": len(checkpoints),
+        "checkpoints": sum(thread["checkpoints"] for thread in checkpoints.values()),
+        "checkpoint_bytes": sum(thread["bytes"] for thread in checkpoints.values()),
+        # Checkpoint threads no session points at, e.g. left behind by an evicted session.
+        "orphaned_checkpoint_threads": len(checkpoints.keys() - session_threads),
+        "largest": rows[:limit],
+    }
+
+
+def memory_report(checkpointer=None, top: int = 20, limit: int = 20) -> Dict[str, Any]:
+    return {
+        "rss_bytes": process_rss_bytes(),
+        "gc_objects": len(gc.get_objects()),
+        "allocations": MEMORY_DIAGNOSTICS_SAMPLER.report(top),
+        "sessions": session_footprints(checkpointer, limit),
+    }
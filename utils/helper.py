@@ -1,18 +1,30 @@
 
-from langchain_community.document_loaders.blob_loaders import Blob
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Tuple
 import os
 import tempfile
 from dotenv import load_dotenv
-from typing import List
-from llama_index.core import Document as LlamaDocument
-from llama_parse import LlamaParse
 from threading import Lock
 import uuid
+import hashlib
 import time
 from functools import wraps
 import logging
-from langchain_google_genai import ChatGoogleGenerativeAI
+from utils.rate_limiter import LLM_RATE_LIMITER
+from utils.singleflight import SingleFlight
+from utils.models import get_llm, tier_for_stage, TIER_ORDER, next_tier, STAGE_LATENCY
+from utils.transport import PARSE_TRANSPORT
+from utils.tokens import TOKEN_ESTIMATOR, TOKEN_USAGE, budget_for_stage, fit_to_budget, output_budget_for_stage
+from utils.resilience import (
+    AttemptDeadline,
+    LLM_RESILIENCE,
+    PARSE_RESILIENCE,
+    LLM_HEDGE_STAGES,
+    LLM_HEDGE_QUANTILE,
+    LLM_HEDGE_MIN_SAMPLES,
+)
+import json
+import re
+from utils.schemas import Feature, artifact_json
 
 logger = logging.getLogger(__name__)
 
@@ -21,12 +33,23 @@ load_dotenv()
 
 sessions: Dict[str, Dict[str, Any]] = {}
 session_lock = Lock()
+llm_flights = SingleFlight("llm")
 
-LLM = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    # api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.4
-)
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "21600"))
+# Stream JSON stages and stop reading once the top-level object is complete.
+LLM_EARLY_STOP = os.getenv("LLM_EARLY_STOP", "true").lower() == "true"
+# Stages whose identical in-flight calls share one upstream call. Their prompts are pure
+# functions of the rendered text (document, approved artifacts, the user's input), so any
+# caller with the same text may take the result. Edit and final-adjustment stages rewrite
+# one session's artifact and are left out; duplicate submits there are merged per request.
+LLM_COALESCE_STAGES = {
+    stage.strip()
+    for stage in os.getenv(
+        "LLM_COALESCE_STAGES", "router,initial_summary,overview,features,tech_stack,scope_of_work"
+    ).split(",")
+    if stage.strip()
+}
+session_eviction_hooks: List[Callable[[str, Dict[str, Any]], None]] = []
 
 def time_logger(func):
     """A decorator that logs the execution time of a synchronous function."""
@@ -62,7 +85,247 @@ def async_time_logger(func):
     return wrapper
 
 
+def strip_json_fences(raw: str) -> str:
+    raw = raw.strip()
+    if raw.startswith("```json") or raw.startswith("```"):
+        raw = re.sub(r"^```(?:json)?\s*|\s*```$", "", raw)
+    return raw
+
+
+def is_valid_json_output(raw: str) -> bool:
+    try:
+        json.loads(strip_json_fences(raw))
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+class JsonObjectScanner:
+    """
+    Follows streamed text and reports where the first top-level JSON object
+    closes. Brackets inside strings are skipped. Text before the opening
+    brace, such as a code fence or a note like "[draft]", is ignored: every
+    JSON prompt asks for an object, so only a brace starts the value.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> int | None:
+        """Offset just past the closing bracket within `text`, or None while the value is still open."""
+        for offset, char in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif self.depth == 0:
+                if char == "{":
+                    self.depth = 1
+            elif char in "{[":
+                self.depth += 1
+            elif char == '"':
+                self.in_string = True
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return offset + 1
+        return None
+
+
+def stream_json_object(llm, messages, **kwargs):
+    """
+    Stream a completion and stop reading as soon as its JSON value is
+    complete, which closes the upstream stream instead of paying for
+    whatever the model would write after it. The returned message holds the
+    text up to the closing bracket; response_metadata["early_stopped"] is set
+    when the stream was cut before the model finished.
+    """
+    from langchain_core.messages import AIMessageChunk
+
+    scanner = JsonObjectScanner()
+    output = None
+    text = ""
+    chunks = llm.stream(messages, **kwargs)
+    try:
+        for chunk in chunks:
+            output = chunk if output is None else output + chunk
+            piece = chunk.content if isinstance(chunk.content, str) else ""
+            end = scanner.feed(piece)
+            if end is not None:
+                output.content = text + piece[:end]
+                if not chunk.response_metadata.get("finish_reason"):
+                    output.response_metadata["early_stopped"] = True
+                break
+            text += piece
+    finally:
+        chunks.close()
+    return output if output is not None else AIMessageChunk(content="")
+
+
+def _invoke_model(
+    template: str,
+    inputs: Dict[str, Any],
+    tier: str,
+    stage: str,
+    priority: str,
+    context_cache: Dict[str, str] | None,
+    thread_id: str | None = None,
+    expect_json: bool = False,
+    concise: bool = False,
+):
+    from langchain.prompts import ChatPromptTemplate
+    from utils.prompts import DOCUMENT_PREFIX, CONCISE_INSTRUCTION
+
+    llm = get_llm(tier)
+
+    # With a provider cache for this model, send only the stage-specific suffix.
+    cached_content = (context_cache or {}).get(llm.model)
+    if cached_content and template.startswith(DOCUMENT_PREFIX):
+        prompt_template = template[len(DOCUMENT_PREFIX):]
+    else:
+        cached_content = None
+        prompt_template = template
+    if concise:
+        prompt_template += CONCISE_INSTRUCTION
+
+    call_options: Dict[str, Any] = {}
+    if cached_content:
+        call_options["cached_content"] = cached_content
+    max_output_tokens = output_budget_for_stage(stage, concise)
+    if max_output_tokens:
+        call_options["generation_config"] = {"max_output_tokens": max_output_tokens}
+
+    # Estimate locally and trim low-priority context before anything is sent or billed.
+    fitted_inputs, estimated_tokens, raw_estimate, trimmed_tokens = fit_to_budget(
+        prompt_template, inputs, stage, llm.model
+    )
+    messages = ChatPromptTemplate.from_template(prompt_template).format_messages(**fitted_inputs)
+    rendered = "\n".join(str(message.content) for message in messages)
+
+    # Identical in-flight prompts against the same model share one upstream call. The key
+    # covers everything the model sees, including the provider cache and output cap.
+    key = hashlib.sha256(
+        f"{llm.model}:{llm.temperature}:{cached_content}:{max_output_tokens}\n{rendered}".encode("utf-8")
+    ).hexdigest()
+
+    def attempt(deadline: AttemptDeadline):
+        with LLM_RATE_LIMITER.slot(estimated_tokens, priority=priority):
+            # The slot may free up after the caller has given up; then nothing is sent.
+            timeout = deadline.start()
+            start_time = time.time()
+            if expect_json and LLM_EARLY_STOP:
+                output = stream_json_object(llm, messages, timeout=timeout, **call_options)
+            else:
+                output = llm.invoke(messages, timeout=timeout, **call_options)
+            STAGE_LATENCY.record(stage, llm.model, time.time() - start_time)
+            return output
+
+    hedge_delay = None
+    if stage in LLM_HEDGE_STAGES:
+        hedge_delay = STAGE_LATENCY.percentile(stage, llm.model, LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_SAMPLES)
+
+    def call():
+        return LLM_RESILIENCE.call(attempt, stage=stage, hedge_delay=hedge_delay)
+
+    try:
+        if stage in LLM_COALESCE_STAGES:
+            output, coalesced = llm_flights.do_shared(key, call)
+        else:
+            output, coalesced = call(), False
+    except Exception as e:
+        if not cached_content:
+            raise
+        logger.warning(f"Cached context {cached_content} failed for stage '{stage}', retrying inline: {e}")
+        return _invoke_model(template, inputs, tier, stage, priority, None, thread_id, expect_json, concise)
+
+    truncated = output.response_metadata.get("finish_reason") == "MAX_TOKENS"
+    if truncated:
+        logger.warning(f"Stage '{stage}' output hit its cap of {max_output_tokens} tokens on {llm.model}")
+
+    usage = getattr(output, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens") or estimated_tokens
+    if usage.get("input_tokens") and not cached_content:
+        # Cached prompts bill the cached prefix too, so only inline prompts calibrate the estimator.
+        TOKEN_ESTIMATOR.calibrate(llm.model, raw_estimate, usage["input_tokens"])
+    budget = budget_for_stage(stage)
+    # Every caller records the call under its own thread, including callers that joined
+    # another's call; those are also counted as coalesced, since only the first was billed.
+    TOKEN_USAGE.record(
+        stage,
+        thread_id,
+        estimated_input_tokens=estimated_tokens,
+        input_tokens=input_tokens,
+        output_tokens=usage.get("output_tokens") or TOKEN_ESTIMATOR.estimate(str(output.content), llm.model),
+        trimmed_tokens=trimmed_tokens,
+        over_budget=bool(budget) and estimated_tokens > budget,
+        early_stopped=bool(output.response_metadata.get("early_stopped")),
+        truncated=truncated,
+        coalesced=coalesced,
+    )
+    return output
+
+
+def invoke_llm(
+    template: str,
+    inputs: Dict[str, Any],
+    stage: str,
+    priority: str = "interactive",
+    expect_json: bool = True,
+    context_cache: Dict[str, str] | None = None,
+    thread_id: str | None = None,
+    concise: bool = False,
+):
+    """
+    Render a prompt template and invoke the model configured for `stage`.
+    Output is capped at the stage's output budget. When `expect_json` is set,
+    the response is streamed and cut once its JSON object is complete, and
+    output that does not parse is retried on the next stronger tier.
+    `context_cache` maps model names to provider cache handles holding the
+    document prefix. `concise` asks for short answers under tighter caps.
+    Token usage is recorded for the stage and, when given, the session's
+    `thread_id`.
+    """
+    tier = tier_for_stage(stage)
+    output = _invoke_model(template, inputs, tier, stage, priority, context_cache, thread_id, expect_json, concise)
+
+    while expect_json and not is_valid_json_output(output.content):
+        stronger = next_tier(tier)
+        if stronger is None:
+            break
+        logger.warning(f"Stage '{stage}' returned invalid JSON on tier '{tier}'; escalating to '{stronger}'.")
+        STAGE_LATENCY.record_escalation(stage)
+        tier = stronger
+        output = _invoke_model(template, inputs, tier, stage, priority, context_cache, thread_id, expect_json, concise)
+
+    return output
+
+
+def warm_up_clients():
+    """
+    Build the LLM clients and open their channels, import the parser and fill
+    its connection pool ahead of the first request.
+    """
+    for tier in TIER_ORDER:
+        try:
+            llm = get_llm(tier)
+            # A token count opens the client's gRPC channel (TLS + HTTP/2) without a billed generation.
+            llm.get_num_tokens("ping")
+        except Exception as e:
+            logger.warning(f"Could not warm up LLM client for tier '{tier}': {e}")
+    import llama_parse  # noqa: F401
+
+    PARSE_TRANSPORT.warm()
+
+
 def parse_file(file_bytes: bytes, filename: str) -> str:
+    from llama_parse import LlamaParse
+
+    PARSE_TRANSPORT.start()
     api_key = os.getenv("PARSE_KEY")
     if not api_key:
         raise EnvironmentError("PARSE_KEY not found")
@@ -73,8 +336,18 @@ def parse_file(file_bytes: bytes, filename: str) -> str:
             tmp.write(file_bytes)
             tmp_path = tmp.name
         
-        parser = LlamaParse(api_key=api_key, result_type="text")
-        documents: List[LlamaDocument] = parser.load_data([tmp_path])
+        def attempt(deadline: AttemptDeadline):
+            timeout = deadline.start()
+            # LlamaParse sets its base URL and auth header on the shared client; both are the same for every call.
+            parser = LlamaParse(
+                api_key=api_key,
+                result_type="text",
+                max_timeout=max(int(timeout), 1),
+                custom_client=PARSE_TRANSPORT.client,
+            )
+            return PARSE_TRANSPORT.run(parser.aload_data([tmp_path]), timeout=timeout)
+
+        documents = PARSE_RESILIENCE.call(attempt, stage="parse")
         
         return "\n\n".join(doc.text for doc in documents)
     
@@ -84,6 +357,11 @@ def parse_file(file_bytes: bytes, filename: str) -> str:
 
 
 
+def document_addition(documents: List[Tuple[str, str]]) -> str:
+    """Text appended to a session's document for added (file name, parsed text) pairs, each under its name."""
+    return "".join(f"\n\n[Document: {name}]\n\n{text.strip()}" for name, text in documents)
+
+
 def get_session(session_id: str) -> Dict[str, Any]:
     """Get or create a session"""
     with session_lock:
@@ -92,8 +370,16 @@ def get_session(session_id: str) -> Dict[str, Any]:
                 "thread_id": str(uuid.uuid4()),
                 "workflow_active": False,
                 "workflow_completed": False,
-                "current_state": None
+                "current_stage": None,
+                "context_cache": {},
+                "name": None,
+                "type": None,
+                "file_name": None,
+                "concise": False,
+                "messages": [],
+                "updated_at": time.time(),
             }
+        sessions[session_id]["last_active"] = time.time()
         return sessions[session_id]
 
 
@@ -104,19 +390,216 @@ def update_session(session_id: str, updates: Dict[str, Any]):
             sessions[session_id].update(updates)
 
 
+def append_session_message(
+    session_id: str,
+    role: str,
+    content: str,
+    current_stage: str | None = None,
+    follow_up_question: str | None = None,
+    checkpoint_id: str | None = None,
+    action: str | None = None,
+    restores_seq: int | None = None,
+) -> Dict[str, Any] | None:
+    """
+    Append a message to the session history. `seq` starts at 1 and never
+    repeats. Assistant messages carry the checkpoint the reply was read from;
+    replies produced by reset/back/undo also record the action and the seq of
+    the reply whose checkpoint they restored.
+    """
+    with session_lock:
+        session = sessions.get(session_id)
+        if session is None:
+            return None
+        history = session["messages"]
+        message = {
+            "seq": len(history) + 1,
+            "role": role,
+            "content": content,
+            "current_stage": current_stage,
+            "follow_up_question": follow_up_question,
+            "checkpoint_id": checkpoint_id,
+            "action": action,
+            "restores_seq": restores_seq,
+            "created_at": time.time(),
+        }
+        history.append(message)
+        session["updated_at"] = message["created_at"]
+        return message
+
+
+def restore_target(session_id: str, action: str, stage: str | None = None) -> Dict[str, Any] | None:
+    """
+    The earlier reply whose checkpoint a time-travel action restores, or None:
+    - "reset": the first reply
+    - "back": the latest reply at `stage`
+    - "undo": the reply before the latest one. After an undo it continues
+      from the reply that undo restored, so repeated undos keep walking back.
+    """
+    with session_lock:
+        session = sessions.get(session_id)
+        if session is None:
+            return None
+        replies = [m for m in session["messages"] if m["role"] == "assistant" and m.get("checkpoint_id")]
+    if not replies:
+        return None
+    if action == "reset":
+        return replies[0]
+    if action == "back":
+        return next((m for m in reversed(replies) if m["current_stage"] == stage), None)
+
+    position = replies[-1]
+    if position.get("action") == "undo":
+        position = next(m for m in replies if m["seq"] == position["restores_seq"])
+    earlier = [m for m in replies if m["seq"] < position["seq"]]
+    return earlier[-1] if earlier else None
+
+
+def retained_checkpoint_ids(session_id: str, turns: int) -> List[str]:
+    """Checkpoints worth keeping for time travel: the first reply's and those of the last `turns` replies."""
+    with session_lock:
+        session = sessions.get(session_id)
+        if session is None:
+            return []
+        ids = [m["checkpoint_id"] for m in session["messages"] if m["role"] == "assistant" and m.get("checkpoint_id")]
+    return ids[:1] + ids[-turns:]
+
+
+def share_session_history(source_id: str, target_id: str, until_checkpoint_id: str | None = None) -> int:
+    """
+    Give the target session the source's messages, up to and including the
+    reply for `until_checkpoint_id` when given. Message dicts are never
+    modified after they are appended, so they are shared rather than copied.
+    Returns the number of messages shared.
+    """
+    with session_lock:
+        source, target = sessions.get(source_id), sessions.get(target_id)
+        if source is None or target is None:
+            return 0
+        history = source["messages"]
+        if until_checkpoint_id:
+            cut = next(
+                (i + 1 for i, message in enumerate(history) if message.get("checkpoint_id") == until_checkpoint_id),
+                len(history),
+            )
+            history = history[:cut]
+        target["messages"] = list(history)
+        target["updated_at"] = time.time()
+        return len(history)
+
+
+def summarize_session(session_id: str, session: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": session_id,
+        "name": session.get("name") or "New Chat",
+        "type": session.get("type") or "chat",
+        "file_name": session.get("file_name"),
+        "current_stage": session.get("current_stage"),
+        "message_count": len(session["messages"]),
+        "updated_at": session["updated_at"],
+    }
+
+
+def list_sessions(offset: int = 0, limit: int = 20) -> Tuple[List[Dict[str, Any]], int]:
+    """Sessions with history, most recently updated first. Returns (page, total)."""
+    with session_lock:
+        summaries = [
+            summarize_session(session_id, session)
+            for session_id, session in sessions.items()
+            if session["messages"]
+        ]
+    summaries.sort(key=lambda summary: summary["updated_at"], reverse=True)
+    return summaries[offset:offset + limit], len(summaries)
+
+
+def peek_session(session_id: str) -> Dict[str, Any] | None:
+    """Summary plus workflow fields, without creating the session or marking it active."""
+    with session_lock:
+        session = sessions.get(session_id)
+        if session is None:
+            return None
+        return {
+            **summarize_session(session_id, session),
+            "thread_id": session["thread_id"],
+            "workflow_active": session["workflow_active"],
+            "workflow_completed": session["workflow_completed"],
+            "concise": session["concise"],
+        }
+
+
+def get_session_messages(session_id: str, after: int = 0, limit: int = 50) -> Tuple[List[Dict[str, Any]], int] | None:
+    """Messages with seq > `after`, oldest first. Returns (page, latest seq), or None for an unknown session."""
+    with session_lock:
+        session = sessions.get(session_id)
+        if session is None:
+            return None
+        history = session["messages"]
+        return [dict(message) for message in history[after:after + limit]], len(history)
+
+
+def register_session_eviction_hook(hook: Callable[[str, Dict[str, Any]], None]):
+    """Register a callback that releases per-session resources when a session is evicted."""
+    session_eviction_hooks.append(hook)
+
+
+def evict_session(session_id: str):
+    with session_lock:
+        session = sessions.pop(session_id, None)
+    if session is None:
+        return
+    logger.info(f"Evicting session {session_id}")
+    for hook in session_eviction_hooks:
+        try:
+            hook(session_id, session)
+        except Exception as e:
+            logger.error(f"Session eviction hook failed for {session_id}: {e}", exc_info=True)
+
+
+def evict_idle_sessions() -> int:
+    """Evict sessions idle for longer than SESSION_TTL_SECONDS. Returns the number evicted."""
+    cutoff = time.time() - SESSION_TTL_SECONDS
+    with session_lock:
+        idle = [sid for sid, session in sessions.items() if session.get("last_active", 0) < cutoff]
+    for session_id in idle:
+        evict_session(session_id)
+    return len(idle)
+
+
+def format_features(features: List[Any] | str) -> str:
+    if isinstance(features, list):
+        return "\n".join(f"- {Feature.model_validate(f)}" for f in features)
+    return features
+
+
+def render_stage_value(value: Any) -> str:
+    """
+    Render a stage artifact as text. State keeps artifacts structured; this
+    is where they are serialized, for API responses and prompt inputs.
+    """
+    if isinstance(value, list):
+        return format_features(value)
+    value = artifact_json(value)
+    if isinstance(value, dict):
+        return json.dumps(value, indent=2)
+    return value
+
+
+# Workflow stage -> state field holding that stage's output.
+STAGE_CONTENT_KEYS = {
+    "initial_summary": "initial_summary",
+    "overview": "overview",
+    "features": "extracted_features",
+    "tech_stack": "tech_stack",
+    "scope_of_work": "scope_of_work",
+    "final_review": "final_adjustment_response" 
+}
+
+
 def get_stage_content(state_values: Dict[str, Any], current_stage: str) -> Dict[str, Any]:
     """Extract content and follow-up questions separately."""
-    stage_content_map = {
-        "initial_summary": "initial_summary",
-        "overview": "overview",
-        "features": "extracted_features",
-        "tech_stack": "tech_stack",
-        "scope_of_work": "scope_of_work",
-        "final_review": "final_adjustment_response" 
-    }
-    
-    content_key = stage_content_map.get(current_stage, "initial_summary")
-    main_content = state_values.get(content_key, f"Error: No content generated for stage {current_stage}")
+    content_key = STAGE_CONTENT_KEYS.get(current_stage, "initial_summary")
+    main_content = render_stage_value(
+        state_values.get(content_key, f"Error: No content generated for stage {current_stage}")
+    )
     follow_up = state_values.get("follow_up_questions", "")
     
     logger.info(f"Retrieved content for '{current_stage}' from key '{content_key}'.")
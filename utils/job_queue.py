@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from threading import Lock
+from typing import Any, Dict, Iterable, List
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from utils.schemas import artifact_json
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Set to a file path (e.g. jobs.sqlite3) to run parsing and graph steps on worker processes.
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "")
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+# Job kinds run by workers. "turn" rows track a whole request for clients and are never claimed.
+WORKER_KINDS = ("parse", "graph")
+FINISHED_STATUSES = ("succeeded", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    session_id TEXT,
+    status TEXT NOT NULL,
+    payload TEXT,
+    data BLOB,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 1,
+    worker TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, kind, created_at);
+"""
+
+
+def _json_default(value: Any) -> Any:
+    # Graph state carries structured artifacts (utils.schemas) as models.
+    if isinstance(value, BaseModel):
+        return artifact_json(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class JobQueue:
+    """
+    Durable job queue in a local SQLite file (WAL mode), shared by the API
+    and worker processes on one host.
+
+    Workers claim a job by taking a lease. A running worker extends its lease
+    with `heartbeat`. If a worker dies, the lease expires and another worker
+    picks the job up again, up to `max_attempts` claims. After that the job
+    is marked failed.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = JOB_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _row(self, row: sqlite3.Row | None) -> Dict[str, Any] | None:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ("payload", "result", "error"):
+            job[field] = json.loads(job[field]) if job[field] is not None else None
+        return job
+
+    def submit(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        session_id: str | None = None,
+        data: bytes | None = None,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+    ) -> str:
+        """Queue a job for the workers. `data` carries binary input such as an uploaded file."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, session_id, status, payload, data, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, session_id, json.dumps(payload, default=_json_default), data, max_attempts, now, now),
+            )
+        return job_id
+
+    def create_turn(self, session_id: str) -> str:
+        """Record a request the API is handling, so any replica can report its status."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, session_id, status, created_at, updated_at) "
+                "VALUES (?, 'turn', ?, 'running', ?, ?)",
+                (job_id, session_id, now, now),
+            )
+        return job_id
+
+    def claim(self, worker: str, kinds: Iterable[str] = WORKER_KINDS) -> Dict[str, Any] | None:
+        """Lease the oldest runnable job of the given kinds, or return None when there is none."""
+        kinds = list(kinds)
+        marks = ",".join("?" * len(kinds))
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    f"UPDATE jobs SET status = 'failed', error = ?, updated_at = ? "
+                    f"WHERE kind IN ({marks}) AND status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                    (json.dumps({"status_code": 500, "detail": "Worker stopped before finishing the job."}), now, *kinds, now),
+                )
+                row = self._conn.execute(
+                    f"SELECT * FROM jobs WHERE kind IN ({marks}) "
+                    f"AND (status = 'queued' OR (status = 'running' AND lease_until < ?)) "
+                    f"ORDER BY created_at LIMIT 1",
+                    (*kinds, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                        "lease_until = ?, updated_at = ? WHERE id = ?",
+                        (worker, now + self.lease_seconds, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        if row["attempts"]:
+            logger.warning(f"Re-running job {row['id']} ({row['kind']}) after an expired lease")
+        return self._row(row)
+
+    def heartbeat(self, job_id: str, worker: str) -> bool:
+        """Extend a running job's lease. Returns False if the job is no longer this worker's."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, time.time(), job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, result: Any, worker: str | None = None) -> bool:
+        """
+        Record a job's result. Only the worker holding the lease (or, for
+        turn rows, the API with no worker) can finish a job; returns False
+        when the job was re-claimed or already finished, and the result is dropped.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, data = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND worker IS ? AND status = 'running'",
+                (json.dumps(result, default=_json_default), time.time(), job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, error: Dict[str, Any], worker: str | None = None) -> bool:
+        """Record a job's error, under the same lease rule as `complete`."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, data = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND worker IS ? AND status = 'running'",
+                (json.dumps(error), time.time(), job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, session_id, status, result, error, attempts, created_at, updated_at, "
+                "NULL AS payload FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        return self._row(row)
+
+    def purge(self, older_than_seconds: float = JOB_RETENTION_SECONDS) -> int:
+        """Delete finished jobs last updated more than `older_than_seconds` ago."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            rows: List[sqlite3.Row] = self._conn.execute(
+                "SELECT kind, status, COUNT(*) AS count FROM jobs GROUP BY kind, status"
+            ).fetchall()
+        stats: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            stats.setdefault(row["kind"], {})[row["status"]] = row["count"]
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_queue: JobQueue | None = None
+_queue_lock = Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """The process-wide queue at JOB_QUEUE_PATH, opened on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(JOB_QUEUE_PATH)
+        return _queue
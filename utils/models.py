@@ -0,0 +1,153 @@
+import logging
+import os
+from collections import deque
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Dict
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Ordered from cheapest to strongest; escalation walks this list.
+MODEL_TIERS: Dict[str, Dict[str, Any]] = {
+    "fast": {
+        "model": os.getenv("LLM_FAST_MODEL", "gemini-2.5-flash-lite"),
+        "temperature": float(os.getenv("LLM_FAST_TEMPERATURE", "0.2")),
+    },
+    "strong": {
+        "model": os.getenv("LLM_STRONG_MODEL", "gemini-2.5-flash"),
+        "temperature": float(os.getenv("LLM_STRONG_TEMPERATURE", "0.4")),
+    },
+}
+TIER_ORDER = list(MODEL_TIERS)
+
+DEFAULT_STAGE_TIERS = {
+    "router": "fast",
+    "initial_summary": "fast",
+    "overview": "fast",
+    "features": "strong",
+    "features_edit": "fast",
+    "tech_stack": "strong",
+    "tech_stack_edit": "fast",
+    "scope_of_work": "strong",
+    "final_review": "strong",
+}
+
+
+def _load_stage_tiers() -> Dict[str, str]:
+    """Default stage tiers, overridable with e.g. LLM_STAGE_TIERS="overview=strong,router=fast"."""
+    stage_tiers = dict(DEFAULT_STAGE_TIERS)
+    for item in os.getenv("LLM_STAGE_TIERS", "").split(","):
+        if "=" not in item:
+            continue
+        stage, tier = (part.strip() for part in item.split("=", 1))
+        if tier not in MODEL_TIERS:
+            logger.warning(f"Ignoring unknown model tier '{tier}' for stage '{stage}'")
+            continue
+        stage_tiers[stage] = tier
+    return stage_tiers
+
+
+STAGE_TIERS = _load_stage_tiers()
+
+_clients: Dict[str, "ChatGoogleGenerativeAI"] = {}
+_clients_lock = Lock()
+
+
+def _single_attempt_client_calls():
+    """
+    langchain_google_genai 2.1.x ignores `max_retries` and wraps every request
+    in its own tenacity retry (ResourceExhausted included, 1-60 s backoff),
+    which would run inside one rate-limiter slot. Make it a single attempt so
+    the limiter and ResilientCaller own all retrying.
+    """
+    from langchain_google_genai import chat_models
+    from tenacity import retry, stop_after_attempt
+
+    if not hasattr(chat_models, "_create_retry_decorator"):
+        # Without this the client retries 429s itself and the limiter never sees them.
+        logger.warning(
+            "langchain_google_genai has no _create_retry_decorator; client calls may be retried "
+            "inside one rate-limiter slot. Check the retry hook in utils/models.py for this version."
+        )
+        return
+    chat_models._create_retry_decorator = lambda: retry(reraise=True, stop=stop_after_attempt(1))
+
+
+def get_llm(tier: str) -> "ChatGoogleGenerativeAI":
+    """Return the shared client for a model tier, building it on first use."""
+    with _clients_lock:
+        if tier not in _clients:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            if not _clients:
+                _single_attempt_client_calls()
+            config = MODEL_TIERS[tier]
+            logger.info(f"Creating LLM client for tier '{tier}': {config['model']}")
+            _clients[tier] = ChatGoogleGenerativeAI(
+                model=config["model"],
+                temperature=config["temperature"],
+                # Retries go through the rate limiter and ResilientCaller, not the client.
+                max_retries=0,
+            )
+        return _clients[tier]
+
+
+def tier_for_stage(stage: str) -> str:
+    return STAGE_TIERS.get(stage, TIER_ORDER[-1])
+
+
+def next_tier(tier: str) -> str | None:
+    index = TIER_ORDER.index(tier)
+    return TIER_ORDER[index + 1] if index + 1 < len(TIER_ORDER) else None
+
+
+class StageLatencyStats:
+    """Rolling per-stage, per-model latency samples for reporting."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._lock = Lock()
+        self._samples: Dict[tuple, deque] = {}
+        self._counts: Dict[tuple, int] = {}
+        self._escalations: Dict[str, int] = {}
+
+    def record(self, stage: str, model: str, seconds: float):
+        with self._lock:
+            key = (stage, model)
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def record_escalation(self, stage: str):
+        with self._lock:
+            self._escalations[stage] = self._escalations.get(stage, 0) + 1
+
+    def percentile(self, stage: str, model: str, fraction: float, min_samples: int = 1) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get((stage, model), ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            items = [(key, sorted(samples), self._counts[key]) for key, samples in self._samples.items()]
+            escalations = dict(self._escalations)
+
+        stages: Dict[str, Any] = {}
+        for (stage, model), samples, count in items:
+            stages.setdefault(stage, {})[model] = {
+                "calls": count,
+                "mean_seconds": round(sum(samples) / len(samples), 4),
+                "p50_seconds": round(samples[len(samples) // 2], 4),
+                "p95_seconds": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 4),
+            }
+        return {"stage_tiers": STAGE_TIERS, "stages": stages, "escalations": escalations}
+
+
+STAGE_LATENCY = StageLatencyStats()
@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import os
+import re
+import zlib
+from collections import OrderedDict
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Dict, List, Set
+
+from dotenv import load_dotenv
+from utils.retrieval import STAGE_QUERIES, tokenize
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+WARM_START_ENABLED = os.getenv("WARM_START_ENABLED", "true").lower() == "true"
+# Estimated Jaccard similarity of word shingles at which an earlier session's outputs are reused.
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+NEAR_DUPLICATE_MIN_CHARS = int(os.getenv("NEAR_DUPLICATE_MIN_CHARS", "1000"))
+NEAR_DUPLICATE_MAX_DOCUMENTS = int(os.getenv("NEAR_DUPLICATE_MAX_DOCUMENTS", "1000"))
+
+SHINGLE_WORDS = 5
+NUM_PERMUTATIONS = 128
+# 16 bands of 8 rows: pairs above ~0.7 similarity almost always share a bucket.
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Approved outputs carried over, in stage order, with the state field each is stored in.
+WARM_START_FIELDS = {
+    "initial_summary": "initial_summary",
+    "overview": "overview",
+    "features": "extracted_features",
+    "tech_stack": "tech_stack",
+}
+_STAGE_TERMS = {stage: set(tokenize(STAGE_QUERIES[stage])) for stage in WARM_START_FIELDS}
+
+
+def _permutations():
+    import numpy as np
+
+    rng = np.random.RandomState(1)
+    a = rng.randint(1, _MERSENNE_PRIME, size=NUM_PERMUTATIONS, dtype=np.uint64)
+    b = rng.randint(0, _MERSENNE_PRIME, size=NUM_PERMUTATIONS, dtype=np.uint64)
+    return a & np.uint64(_MAX_HASH), b & np.uint64(_MAX_HASH)
+
+
+def minhash_signature(tokens: List[str]) -> "np.ndarray | None":
+    """
+    MinHash of the document's word shingles. Shingles are hashed to 32 bits
+    with CRC32 so signatures are stable across processes and restarts.
+    """
+    import numpy as np
+
+    if len(tokens) < SHINGLE_WORDS:
+        return None
+    shingles = {
+        zlib.crc32(" ".join(tokens[i:i + SHINGLE_WORDS]).encode("utf-8"))
+        for i in range(len(tokens) - SHINGLE_WORDS + 1)
+    }
+    hashes = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    a, b = _permutations()
+    signature = np.full(NUM_PERMUTATIONS, _MAX_HASH, dtype=np.uint64)
+    # Blocks keep the (shingles x permutations) matrix small for long documents.
+    for start in range(0, len(hashes), 8192):
+        block = hashes[start:start + 8192, None]
+        permuted = ((block * a + b) % np.uint64(_MERSENNE_PRIME)) & np.uint64(_MAX_HASH)
+        signature = np.minimum(signature, permuted.min(axis=0))
+    return signature
+
+
+def paragraph_stages(text: str) -> Dict[int, int]:
+    """
+    Map each paragraph (by a hash of its normalized words) to a bitmask of the
+    stages whose retrieval query it touches, in WARM_START_FIELDS order.
+    """
+    paragraphs: Dict[int, int] = {}
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = tokenize(paragraph)
+        if not words:
+            continue
+        terms = set(words)
+        mask = 0
+        for bit, stage in enumerate(WARM_START_FIELDS):
+            if len(terms & _STAGE_TERMS[stage]) >= 2:
+                mask |= 1 << bit
+        key = zlib.crc32(" ".join(words).encode("utf-8"))
+        paragraphs[key] = paragraphs.get(key, 0) | mask
+    return paragraphs
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index over the documents of sessions that reached the scope
+    of work. An entry keeps the document's signature and paragraph stage map
+    and the session's approved outputs, not the document text.
+    """
+
+    def __init__(self, max_documents: int = NEAR_DUPLICATE_MAX_DOCUMENTS):
+        self.max_documents = max_documents
+        self._lock = Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(LSH_BANDS)]
+        self.lookups = 0
+        self.matches = 0
+
+    def _bands(self, signature: "np.ndarray") -> List[bytes]:
+        return [signature[i * LSH_ROWS:(i + 1) * LSH_ROWS].tobytes() for i in range(LSH_BANDS)]
+
+    def _unlink(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band, bucket in zip(self._bands(entry["signature"]), self._buckets):
+            members = bucket.get(band)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del bucket[band]
+
+    def add(self, key: str, document: str, outputs: Dict[str, Any], name: str | None = None) -> bool:
+        """Index (or refresh) a session's document and approved outputs. Returns False for short documents."""
+        if len(document) < NEAR_DUPLICATE_MIN_CHARS:
+            return False
+        digest = hashlib.sha256(document.encode("utf-8")).hexdigest()
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None and existing["digest"] == digest:
+                existing.update(outputs=outputs, name=name)
+                self._entries.move_to_end(key)
+                return True
+
+        signature = minhash_signature(tokenize(document))
+        if signature is None:
+            return False
+        entry = {
+            "digest": digest,
+            "signature": signature,
+            "paragraphs": paragraph_stages(document),
+            "outputs": outputs,
+            "name": name,
+        }
+        with self._lock:
+            self._unlink(key)
+            self._entries[key] = entry
+            for band, bucket in zip(self._bands(signature), self._buckets):
+                bucket.setdefault(band, set()).add(key)
+            while len(self._entries) > self.max_documents:
+                self._unlink(next(iter(self._entries)))
+        return True
+
+    def remove(self, key: str):
+        with self._lock:
+            self._unlink(key)
+
+    def warm_start(self, document: str, exclude: str | None = None) -> Dict[str, Any]:
+        """
+        The closest earlier session at or above the threshold, as a warm-start
+        record for the graph state: its approved outputs, the similarity, and
+        the stages whose part of the document changed. Empty when none match.
+        """
+        if not WARM_START_ENABLED or len(document) < NEAR_DUPLICATE_MIN_CHARS:
+            return {}
+        import numpy as np
+
+        digest = hashlib.sha256(document.encode("utf-8")).hexdigest()
+        signature = minhash_signature(tokenize(document))
+        if signature is None:
+            return {}
+
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            for band, bucket in zip(self._bands(signature), self._buckets):
+                candidates |= bucket.get(band, set())
+            candidates.discard(exclude)
+            scored = [
+                (1.0 if self._entries[key]["digest"] == digest
+                 else float(np.mean(self._entries[key]["signature"] == signature)), key)
+                for key in candidates
+            ]
+            if not scored:
+                return {}
+            similarity, key = max(scored)
+            if similarity < NEAR_DUPLICATE_THRESHOLD:
+                return {}
+            self.matches += 1
+            self._entries.move_to_end(key)
+            entry = self._entries[key]
+
+        old, new = entry["paragraphs"], paragraph_stages(document)
+        changed_mask = 0
+        for paragraph in old.keys() ^ new.keys():
+            changed_mask |= old.get(paragraph, 0) | new.get(paragraph, 0)
+        stale = [stage for bit, stage in enumerate(WARM_START_FIELDS) if changed_mask & (1 << bit)]
+
+        logger.info(
+            f"Document matches session {key} ({similarity:.0%} similar); "
+            f"stages to regenerate: {', '.join(stale) or 'none'}"
+        )
+        return {
+            "source": key,
+            "source_name": entry["name"],
+            "similarity": round(similarity, 4),
+            "outputs": entry["outputs"],
+            "stale_stages": stale,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"documents": len(self._entries), "lookups": self.lookups, "matches": self.matches}
+
+
+NEAR_DUPLICATES = NearDuplicateIndex()
+
+
+def approved_outputs(values: Dict[str, Any]) -> Dict[str, Any]:
+    """The carried-over fields of a graph state."""
+    return {field: values.get(field) for field in WARM_START_FIELDS.values()}
@@ -1,15 +1,18 @@
 from langchain.prompts import PromptTemplate
 
+# Every document-bearing template starts with this exact prefix so the
+# provider can cache it once per session and reuse it across all stages.
+DOCUMENT_PREFIX = """<context>
+{parsed_data}
+</context>
+"""
+
 summary_prompt = PromptTemplate(
     input_variables=["parsed_data", "user_feedback"],
-    template="""
+    template=DOCUMENT_PREFIX + """
 You are an expert AI Project Analyst. Your first task is to analyze initial project information and provide a summary to confirm your core understanding with the user before any detailed work begins.
 
-The user has provided the following source material. This could be a detailed document or a brief, conversational idea like 'hi' or 'hello'. Adapt your analysis accordingly.
-
-<context>
-{parsed_data}
-</context>
+The user has provided the source material in the <context> block above. This could be a detailed document or a brief, conversational idea like 'hi' or 'hello'. Adapt your analysis accordingly.
 
 <user_feedback>
 {user_feedback}
@@ -46,7 +49,7 @@ The user has provided the following source material. This could be a detailed do
 )
 overview_prompt = PromptTemplate(
     input_variables=["parsed_data", "user_feedback", "approved_summary"], 
-    template="""
+    template=DOCUMENT_PREFIX + """
 You are an Expert Project Synthesizer. Your task is to expand upon an approved summary by drawing more detail from the original source material to produce a clear project overview.
 
 A summary has already been approved by the user. Your job is to elaborate on it.
@@ -55,10 +58,6 @@ A summary has already been approved by the user. Your job is to elaborate on it.
 {approved_summary}
 </approved_summary>
 
-<context>
-{parsed_data}
-</context>
-
 <user_feedback>
 {user_feedback}
 </user_feedback>
@@ -96,13 +95,9 @@ A summary has already been approved by the user. Your job is to elaborate on it.
 
 feature_suggestion_prompt = PromptTemplate(
     input_variables=["parsed_data", "user_feedback", "approved_summary"],
-    template="""
+    template=DOCUMENT_PREFIX + """
 You are a Senior Product Strategist and Feature Consultant. Your role is to review the project's initial information and approved summary to suggest clear, realistic features that support the project’s success.
 
-<context>
-{parsed_data}
-</context>
-
 <approved_summary>
 {approved_summary}
 </approved_summary>
@@ -152,13 +147,9 @@ You are a Senior Product Strategist and Feature Consultant. Your role is to revi
 
 tech_stack_prompt = PromptTemplate(
     input_variables=["parsed_data", "user_feedback", "approved_summary", "approved_features"],
-    template="""
+    template=DOCUMENT_PREFIX + """
 You are a Senior Technical Architect. Your task is to review the project's needs and recommend a practical, modern technology stack as a concise, scannable list.
 
-<context>
-{parsed_data}
-</context>
-
 <approved_summary>
 {approved_summary}
 </approved_summary>
@@ -214,13 +205,9 @@ Use `-` bullets under each heading. Do **not** use numbered or nested lists. No
 
 work_scope_prompt = PromptTemplate(
     input_variables=["parsed_data", "user_feedback", "approved_summary", "approved_features", "approved_tech_stack"],
-    template="""
+    template=DOCUMENT_PREFIX + """
 You are a professional Project Planner and Work Scope Generator. Your task is to generate a comprehensive project work scope document based on all approved project components and the initial information provided.
 
-<context>
-{parsed_data}
-</context>
-
 <approved_summary>
 {approved_summary}
 </approved_summary>
@@ -371,4 +358,101 @@ Now, based on the user's request, generate the JSON response.
   "follow_up_question": "A brief, direct question to confirm the change. For example: 'Does this look correct? Any other adjustments?'"
 }}}}
 """
-)
\ No newline at end of file
+)
+
+feature_edit_prompt = PromptTemplate(
+    input_variables=["current_features", "user_feedback"],
+    template="""You are a Senior Product Strategist. An approved-in-progress feature list already exists. The user has asked for a targeted change to it.
+
+Your task is to express the requested change as a minimal set of item-level operations on the numbered list below. Do not rewrite features the user did not mention.
+
+<current_features>
+{current_features}
+</current_features>
+
+<user_feedback>
+{user_feedback}
+</user_feedback>
+
+**RULES:**
+1.  Use "update" to rewrite an existing feature, "add" to append a new feature, and "remove" to delete one. `index` refers to the number shown in <current_features>.
+2.  Only emit operations for features the feedback explicitly affects. An empty list of operations is valid.
+3.  If the feedback asks to rework the whole list (e.g., "start over", "focus everything on mobile"), set "regenerate" to true and leave "operations" empty.
+4.  Your output MUST be a single, valid JSON object that strictly adheres to the schema below, with plain-text string values and no markdown formatting.
+
+## JSON SCHEMA ##
+{{{{
+  "regenerate": false,
+  "operations": [
+    {{"action": "update", "index": 2, "feature": "The rewritten one-sentence description of feature 2."}},
+    {{"action": "add", "feature": "A one-sentence description of a new feature."}},
+    {{"action": "remove", "index": 5}}
+  ],
+  "follow_up_question": "A direct confirmation question. For example: 'I've updated the feature list. Does it look right now, or would you like further changes?'"
+}}}}
+"""
+)
+
+tech_stack_edit_prompt = PromptTemplate(
+    input_variables=["current_tech_stack", "user_feedback"],
+    template="""You are a Senior Technical Architect. A technology stack has already been proposed. The user has asked for a targeted change to it.
+
+Your task is to express the requested change as a minimal set of category-level operations on the stack below. Do not touch categories or technologies the user did not mention.
+
+<current_tech_stack>
+{current_tech_stack}
+</current_tech_stack>
+
+<user_feedback>
+{user_feedback}
+</user_feedback>
+
+**RULES:**
+1.  Use "set" to replace a category's technologies, "add" to append technologies to a category (creating it if needed), and "remove" to delete technologies from a category. A "remove" without technologies deletes the whole category.
+2.  Only emit operations for categories the feedback explicitly affects. An empty list of operations is valid.
+3.  If the feedback asks to rework the whole stack (e.g., "propose a completely different stack"), set "regenerate" to true and leave "operations" empty.
+4.  Your output MUST be a single, valid JSON object that strictly adheres to the schema below, with plain-text string values and no markdown formatting.
+
+## JSON SCHEMA ##
+{{{{
+  "regenerate": false,
+  "operations": [
+    {{"action": "set", "category": "database", "technologies": ["MongoDB"]}},
+    {{"action": "add", "category": "frontend", "technologies": ["Vue.js"]}},
+    {{"action": "remove", "category": "ai_ml", "technologies": ["PyTorch"]}}
+  ],
+  "follow_up_question": "A direct confirmation question. For example: 'I've updated the tech stack. Shall I proceed to the final work scope, or would you like more changes?'"
+}}}}
+"""
+)
+
+
+# Output token caps per stage (LLM_STAGE_OUTPUT_TOKENS overrides, 0 disables a cap).
+# Gemini 2.5 models count thinking tokens against the cap, so these leave room
+# above the longest normal answer; they exist to stop runaway generations.
+STAGE_OUTPUT_TOKENS = {
+    "router": 512,
+    "initial_summary": 2048,
+    "overview": 4096,
+    "features": 4096,
+    "features_edit": 2048,
+    "tech_stack": 4096,
+    "tech_stack_edit": 2048,
+    "scope_of_work": 16384,
+    "final_review": 8192,
+}
+
+# Tighter caps for sessions in concise mode, whose prompts also end with CONCISE_INSTRUCTION.
+CONCISE_OUTPUT_TOKENS = {
+    "initial_summary": 1024,
+    "overview": 2048,
+    "features": 2048,
+    "tech_stack": 2048,
+    "scope_of_work": 8192,
+    "final_review": 4096,
+}
+
+CONCISE_INSTRUCTION = """
+## Concise Mode ##
+The user has asked for concise answers. Keep the JSON schema exactly as specified, but make every text value as short as it can be while staying accurate: short sentences, no restating of the context, no filler, and at most one line per list item.
+"""
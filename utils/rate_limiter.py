@@ -0,0 +1,171 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class TokenBucket:
+    """A simple token bucket refilled continuously at a fixed rate."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class AdaptiveRateLimiter:
+    """
+    Process-wide limiter for upstream LLM calls.
+
+    Admission requires a free concurrency slot plus budget in both the
+    requests-per-minute and tokens-per-minute buckets. The concurrency limit
+    follows AIMD: it grows additively on fast successes and shrinks
+    multiplicatively on 429s or slow responses. Waiters are admitted in
+    priority order, so interactive sessions go ahead of batch work.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        latency_target: float = 30.0,
+        backoff_seconds: float = 5.0,
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target = latency_target
+        self.backoff_seconds = backoff_seconds
+
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.stats = {"admitted": 0, "rate_limited": 0, "slow": 0}
+
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def _admission_delay(self, tokens: int, now: float) -> float | None:
+        """Return None if a slot is free, else how long to sleep before retrying."""
+        if self.in_flight >= max(self.min_concurrency, int(self.concurrency_limit)):
+            return None
+        delay = max(
+            self.cooldown_until - now,
+            self.request_bucket.wait_time(1, now),
+            self.token_bucket.wait_time(tokens, now),
+        )
+        return delay
+
+    def acquire(self, tokens: int, priority: str = "interactive"):
+        entry = (PRIORITIES.get(priority, PRIORITIES["batch"]), next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            while True:
+                if self._waiters[0] == entry:
+                    now = time.monotonic()
+                    delay = self._admission_delay(tokens, now)
+                    if delay is not None and delay <= 0:
+                        break
+                    self._cond.wait(timeout=delay)
+                else:
+                    self._cond.wait()
+
+            heapq.heappop(self._waiters)
+            self.request_bucket.take(1)
+            self.token_bucket.take(tokens)
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            self._cond.notify_all()
+
+    def release(self, latency: float, rate_limited: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if rate_limited:
+                self.stats["rate_limited"] += 1
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+                self.cooldown_until = time.monotonic() + self.backoff_seconds
+                logger.warning(
+                    f"LLM rate limited; concurrency limit reduced to {self.concurrency_limit:.2f}"
+                )
+            elif latency > self.latency_target:
+                self.stats["slow"] += 1
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * 0.9)
+            else:
+                self.concurrency_limit = min(
+                    self.max_concurrency, self.concurrency_limit + 1.0 / self.concurrency_limit
+                )
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, tokens: int, priority: str = "interactive"):
+        """Hold an admission slot for the duration of one upstream call."""
+        self.acquire(tokens, priority)
+        start_time = time.monotonic()
+        rate_limited = False
+        try:
+            yield
+        except Exception as e:
+            rate_limited = is_rate_limit_error(e)
+            raise
+        finally:
+            self.release(time.monotonic() - start_time, rate_limited=rate_limited)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "concurrency_limit": round(self.concurrency_limit, 2),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                **self.stats,
+            }
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Best-effort detection of provider 429 / quota errors."""
+    if type(error).__name__ in {"ResourceExhausted", "TooManyRequests", "RateLimitError"}:
+        return True
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message
+
+
+LLM_RATE_LIMITER = AdaptiveRateLimiter(
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+    tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    latency_target=float(os.getenv("LLM_LATENCY_TARGET_SECONDS", "30")),
+)
@@ -0,0 +1,297 @@
+import logging
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Any, Callable, Dict, List
+
+from dotenv import load_dotenv
+
+from utils.rate_limiter import is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+RETRYABLE_ERROR_NAMES = {
+    "DeadlineExceeded",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "ServerError",
+    "BadGateway",
+    "GatewayTimeout",
+    "ConnectError",
+    "ReadTimeout",
+    "ConnectTimeout",
+    "RemoteProtocolError",
+    "ConnectionError",
+    "TimeoutError",
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call does not finish within its stage deadline."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class AttemptDeadline:
+    """
+    The absolute deadline handed to one attempt. The attempt calls `start()`
+    right before its upstream request, after any local queueing such as a
+    rate-limiter slot: it raises DeadlineExceeded instead of sending a call
+    nobody is waiting for, and otherwise returns the seconds left for the
+    request timeout. Only started attempts count toward the circuit breaker.
+    """
+
+    def __init__(self, name: str, deadline_at: float):
+        self.name = name
+        self.deadline_at = deadline_at
+        self.started = False
+
+    def start(self) -> float:
+        remaining = self.deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{self.name} deadline passed before the call was sent")
+        self.started = True
+        return remaining
+
+
+def is_retryable_error(error: Exception) -> bool:
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (DeadlineExceeded, ConnectionError)) or is_rate_limit_error(error):
+        return True
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def parse_stage_overrides(value: str) -> Dict[str, float]:
+    """Parse "stage=seconds,stage=seconds" into a dict."""
+    overrides: Dict[str, float] = {}
+    for item in value.split(","):
+        if "=" in item:
+            stage, seconds = (part.strip() for part in item.split("=", 1))
+            overrides[stage] = float(seconds)
+    return overrides
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast until
+    `reset_timeout` elapses, then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_flight:
+                raise CircuitOpenError(f"{self.name} circuit is open; failing fast.")
+            self.trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"{self.name} circuit closed after successful trial call")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """End a half-open trial that never reached upstream, without counting it either way."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+
+class ResilientCaller:
+    """
+    Runs upstream calls under a per-stage deadline, with bounded retries using
+    full-jitter backoff, optional hedging and a shared circuit breaker.
+
+    The wrapped function receives an AttemptDeadline and calls its `start()`
+    right before the upstream request, using the returned seconds as its own
+    request timeout. Only retryable failures of started attempts count toward
+    the breaker; local queue timeouts and client errors leave it alone.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        default_deadline: float,
+        stage_deadlines: Dict[str, float],
+        max_retries: int,
+        base_delay: float,
+        max_delay: float,
+        breaker: CircuitBreaker,
+        max_workers: int,
+    ):
+        self.name = name
+        self.default_deadline = default_deadline
+        self.stage_deadlines = stage_deadlines
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._stats_lock = Lock()
+        self.stats = {"calls": 0, "retries": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0, "fast_failures": 0}
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def deadline_for(self, stage: str) -> float:
+        return self.stage_deadlines.get(stage, self.default_deadline)
+
+    def call(self, fn: Callable[[AttemptDeadline], Any], stage: str = "default", hedge_delay: float | None = None) -> Any:
+        self._count("calls")
+        deadline_at = time.monotonic() + self.deadline_for(stage)
+
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self._count("fast_failures")
+                raise
+
+            deadlines: List[AttemptDeadline] = []
+            try:
+                result = self._attempt(fn, deadline_at, hedge_delay, deadlines)
+                self.breaker.record_success()
+                return result
+            except Exception as e:
+                if is_retryable_error(e) and any(deadline.started for deadline in deadlines):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release_trial()
+                if isinstance(e, DeadlineExceeded):
+                    self._count("timeouts")
+
+                remaining = deadline_at - time.monotonic()
+                if attempt >= self.max_retries or remaining <= 0 or not is_retryable_error(e):
+                    raise
+
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if backoff >= remaining:
+                    raise
+                attempt += 1
+                self._count("retries")
+                logger.warning(f"{self.name} call for '{stage}' failed ({e}); retry {attempt} in {backoff:.2f}s")
+                time.sleep(backoff)
+
+    def _submit(self, fn: Callable[[AttemptDeadline], Any], deadline_at: float, deadlines: List[AttemptDeadline]):
+        deadline = AttemptDeadline(self.name, deadline_at)
+        deadlines.append(deadline)
+        return self._executor.submit(fn, deadline)
+
+    def _attempt(
+        self,
+        fn: Callable[[AttemptDeadline], Any],
+        deadline_at: float,
+        hedge_delay: float | None,
+        deadlines: List[AttemptDeadline],
+    ) -> Any:
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{self.name} deadline exceeded")
+
+        primary = self._submit(fn, deadline_at, deadlines)
+        pending = {primary}
+
+        if hedge_delay is not None and hedge_delay < remaining:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                self._count("hedges")
+                pending.add(self._submit(fn, deadline_at, deadlines))
+
+        last_error: BaseException | None = None
+        while pending:
+            remaining = deadline_at - time.monotonic()
+            done, pending = wait(pending, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"{self.name} deadline exceeded")
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    return future.result()
+                last_error = error
+        raise last_error
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {**stats, "circuit": self.breaker.state}
+
+
+LLM_HEDGE_STAGES = {
+    stage.strip() for stage in os.getenv("LLM_HEDGE_STAGES", "router,initial_summary,overview").split(",") if stage.strip()
+}
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+LLM_RESILIENCE = ResilientCaller(
+    name="llm",
+    default_deadline=float(os.getenv("LLM_DEADLINE_SECONDS", "90")),
+    stage_deadlines={
+        "router": 20.0,
+        "scope_of_work": 180.0,
+        **parse_stage_overrides(os.getenv("LLM_STAGE_DEADLINES", "")),
+    },
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+    base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY_SECONDS", "0.5")),
+    max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY_SECONDS", "8")),
+    breaker=CircuitBreaker(
+        "llm",
+        failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+    ),
+    max_workers=int(os.getenv("LLM_MAX_CONCURRENCY", "8")) * 2 + 4,
+)
+
+PARSE_RESILIENCE = ResilientCaller(
+    name="parse",
+    default_deadline=float(os.getenv("PARSE_DEADLINE_SECONDS", "300")),
+    stage_deadlines={},
+    max_retries=int(os.getenv("PARSE_MAX_RETRIES", "1")),
+    base_delay=1.0,
+    max_delay=10.0,
+    breaker=CircuitBreaker(
+        "parse",
+        failure_threshold=int(os.getenv("PARSE_BREAKER_FAILURES", "3")),
+        reset_timeout=float(os.getenv("PARSE_BREAKER_RESET_SECONDS", "60")),
+    ),
+    max_workers=8,
+)
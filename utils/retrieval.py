@@ -0,0 +1,261 @@
+import copy
+import logging
+import os
+import re
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, List
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Documents shorter than this are sent whole; longer ones are served as top-k passages.
+RETRIEVAL_MIN_CHARS = int(os.getenv("RETRIEVAL_MIN_CHARS", "60000"))
+RETRIEVAL_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1500"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+# Optional sentence-transformers model for hybrid scoring, e.g. "all-MiniLM-L6-v2".
+RETRIEVAL_EMBEDDING_MODEL = os.getenv("RETRIEVAL_EMBEDDING_MODEL", "")
+
+STAGE_QUERIES = {
+    "initial_summary": "project purpose objective goal background overview introduction scope summary",
+    "overview": "project purpose objective goals scope background stakeholders users business problem solution",
+    "features": "requirements functional features must shall should users roles capabilities workflow "
+                "screens modules reporting notifications dashboard",
+    "tech_stack": "integration infrastructure architecture platform hosting cloud database api security "
+                  "authentication performance scalability technology existing systems deployment compliance",
+    "scope_of_work": "deliverables timeline milestones phases budget responsibilities acceptance criteria "
+                     "support maintenance out of scope requirements constraints",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def chunk_document(text: str, chunk_chars: int = RETRIEVAL_CHUNK_CHARS) -> List[str]:
+    """Pack paragraphs into chunks of roughly `chunk_chars`, splitting oversized paragraphs."""
+    chunks: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > chunk_chars:
+            cut = paragraph.rfind(" ", 0, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:cut])
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + len(paragraph) + 2 > chunk_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _load_embedder():
+    if not RETRIEVAL_EMBEDDING_MODEL:
+        return None
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logger.warning("RETRIEVAL_EMBEDDING_MODEL is set but sentence-transformers is not installed; using BM25 only.")
+        return None
+    return SentenceTransformer(RETRIEVAL_EMBEDDING_MODEL)
+
+
+_embedder = None
+_embedder_lock = Lock()
+
+
+def get_embedder():
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None and RETRIEVAL_EMBEDDING_MODEL:
+            _embedder = _load_embedder() or False
+        return _embedder or None
+
+
+class DocumentIndex:
+    """
+    BM25 over document chunks, stored as per-term posting arrays so a query is
+    scored with a handful of vectorized NumPy operations. With an embedder,
+    normalized chunk embeddings are kept alongside for hybrid scoring.
+    """
+
+    def __init__(self, chunks: List[str], k1: float = 1.5, b: float = 0.75, embedder=None):
+        import numpy as np
+
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.embedder = embedder
+
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for chunk_id, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            lengths[chunk_id] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[chunk_id] = counts.get(chunk_id, 0) + 1
+
+        self.doc_lengths = lengths
+        self.avg_length = float(lengths.mean()) if len(chunks) else 0.0
+        self.postings = {
+            term: (np.fromiter(counts.keys(), dtype=np.int32), np.fromiter(counts.values(), dtype=np.float32))
+            for term, counts in postings.items()
+        }
+        self.idf = self._idf()
+
+        self.embeddings = None
+        if embedder is not None and chunks:
+            vectors = np.asarray(embedder.encode(chunks), dtype=np.float32)
+            self.embeddings = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+        # Length of the document text the index covers, set by the session index helpers.
+        self.document_chars = 0
+
+    def _idf(self) -> Dict[str, float]:
+        import numpy as np
+
+        n = len(self.chunks)
+        return {
+            term: float(np.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5)))
+            for term, (ids, _) in self.postings.items()
+        }
+
+    def extended(self, chunks: List[str]) -> "DocumentIndex":
+        """
+        A new index over this one's chunks followed by `chunks`. Only the new
+        chunks are tokenized and embedded; existing postings are reused and
+        IDF is recomputed. This index is left unchanged for forks sharing it.
+        """
+        import numpy as np
+
+        added = DocumentIndex(chunks, self.k1, self.b, self.embedder)
+        offset = len(self.chunks)
+        merged = copy.copy(self)
+        merged.chunks = self.chunks + added.chunks
+        merged.doc_lengths = np.concatenate([self.doc_lengths, added.doc_lengths])
+        merged.avg_length = float(merged.doc_lengths.mean()) if len(merged.chunks) else 0.0
+        merged.postings = dict(self.postings)
+        for term, (ids, tf) in added.postings.items():
+            if term in merged.postings:
+                old_ids, old_tf = merged.postings[term]
+                merged.postings[term] = (np.concatenate([old_ids, ids + offset]), np.concatenate([old_tf, tf]))
+            else:
+                merged.postings[term] = (ids + offset, tf)
+        merged.idf = merged._idf()
+        if self.embeddings is not None and added.embeddings is not None:
+            merged.embeddings = np.concatenate([self.embeddings, added.embeddings])
+        return merged
+
+    def bm25_scores(self, query: str) -> "np.ndarray":
+        import numpy as np
+
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_length, 1e-9))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            ids, tf = self.postings[term]
+            scores[ids] += self.idf[term] * tf * (self.k1 + 1) / (tf + norm[ids])
+        return scores
+
+    def search(self, query: str, k: int) -> List[int]:
+        import numpy as np
+
+        scores = self.bm25_scores(query)
+        if scores.max(initial=0) > 0:
+            scores = scores / scores.max()
+        if self.embeddings is not None:
+            query_vector = np.asarray(self.embedder.encode([query]), dtype=np.float32)[0]
+            query_vector /= max(np.linalg.norm(query_vector), 1e-9)
+            scores = scores + self.embeddings @ query_vector
+
+        k = min(k, len(self.chunks))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        return sorted(int(i) for i in top)
+
+    def context_for(self, stage: str, extra_query: str = "", k: int = RETRIEVAL_TOP_K) -> str:
+        """Top-k passages for a stage, in document order."""
+        query = f"{STAGE_QUERIES.get(stage, '')} {extra_query}".strip()
+        return "\n\n[...]\n\n".join(self.chunks[i] for i in self.search(query, k))
+
+
+_indexes: Dict[str, DocumentIndex] = {}
+_indexes_lock = Lock()
+
+
+def should_index(document: str) -> bool:
+    return len(document) >= RETRIEVAL_MIN_CHARS
+
+
+def build_session_index(thread_id: str, document: str) -> DocumentIndex:
+    index = DocumentIndex(chunk_document(document), embedder=get_embedder())
+    index.document_chars = len(document)
+    with _indexes_lock:
+        _indexes[thread_id] = index
+    logger.info(f"Built retrieval index for thread {thread_id}: {len(index.chunks)} chunks")
+    return index
+
+
+def share_session_index(source_thread_id: str, target_thread_id: str) -> bool:
+    """Serve a forked thread from its parent's index. The index is read-only, so both use the same object."""
+    with _indexes_lock:
+        index = _indexes.get(source_thread_id)
+        if index is not None:
+            _indexes[target_thread_id] = index
+    return index is not None
+
+
+def extend_session_index(thread_id: str, document: str, addition: str) -> DocumentIndex:
+    """
+    Add the chunks of `addition`, text appended to the end of `document`, to
+    the thread's index. A thread without an index gets one over `document`.
+    """
+    with _indexes_lock:
+        index = _indexes.get(thread_id)
+    if index is None:
+        return build_session_index(thread_id, document)
+    extended = index.extended(chunk_document(addition))
+    extended.document_chars = len(document)
+    with _indexes_lock:
+        _indexes[thread_id] = extended
+    logger.info(f"Extended retrieval index for thread {thread_id}: {len(extended.chunks) - len(index.chunks)} new chunks")
+    return extended
+
+
+def get_session_index(thread_id: str) -> DocumentIndex | None:
+    with _indexes_lock:
+        return _indexes.get(thread_id)
+
+
+def drop_session_index(thread_id: str):
+    with _indexes_lock:
+        _indexes.pop(thread_id, None)
+
+
+def document_for_stage(thread_id: str | None, document: str, stage: str, feedback: str = "") -> str:
+    """The document text to send for a stage: top-k passages when indexed, else the whole document."""
+    with _indexes_lock:
+        index = _indexes.get(thread_id) if thread_id else None
+    if index is None:
+        return document
+    if index.document_chars != len(document):
+        # The state was restored to before documents were appended; index the text it has now.
+        index = build_session_index(thread_id, document)
+    return index.context_for(stage, feedback)
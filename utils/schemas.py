@@ -0,0 +1,150 @@
+import json
+import logging
+from typing import Annotated, Any, Dict, List
+
+from pydantic import (
+    BaseModel,
+    BeforeValidator,
+    ConfigDict,
+    TypeAdapter,
+    ValidationError,
+    field_validator,
+    model_serializer,
+    model_validator,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def as_list(value: Any) -> List[Any]:
+    """Wrap a lone value in a list; None becomes an empty list."""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def _tech_item(value: Any) -> Any:
+    # {"name": "React", "purpose": "..."} -> "React"
+    if isinstance(value, dict):
+        for key in ("name", "technology", "tool"):
+            if value.get(key):
+                return str(value[key])
+        return ", ".join(str(item) for item in value.values())
+    if isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+
+TechItem = Annotated[str, BeforeValidator(_tech_item)]
+# Category (frontend, backend, ...) -> technologies. A lone technology is read as a one-item list.
+TechStack = Dict[str, Annotated[List[TechItem], BeforeValidator(as_list)]]
+TECH_STACK = TypeAdapter(TechStack)
+
+
+class _Artifact(BaseModel):
+    # Models may add fields the prompt didn't ask for; keep them rather than fail
+    # the stage, and accept numbers where the prompt asks for strings.
+    model_config = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+
+class Feature(_Artifact):
+    """
+    One feature. Prompts ask for plain strings, which fill `description`;
+    models that answer with objects keep their name and any extra keys.
+    A plain feature serializes back to its string.
+    """
+
+    name: str = ""
+    description: str = ""
+
+    @model_validator(mode="before")
+    @classmethod
+    def _from_text(cls, value: Any) -> Any:
+        if isinstance(value, (str, int, float)):
+            return {"description": str(value).strip()}
+        return value
+
+    @model_serializer(mode="wrap")
+    def _compact(self, handler):
+        data = handler(self)
+        if isinstance(data, dict) and set(data) <= {"description"}:
+            return self.description
+        return data
+
+    def __str__(self) -> str:
+        text = ": ".join(part for part in (self.name, self.description) if part)
+        return text or "; ".join(str(value) for value in (self.model_extra or {}).values())
+
+
+class EffortEstimationTable(_Artifact):
+    headers: List[str] = []
+    rows: List[List[str]] = []
+
+
+class ScopeOfWork(_Artifact):
+    overview: str | List[str] = ""
+    user_roles_and_key_features: str | List[Feature] = ""
+    feature_breakdown: str | List[Feature] = ""
+    workflow: str | List[str] = ""
+    milestone_plan: str | List[str] = ""
+    tech_stack: TechStack = {}
+    deliverables: str | List[str] = ""
+    out_of_scope: str | List[str] = ""
+    client_responsibilities: str | List[str] = ""
+    technical_requirements: str | List[str] = ""
+    general_notes: str | List[str] = ""
+    effort_estimation_table: EffortEstimationTable | None = None
+
+    @field_validator("tech_stack", mode="before")
+    @classmethod
+    def _tech_stack_shape(cls, value: Any) -> Any:
+        # A flat list or a single string instead of categories.
+        if value is None:
+            return {}
+        if isinstance(value, (str, list, tuple)):
+            return {"technologies": as_list(value)}
+        return value
+
+    @classmethod
+    def from_output(cls, data: Dict[str, Any]) -> "ScopeOfWork":
+        """
+        Validate model output, keeping every field that fits. A text field in
+        an unexpected shape is kept as its JSON text; any other invalid field
+        is dropped, so one off-shape field doesn't cost the whole document.
+        """
+        try:
+            return cls.model_validate(data)
+        except ValidationError as e:
+            data = dict(data)
+            for field in {error["loc"][0] for error in e.errors() if error["loc"]}:
+                if field not in data:
+                    continue
+                if field in ("tech_stack", "effort_estimation_table"):
+                    logger.warning(f"Dropping scope of work field '{field}' in an unexpected shape: {data[field]!r}")
+                    data.pop(field)
+                else:
+                    data[field] = json.dumps(data[field], indent=2)
+            return cls.model_validate(data)
+
+    def with_updates(self, component: Dict[str, Any]) -> "ScopeOfWork":
+        """A copy with the given top-level fields replaced, validated like a fresh generation."""
+        return ScopeOfWork.from_output({**self.model_dump(exclude_defaults=True), **component})
+
+
+class FinalAdjustment(_Artifact):
+    confirmation_message: str = ""
+    updated_component: Dict[str, Any] = {}
+
+
+def artifact_json(value: Any) -> Any:
+    """
+    The JSON form of a state value: artifact models dump the fields they
+    hold, lists are converted item by item, anything else is returned as is.
+    """
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_defaults=True)
+    if isinstance(value, list):
+        return [artifact_json(item) for item in value]
+    return value
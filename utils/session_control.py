@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from utils.singleflight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class SupersededError(Exception):
+    """Raised for a queued run that a newer submission to the same session replaced."""
+
+
+class IdempotencyKeyReusedError(Exception):
+    """Raised when an Idempotency-Key is sent again with a different endpoint or body."""
+
+
+def request_fingerprint(route: str, *parts: str | bytes) -> str:
+    """Hash of a request's endpoint and body, to tell a retry from a different request under the same key."""
+    digest = hashlib.sha256(route.encode("utf-8"))
+    for part in parts:
+        data = part.encode("utf-8") if isinstance(part, str) else part
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class SessionRunGuard:
+    """
+    Serializes graph runs per session so two requests never advance the same
+    thread concurrently. With `supersede=True`, a run still waiting for the
+    lock is cancelled if a newer submission arrived for the session meanwhile;
+    a run that already started is allowed to finish.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._generations: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def exclusive(self, session_id: str, supersede: bool = False):
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        generation = self._generations.get(session_id, 0) + 1
+        self._generations[session_id] = generation
+
+        async with lock:
+            if supersede and self._generations[session_id] != generation:
+                logger.info(f"Skipping superseded run for session {session_id}")
+                raise SupersededError(f"Input for session '{session_id}' was superseded by a newer submission.")
+            yield
+
+    def forget(self, session_id: str):
+        self._locks.pop(session_id, None)
+        self._generations.pop(session_id, None)
+
+
+class IdempotencyCache:
+    """
+    Remembers endpoint responses by (session_id, Idempotency-Key) for a while,
+    so client retries return the original response instead of re-running work.
+    Concurrent retries of the same key share the in-flight call. Each key is
+    bound to the request fingerprint (endpoint and body) it was first used
+    with; reusing it for a different request raises IdempotencyKeyReusedError.
+    """
+
+    def __init__(self, ttl_seconds: float = 600.0, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str, Any]]" = OrderedDict()
+        # Fingerprints of keys whose first request is still running.
+        self._pending: Dict[Tuple[str, str], str] = {}
+        self._flights = AsyncSingleFlight("idempotency")
+
+    @staticmethod
+    def _check(session_id: str, key: str, expected: str, fingerprint: str):
+        if expected != fingerprint:
+            raise IdempotencyKeyReusedError(
+                f"Idempotency key '{key}' was already used for a different request to session '{session_id}'."
+            )
+
+    def get(self, session_id: str, key: str, fingerprint: str = "") -> Any:
+        entry = self._entries.get((session_id, key))
+        if entry is None:
+            return None
+        stored_at, stored_fingerprint, response = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[(session_id, key)]
+            return None
+        self._check(session_id, key, stored_fingerprint, fingerprint)
+        return response
+
+    def put(self, session_id: str, key: str, response: Any, fingerprint: str = ""):
+        self._entries[(session_id, key)] = (time.monotonic(), fingerprint, response)
+        self._entries.move_to_end((session_id, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def run(
+        self,
+        session_id: str,
+        key: str | None,
+        fn: Callable[[], Awaitable[Any]],
+        fingerprint: str = "",
+    ) -> Any:
+        if not key:
+            return await fn()
+
+        cached = self.get(session_id, key, fingerprint)
+        if cached is not None:
+            logger.info(f"Returning cached response for session {session_id}, idempotency key {key}")
+            return cached
+
+        self._check(session_id, key, self._pending.setdefault((session_id, key), fingerprint), fingerprint)
+        try:
+            response = await self._flights.do((session_id, key), fn)
+            self.put(session_id, key, response, fingerprint)
+        finally:
+            self._pending.pop((session_id, key), None)
+        return response
+
+    def forget(self, session_id: str):
+        for entry_key in [k for k in self._entries if k[0] == session_id]:
+            del self._entries[entry_key]
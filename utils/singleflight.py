@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from threading import Event, Lock
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls that share a key. The first caller runs the
+    function; callers arriving while it is in flight wait and receive the same
+    result (or exception). Nothing is cached once the call completes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        return self.do_shared(key, fn)[0]
+
+    def do_shared(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Like `do`, also returning whether this caller joined another's call instead of running it."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            logger.info(f"{self.name}: joined in-flight call {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """The asyncio counterpart of `SingleFlight`, for coroutines on one event loop."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            logger.info(f"{self.name}: joined in-flight call {key}")
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody joined the call.
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
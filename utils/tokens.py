@@ -0,0 +1,299 @@
+import hashlib
+import logging
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Prompt budget in estimated input tokens, overridable per stage with e.g.
+# LLM_STAGE_TOKEN_BUDGETS="router=4000,scope_of_work=120000". 0 disables the budget.
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "200000"))
+TOKEN_ESTIMATE_CACHE_SIZE = int(os.getenv("TOKEN_ESTIMATE_CACHE_SIZE", "256"))
+
+# Prompt inputs that may be shortened to meet a budget, lowest priority first.
+# The source document goes before approved artifacts; feedback, the user's
+# input and the artifact being edited are never trimmed.
+TRIM_PRIORITY = ["parsed_data", "approved_summary", "approved_features", "approved_tech_stack"]
+TRIM_MARKER = "\n[... trimmed to fit the prompt budget ...]"
+
+# Texts at least this long are hashed and their estimate cached, so a document
+# is scanned once however many stages and edits send it.
+_CACHE_MIN_CHARS = 4096
+
+_WORD_RE = re.compile(r"[A-Za-z]+")
+_DIGIT_RE = re.compile(r"\d")
+_SYMBOL_RE = re.compile(r"[^\w\s]")
+_NON_ASCII_RE = re.compile(r"[^\x00-\x7f]")
+
+
+def _load_stage_budgets(variable: str = "LLM_STAGE_TOKEN_BUDGETS") -> Dict[str, int]:
+    budgets: Dict[str, int] = {}
+    for item in os.getenv(variable, "").split(","):
+        if "=" not in item:
+            continue
+        stage, budget = (part.strip() for part in item.split("=", 1))
+        try:
+            budgets[stage] = int(budget)
+        except ValueError:
+            logger.warning(f"Ignoring invalid token budget '{budget}' for stage '{stage}'")
+    return budgets
+
+
+STAGE_TOKEN_BUDGETS = _load_stage_budgets()
+# Output caps override the defaults next to the prompts, e.g. LLM_STAGE_OUTPUT_TOKENS="scope_of_work=12000".
+STAGE_OUTPUT_OVERRIDES = _load_stage_budgets("LLM_STAGE_OUTPUT_TOKENS")
+
+
+def budget_for_stage(stage: str) -> int:
+    return STAGE_TOKEN_BUDGETS.get(stage, LLM_PROMPT_TOKEN_BUDGET)
+
+
+def output_budget_for_stage(stage: str, concise: bool = False) -> int:
+    """Max output tokens for a stage's call; 0 means no cap. An override applies in both modes."""
+    from utils.prompts import STAGE_OUTPUT_TOKENS, CONCISE_OUTPUT_TOKENS
+
+    if stage in STAGE_OUTPUT_OVERRIDES:
+        return STAGE_OUTPUT_OVERRIDES[stage]
+    if concise and stage in CONCISE_OUTPUT_TOKENS:
+        return CONCISE_OUTPUT_TOKENS[stage]
+    return STAGE_OUTPUT_TOKENS.get(stage, 0)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate SentencePiece-style token count: one per word plus one per
+    four letters beyond a six-letter word, and one per digit, symbol and
+    non-ASCII character. Every step is a regex scan, so a 1 MB document takes
+    a few tens of milliseconds.
+    """
+    words = _WORD_RE.findall(text)
+    letters = sum(map(len, words))
+    long_word_pieces = max(0, letters - 6 * len(words)) // 4
+    return (
+        len(words)
+        + long_word_pieces
+        + len(_DIGIT_RE.findall(text))
+        + len(_SYMBOL_RE.findall(text))
+        + len(_NON_ASCII_RE.findall(text))
+    )
+
+
+class TokenEstimator:
+    """
+    Local token estimates, cached by content hash for long texts and scaled
+    per model by the ratio of billed to estimated input tokens seen so far.
+    """
+
+    def __init__(self, cache_size: int = TOKEN_ESTIMATE_CACHE_SIZE, smoothing: float = 0.2):
+        self.cache_size = cache_size
+        self.smoothing = smoothing
+        self._lock = Lock()
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._scales: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def raw(self, text: str) -> int:
+        if len(text) < _CACHE_MIN_CHARS:
+            return count_tokens(text)
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+        tokens = count_tokens(text)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = tokens
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def scale(self, model: str) -> float:
+        with self._lock:
+            return self._scales.get(model, 1.0)
+
+    def estimate(self, text: str, model: str) -> int:
+        return round(self.raw(text) * self.scale(model))
+
+    def calibrate(self, model: str, raw_estimate: int, billed_tokens: int):
+        """Fold one observed (estimate, billed) pair into the model's correction factor."""
+        if raw_estimate <= 0 or billed_tokens <= 0:
+            return
+        ratio = min(max(billed_tokens / raw_estimate, 0.5), 2.0)
+        with self._lock:
+            current = self._scales.get(model)
+            self._scales[model] = ratio if current is None else current + self.smoothing * (ratio - current)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cached_texts": len(self._cache),
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "scales": {model: round(scale, 3) for model, scale in self._scales.items()},
+            }
+
+
+TOKEN_ESTIMATOR = TokenEstimator()
+
+
+def trim_text(text: str, tokens: int, target_tokens: int) -> str:
+    """Cut `text` to roughly `target_tokens`, marker included, at a paragraph or word boundary."""
+    # Count the marker against the target, so trimming one input doesn't spill into the next.
+    keep_tokens = target_tokens - count_tokens(TRIM_MARKER)
+    if keep_tokens <= 0:
+        return TRIM_MARKER.strip()
+    cut = int(len(text) * keep_tokens / max(tokens, 1))
+    boundary = text.rfind("\n\n", 0, cut)
+    if boundary < cut // 2:
+        boundary = text.rfind(" ", 0, cut)
+    return text[:boundary if boundary > 0 else cut].rstrip() + TRIM_MARKER
+
+
+def fit_to_budget(
+    template: str,
+    inputs: Dict[str, Any],
+    stage: str,
+    model: str,
+) -> Tuple[Dict[str, Any], int, int, int]:
+    """
+    Estimate the input tokens of `template` rendered with `inputs` and, when
+    that exceeds the stage budget, shorten inputs in TRIM_PRIORITY order.
+    Only variables that appear in the template count. Returns the inputs to
+    render, the estimated prompt tokens after trimming, the raw (unscaled)
+    estimate, and the number of tokens trimmed.
+    """
+    scale = TOKEN_ESTIMATOR.scale(model)
+    used = {key: str(value) for key, value in inputs.items() if "{" + key + "}" in template}
+    raw_counts = {key: TOKEN_ESTIMATOR.raw(value) for key, value in used.items()}
+    fixed = TOKEN_ESTIMATOR.raw(template)
+    raw_total = fixed + sum(raw_counts.values())
+
+    budget = budget_for_stage(stage)
+    if not budget or round(raw_total * scale) <= budget:
+        return inputs, round(raw_total * scale), raw_total, 0
+
+    fitted = dict(inputs)
+    excess = raw_total - int(budget / scale)
+    trimmed = 0
+    for key in TRIM_PRIORITY:
+        if excess <= 0:
+            break
+        if key not in used or not raw_counts[key]:
+            continue
+        target = max(raw_counts[key] - excess, 0)
+        fitted[key] = trim_text(used[key], raw_counts[key], target)
+        removed = raw_counts[key] - TOKEN_ESTIMATOR.raw(fitted[key])
+        trimmed += removed
+        excess -= removed
+
+    raw_total -= trimmed
+    estimate = round(raw_total * scale)
+    if estimate > budget:
+        logger.warning(f"Stage '{stage}' prompt is ~{estimate} tokens after trimming, above its budget of {budget}")
+    else:
+        logger.info(f"Trimmed ~{trimmed} tokens from the '{stage}' prompt to fit its budget of {budget}")
+    return fitted, estimate, raw_total, trimmed
+
+
+class TokenUsage:
+    """Input and output token counters per stage and per session thread."""
+
+    _FIELDS = (
+        "calls", "input_tokens", "output_tokens", "estimated_input_tokens", "trimmed_tokens", "trimmed_calls",
+        "over_budget_calls", "early_stopped_calls", "truncated_calls", "coalesced_calls",
+    )
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stages: Dict[str, Dict[str, int]] = {}
+        self._threads: Dict[str, Dict[str, Dict[str, int]]] = {}
+
+    def _empty(self) -> Dict[str, int]:
+        return {field: 0 for field in self._FIELDS}
+
+    def record(
+        self,
+        stage: str,
+        thread_id: str | None,
+        estimated_input_tokens: int,
+        input_tokens: int,
+        output_tokens: int,
+        trimmed_tokens: int = 0,
+        over_budget: bool = False,
+        early_stopped: bool = False,
+        truncated: bool = False,
+        coalesced: bool = False,
+    ):
+        sample = {
+            "calls": 1,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "estimated_input_tokens": estimated_input_tokens,
+            "trimmed_tokens": trimmed_tokens,
+            "trimmed_calls": int(trimmed_tokens > 0),
+            "over_budget_calls": int(over_budget),
+            "early_stopped_calls": int(early_stopped),
+            "truncated_calls": int(truncated),
+            "coalesced_calls": int(coalesced),
+        }
+        with self._lock:
+            targets: List[Dict[str, int]] = [self._stages.setdefault(stage, self._empty())]
+            if thread_id:
+                targets.append(self._threads.setdefault(thread_id, {}).setdefault(stage, self._empty()))
+            for counters in targets:
+                for field, value in sample.items():
+                    counters[field] += value
+
+    def absorb(self, thread_id: str | None, stages: Dict[str, Dict[str, int]]):
+        """Add counters recorded elsewhere, e.g. a thread's usage reported back by a worker process."""
+        with self._lock:
+            for stage, sample in stages.items():
+                targets: List[Dict[str, int]] = [self._stages.setdefault(stage, self._empty())]
+                if thread_id:
+                    targets.append(self._threads.setdefault(thread_id, {}).setdefault(stage, self._empty()))
+                for counters in targets:
+                    for field in self._FIELDS:
+                        counters[field] += sample.get(field, 0)
+
+    def forget(self, thread_id: str):
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def _totals(self, stages: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+        totals = self._empty()
+        for counters in stages.values():
+            for field, value in counters.items():
+                totals[field] += value
+        return totals
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {stage: dict(counters) for stage, counters in self._stages.items()}
+        totals = self._totals(stages)
+        for stage, counters in stages.items():
+            counters["budget"] = budget_for_stage(stage)
+            counters["output_budget"] = output_budget_for_stage(stage)
+        return {
+            "stages": stages,
+            "totals": totals,
+            "default_budget": LLM_PROMPT_TOKEN_BUDGET,
+            "estimator": TOKEN_ESTIMATOR.snapshot(),
+        }
+
+    def thread_report(self, thread_id: str) -> Dict[str, Any]:
+        with self._lock:
+            stages = {stage: dict(counters) for stage, counters in self._threads.get(thread_id, {}).items()}
+        return {"stages": stages, "totals": self._totals(stages)}
+
+
+TOKEN_USAGE = TokenUsage()
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Dict, List
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class UpstreamTransport:
+    """
+    One shared httpx.AsyncClient per upstream, owned by a dedicated event-loop
+    thread. Worker threads (where LlamaParse runs) submit coroutines with
+    `run`, so every call reuses the same keep-alive pool, using HTTP/2 when
+    `h2` is installed, instead of building a client and paying a TLS handshake
+    per call. The pool is sized to the caller's concurrency limit.
+
+    Hooks count answered requests and newly opened connections, so `snapshot`
+    can report how often a pooled connection was reused.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_connections: int,
+        keepalive_expiry: float = 120.0,
+        timeout: float = 60.0,
+        warm_urls: List[str] | None = None,
+        verify: bool | str = True,
+    ):
+        self.name = name
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.warm_urls = warm_urls or []
+        self.verify = verify
+
+        self.client = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "connections_opened": 0, "tls_handshakes": 0, "warmed": 0}
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    async def _trace(self, event: str, info: Dict[str, Any]):
+        if event == "connection.connect_tcp.complete":
+            self._count("connections_opened")
+        elif event == "connection.start_tls.complete":
+            self._count("tls_handshakes")
+
+    async def _on_request(self, request):
+        request.extensions["trace"] = self._trace
+
+    async def _on_response(self, response):
+        self._count("requests")
+
+    def start(self):
+        """Start the loop thread and build the client. Safe to call more than once."""
+        with self._lock:
+            if self._loop is not None:
+                return
+            import httpx
+
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name=f"{self.name}-transport", daemon=True)
+            thread.start()
+
+            async def build():
+                return httpx.AsyncClient(
+                    http2=http2_available(),
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                        keepalive_expiry=self.keepalive_expiry,
+                    ),
+                    timeout=httpx.Timeout(self.timeout, connect=10.0),
+                    verify=self.verify,
+                    event_hooks={"request": [self._on_request], "response": [self._on_response]},
+                )
+
+            self.client = asyncio.run_coroutine_threadsafe(build(), loop).result()
+            self._loop, self._thread = loop, thread
+            logger.info(
+                f"Started {self.name} transport: {self.max_connections} connections, "
+                f"http2={'on' if http2_available() else 'off'}"
+            )
+
+    def run(self, coro: Awaitable, timeout: float | None = None) -> Any:
+        """Run a coroutine that uses `self.client` on the transport loop and wait for its result."""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def warm(self, connections: int | None = None):
+        """Open and keep alive connections to the warm-up URLs, up to the pool size per URL."""
+        self.start()
+        connections = min(connections or self.max_connections, self.max_connections)
+
+        async def touch(url: str):
+            try:
+                await self.client.head(url)
+                return True
+            except Exception as e:
+                logger.warning(f"{self.name} transport warm-up request to {url} failed: {e}")
+                return False
+
+        async def warm_all():
+            return await asyncio.gather(*(touch(url) for url in self.warm_urls for _ in range(connections)))
+
+        if self.warm_urls:
+            warmed = sum(self.run(warm_all(), timeout=self.timeout))
+            with self._stats_lock:
+                self.stats["warmed"] += warmed
+
+    def close(self):
+        with self._lock:
+            loop, thread, client = self._loop, self._thread, self.client
+            self._loop = self._thread = self.client = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=10)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=10)
+            loop.close()
+        logger.info(f"Closed {self.name} transport")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        served = stats["requests"]
+        stats["reuse_rate"] = round(max(0.0, 1 - stats["connections_opened"] / served), 4) if served else None
+        stats["running"] = self._loop is not None
+        return stats
+
+
+PARSE_TRANSPORT = UpstreamTransport(
+    name="llamaparse",
+    max_connections=int(os.getenv("PARSE_MAX_CONNECTIONS", "8")),
+    keepalive_expiry=float(os.getenv("UPSTREAM_KEEPALIVE_SECONDS", "120")),
+    warm_urls=[os.getenv("LLAMA_CLOUD_BASE_URL", "https://api.cloud.llamaindex.ai")],
+)
@@ -0,0 +1,53 @@
+import os
+import re
+from typing import Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Initial inputs with fewer words than this are answered locally instead of summarized.
+TRIAGE_MIN_WORDS = int(os.getenv("TRIAGE_MIN_WORDS", "3"))
+
+_GREETING_RE = re.compile(
+    r"^(hi+|hello+|hey+|hiya|heya|howdy|greetings|yo|sup|good (morning|afternoon|evening|day))"
+    r"( (there|team|all|everyone|folks|bot))*$"
+)
+
+GREETING_REPLY = {
+    "summary": (
+        "Hello! I help turn project ideas into a scope of work. Share a project brief or RFP, "
+        "or describe in a few sentences what you want to build, and I'll summarize it and then "
+        "work through the overview, features, tech stack and scope of work with you."
+    ),
+    "follow_up_question": "What project would you like to scope?",
+}
+
+EMPTY_REPLY = {
+    "summary": "I couldn't find any readable text to work from. If you uploaded a scanned PDF, it may contain only images.",
+    "follow_up_question": "Could you upload a text-based PDF or paste the project description here?",
+}
+
+TOO_SHORT_REPLY = {
+    "summary": "There isn't enough here to scope a project yet.",
+    "follow_up_question": (
+        "Could you describe the project in a few sentences: what it should do, who will use it, "
+        "and any constraints such as timeline, budget or existing systems?"
+    ),
+}
+
+
+def triage_reply(text: str) -> Dict[str, str] | None:
+    """
+    A canned summary and follow-up question for input that needs no model:
+    nothing readable, a greeting, or too few words to describe a project.
+    None means the input should be summarized by the LLM.
+    """
+    words = re.findall(r"[\w']+", text.lower())
+    if not words:
+        return EMPTY_REPLY
+    if _GREETING_RE.match(" ".join(words)):
+        return GREETING_REPLY
+    if len(words) < TRIAGE_MIN_WORDS:
+        return TOO_SHORT_REPLY
+    return None
@@ -4,7 +4,7 @@ import { Button } from '@/components/ui/button';
 import { Textarea } from '@/components/ui/textarea';
 import { Send, Copy, MoreHorizontal, Upload, Folder, MessageCircle, Plus, User, Bot } from 'lucide-react';
 import { useToast } from '@/hooks/use-toast';
-import { uploadFile, sendInitialInput, sendInput, ApiResponse } from '@/services/api';
+import { uploadFile, sendInitialInput, sendInput, listSessions, getSessionSummary, fetchMessages, deleteSession as deleteRemoteSession, ApiResponse, HistoryMessage, SessionSummary } from '@/services/api';
 import { v4 as uuidv4 } from 'uuid';
 import {
   DropdownMenu,
@@ -133,9 +133,26 @@ const MessageContent = ({ content }: { content: string }) => {
 };
 
 
-// --- MAIN CHAT COMPONENT (No other changes needed below) ---
-interface Message { id: string; content: string; sender: 'user' | 'assistant'; timestamp: Date; }
-export interface Session { id: string; name: string; type: 'folder' | 'chat'; fileName?: string; messages: Message[]; }
+// --- MAIN CHAT COMPONENT ---
+interface Message { id: string; content: string; sender: 'user' | 'assistant'; timestamp: Date; seq?: number; }
+// Sessions live on the server. `lastSeq` is the newest server message held locally and
+// `loaded` is set once the history has been fetched, so only newer messages are requested.
+export interface Session { id: string; name: string; type: 'folder' | 'chat'; fileName?: string; messages: Message[]; lastSeq: number; loaded: boolean; }
+
+// Older builds kept every conversation here; history is now fetched from the API.
+const LEGACY_STORAGE_KEY = 'work-scope-sessions';
+
+const fromSummary = (summary: SessionSummary): Session => ({ id: summary.id, name: summary.name, type: summary.type, fileName: summary.file_name ?? undefined, messages: [], lastSeq: 0, loaded: false });
+
+const fromHistoryMessage = (sessionId: string, message: HistoryMessage): Message => ({
+    id: `${sessionId}:${message.seq}`,
+    seq: message.seq,
+    content: message.role === 'assistant'
+        ? processApiResponseData({ content: message.content, current_stage: message.current_stage ?? '', follow_up_question: message.follow_up_question ?? undefined })
+        : message.content,
+    sender: message.role,
+    timestamp: new Date(message.created_at * 1000),
+});
 
 const Chat = () => {
     const { sessionId } = useParams();
@@ -143,24 +160,86 @@ const Chat = () => {
     const { toast } = useToast();
     const [message, setMessage] = useState('');
     const [sessions, setSessions] = useState<Session[]>([]);
-    const [currentSession, setCurrentSession] = useState<Session | null>(null);
+    const [nextOffset, setNextOffset] = useState<number | null>(null);
     const [isLoading, setIsLoading] = useState(false);
     const fileInputRef = useRef<HTMLInputElement>(null);
     const messagesEndRef = useRef<HTMLDivElement>(null);
     const textareaRef = useRef<HTMLTextAreaElement>(null);
+    const sessionsRef = useRef<Session[]>([]);
+    sessionsRef.current = sessions;
 
-    useEffect(() => {
-        const savedSessions = localStorage.getItem('work-scope-sessions');
-        if (savedSessions) {
-            const parsedSessions: Session[] = JSON.parse(savedSessions).map((s: any) => ({ ...s, messages: s.messages.map((m: any) => ({ ...m, timestamp: new Date(m.timestamp) })) }));
-            setSessions(parsedSessions);
-            if (sessionId) {
-                const session = parsedSessions.find((s) => s.id === sessionId);
-                setCurrentSession(session || null);
-            } else {
-                setCurrentSession(null);
+    const currentSession = sessions.find((s) => s.id === sessionId) ?? null;
+
+    const showError = (title: string, error: unknown) => {
+        toast({ title, description: error instanceof Error ? error.message : "An unknown error occurred.", variant: "destructive" });
+    };
+
+    const upsertSession = (session: Session) => {
+        setSessions(prev => prev.some(s => s.id === session.id) ? prev : [session, ...prev]);
+    };
+
+    const updateSession = (id: string, update: (session: Session) => Session) => {
+        setSessions(prev => prev.map(s => s.id === id ? update(s) : s));
+    };
+
+    const loadSessionPage = async (offset: number) => {
+        try {
+            const page = await listSessions(offset);
+            setSessions(prev => {
+                const known = new Set(prev.map(s => s.id));
+                return [...prev, ...page.sessions.filter(s => !known.has(s.id)).map(fromSummary)];
+            });
+            setNextOffset(page.next_offset);
+        } catch (error) {
+            showError("Connection Error", error);
+        }
+    };
+
+    // Fetch messages newer than `after` and replace any optimistic (unsequenced) ones.
+    const syncMessages = async (id: string, after: number) => {
+        const fetched: Message[] = [];
+        let cursor = after;
+        let hasMore = true;
+        while (hasMore) {
+            const page = await fetchMessages(id, cursor);
+            fetched.push(...page.messages.map(m => fromHistoryMessage(id, m)));
+            cursor = page.next_after;
+            hasMore = page.has_more;
+        }
+        updateSession(id, s => ({
+            ...s,
+            messages: [...s.messages.filter(m => m.seq !== undefined && m.seq <= after), ...fetched],
+            lastSeq: cursor,
+            loaded: true,
+        }));
+    };
+
+    const openSession = async (id: string) => {
+        try {
+            if (!sessionsRef.current.some(s => s.id === id)) {
+                const summary = await getSessionSummary(id);
+                if (!summary) {
+                    // Unknown to the server: a new chat that starts with its first message.
+                    upsertSession({ id, name: "New Chat", type: 'chat', messages: [], lastSeq: 0, loaded: true });
+                    return;
+                }
+                upsertSession(fromSummary(summary));
             }
+            await syncMessages(id, 0);
+        } catch (error) {
+            showError("Connection Error", error);
         }
+    };
+
+    useEffect(() => {
+        localStorage.removeItem(LEGACY_STORAGE_KEY);
+        loadSessionPage(0);
+    }, []);
+
+    useEffect(() => {
+        if (!sessionId) return;
+        const session = sessionsRef.current.find(s => s.id === sessionId);
+        if (!session?.loaded) openSession(sessionId);
     }, [sessionId]);
 
     useEffect(() => {
@@ -175,15 +254,15 @@ const Chat = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
     }, [currentSession?.messages, isLoading]);
 
-    const updateAndSaveSessions = (newSessions: Session[]) => {
-        setSessions(newSessions);
-        localStorage.setItem('work-scope-sessions', JSON.stringify(newSessions));
-    }
-
-    const deleteSession = (sessionIdToDelete: string) => {
-        const updatedSessions = sessions.filter(s => s.id !== sessionIdToDelete);
-        updateAndSaveSessions(updatedSessions);
-        if (currentSession?.id === sessionIdToDelete) navigate('/');
+    const deleteSession = async (sessionIdToDelete: string) => {
+        try {
+            await deleteRemoteSession(sessionIdToDelete);
+        } catch (error) {
+            showError("Delete Failed", error);
+            return;
+        }
+        setSessions(prev => prev.filter(s => s.id !== sessionIdToDelete));
+        if (sessionId === sessionIdToDelete) navigate('/');
         toast({ title: "Session deleted" });
     };
 
@@ -199,26 +278,13 @@ const Chat = () => {
 
         try {
             const newSessionId = uuidv4();
-            const response = await uploadFile(newSessionId, file);
-            const assistantMessageContent = processApiResponseData(response);
+            await uploadFile(newSessionId, file);
             const nameWithoutExtension = file.name.replace(/\.[^/.]+$/, "");
-            const newSession: Session = {
-                id: newSessionId,
-                name: nameWithoutExtension,
-                type: 'folder',
-                fileName: file.name,
-                messages: [{
-                    id: uuidv4(),
-                    content: assistantMessageContent,
-                    sender: 'assistant',
-                    timestamp: new Date()
-                }],
-            };
-            const updatedSessions = [...sessions, newSession];
-            updateAndSaveSessions(updatedSessions);
-            navigate(`/chat/${newSession.id}`);
+            upsertSession({ id: newSessionId, name: nameWithoutExtension, type: 'folder', fileName: file.name, messages: [], lastSeq: 0, loaded: false });
+            await syncMessages(newSessionId, 0);
+            navigate(`/chat/${newSessionId}`);
         } catch (error) {
-            toast({ title: "Upload Error", description: error instanceof Error ? error.message : "An unknown error occurred.", variant: "destructive" });
+            showError("Upload Error", error);
         } finally {
             setIsLoading(false);
         }
@@ -226,14 +292,13 @@ const Chat = () => {
 
     const handleNewChat = () => {
         const newSessionId = uuidv4();
-        const newSession: Session = { id: newSessionId, name: "New Chat", type: 'chat', messages: [] };
-        const updatedSessions = [...sessions, newSession];
-        updateAndSaveSessions(updatedSessions);
+        upsertSession({ id: newSessionId, name: "New Chat", type: 'chat', messages: [], lastSeq: 0, loaded: true });
         navigate(`/chat/${newSessionId}`);
     }
 
     const handleSendMessage = async () => {
         if (!message.trim() || !currentSession || isLoading) return;
+        const session = currentSession;
         const userMessageContent = message;
         setMessage('');
         const userMessage: Message = {
@@ -242,31 +307,23 @@ const Chat = () => {
             sender: 'user',
             timestamp: new Date()
         };
-        const isInitialMessageInChat = currentSession.type === 'chat' && currentSession.messages.length === 0;
-        const updatedSessionWithUserMessage = { ...currentSession, name: isInitialMessageInChat ? userMessageContent.substring(0, 30) + (userMessageContent.length > 30 ? '...' : '') : currentSession.name, messages: [...currentSession.messages, userMessage], };
-        const sessionsWithUserMessage = sessions.map(s => s.id === currentSession.id ? updatedSessionWithUserMessage : s);
-        setCurrentSession(updatedSessionWithUserMessage);
-        setSessions(sessionsWithUserMessage);
+        const isInitialMessageInChat = session.type === 'chat' && session.lastSeq === 0;
+        updateSession(session.id, s => ({
+            ...s,
+            name: isInitialMessageInChat ? userMessageContent.substring(0, 30) + (userMessageContent.length > 30 ? '...' : '') : s.name,
+            messages: [...s.messages, userMessage],
+        }));
         setIsLoading(true);
 
         try {
-            const response = isInitialMessageInChat ? await sendInitialInput(currentSession.id, userMessageContent) : await sendInput(currentSession.id, userMessageContent);
-            if (response) {
-                const assistantMessageContent = processApiResponseData(response);
-                const assistantMessage: Message = {
-                    id: uuidv4(),
-                    content: assistantMessageContent,
-                    sender: 'assistant',
-                    timestamp: new Date()
-                };
-                const finalSession = { ...updatedSessionWithUserMessage, messages: [...updatedSessionWithUserMessage.messages, assistantMessage] };
-                const finalSessions = sessions.map(s => s.id === currentSession.id ? finalSession : s);
-                setCurrentSession(finalSession);
-                updateAndSaveSessions(finalSessions);
+            if (isInitialMessageInChat) {
+                await sendInitialInput(session.id, userMessageContent);
+            } else {
+                await sendInput(session.id, userMessageContent);
             }
+            await syncMessages(session.id, session.lastSeq);
         } catch (error) {
-            toast({ title: "Connection Error", description: error instanceof Error ? error.message : "Failed to send message.", variant: "destructive" });
-            updateAndSaveSessions(sessionsWithUserMessage);
+            showError("Connection Error", error);
         } finally {
             setIsLoading(false);
         }
@@ -323,6 +380,7 @@ const Chat = () => {
                     <div>
                         <div className="flex items-center justify-between mb-3"><h3 className="text-sm font-medium text-sidebar-foreground">Chats</h3><Button variant="ghost" size="sm" onClick={handleNewChat} className="text-primary hover:text-primary-foreground hover:bg-primary"><Plus className="h-4 w-4" /></Button></div>
                         <div className="space-y-1">{chats.map((chat) => (<div key={chat.id} className={`group p-3 rounded-lg cursor-pointer flex items-center justify-between hover-accent ${chat.id === sessionId ? 'active-indicator' : ''}`} onClick={() => navigate(`/chat/${chat.id}`)}><div className="flex items-center flex-1 min-w-0 space-x-3"><MessageCircle className="h-4 w-4 text-primary flex-shrink-0" /><p className="text-sm font-medium text-sidebar-foreground truncate">{chat.name}</p></div><DropdownMenu><DropdownMenuTrigger asChild><Button variant="ghost" size="sm" className="opacity-0 group-hover:opacity-100 h-6 w-6 p-0"><MoreHorizontal className="h-4 w-4" /></Button></DropdownMenuTrigger><DropdownMenuContent><DropdownMenuItem onClick={(e) => { e.stopPropagation(); deleteSession(chat.id); }} className="text-destructive">Delete</DropdownMenuItem></DropdownMenuContent></DropdownMenu></div>))}</div>
+                        {nextOffset !== null && (<Button variant="ghost" size="sm" className="w-full mt-2 text-muted-foreground" onClick={() => loadSessionPage(nextOffset)}>Load more</Button>)}
                     </div>
                 </div>
             </div>
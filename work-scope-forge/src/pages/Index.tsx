@@ -4,7 +4,6 @@ import { Card, CardContent } from '@/components/ui/card';
 import { Upload, MessageCircle } from 'lucide-react';
 import { useToast } from '@/hooks/use-toast';
 import { uploadFile } from '@/services/api';
-import { Session } from './Chat';
 
 const Index = () => {
   const navigate = useNavigate();
@@ -16,18 +15,8 @@ const Index = () => {
   };
 
   const handleDirectChat = () => {
+    // The chat page treats a session the server does not know yet as a new chat.
     const sessionId = Date.now().toString();
-    const newSession: Session = {
-      id: sessionId,
-      name: 'New Chat',
-      type: 'chat',
-      messages: [],
-    };
-
-    const existingSessions = JSON.parse(localStorage.getItem('work-scope-sessions') || '[]');
-    const updatedSessions = [...existingSessions, newSession];
-    localStorage.setItem('work-scope-sessions', JSON.stringify(updatedSessions));
-
     navigate(`/chat/${sessionId}`);
   };
 
@@ -43,31 +32,9 @@ const Index = () => {
     });
 
     try {
+      // The server records the session and its first message; the chat page loads them.
       const sessionId = Date.now().toString();
-      const response = await uploadFile(sessionId, file);
-      const nameWithoutExtension = file.name.replace(/\.[^/.]+$/, "");
-      
-      let combinedContent = response.content;
-      if (response.follow_up_question) {
-        combinedContent += `\n\n${response.follow_up_question}`;
-      }
-
-      const newSession: Session = {
-        id: sessionId,
-        name: nameWithoutExtension,
-        type: 'folder',
-        fileName: file.name,
-        messages: [{
-          id: Date.now().toString(),
-          content: combinedContent,
-          sender: 'assistant',
-          timestamp: new Date()
-        }],
-      };
-
-      const existingSessions = JSON.parse(localStorage.getItem('work-scope-sessions') || '[]');
-      const updatedSessions = [...existingSessions, newSession];
-      localStorage.setItem('work-scope-sessions', JSON.stringify(updatedSessions));
+      await uploadFile(sessionId, file);
       navigate(`/chat/${sessionId}`);
 
     } catch (error) {
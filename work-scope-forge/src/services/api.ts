@@ -6,6 +6,53 @@ export interface ApiResponse {
   follow_up_question?: string;
 }
 
+interface JobAccepted {
+  job_id: string;
+  status: string;
+  status_url: string;
+}
+
+interface JobStatus {
+  job_id: string;
+  status: "running" | "succeeded" | "failed";
+  result?: ApiResponse | null;
+  error?: { status_code: number; detail: string } | null;
+}
+
+// Seconds each GET /jobs/{job_id} is held open while the turn runs.
+const JOB_WAIT_SECONDS = 25;
+
+// With JOB_QUEUE_PATH set the server answers turns with 202 and a job; poll it until the turn finishes.
+const waitForJob = async (job: JobAccepted): Promise<ApiResponse> => {
+  while (true) {
+    const response = await fetch(`${API_BASE_URL}${job.status_url}?wait=${JOB_WAIT_SECONDS}`);
+    if (!response.ok) {
+      throw new Error(`Failed to load job ${job.job_id}: ${response.status}`);
+    }
+
+    const status: JobStatus = await response.json();
+    if (status.status === "succeeded" && status.result) return status.result;
+    if (status.status === "failed") {
+      throw new Error(status.error?.detail || `Job ${job.job_id} failed`);
+    }
+  }
+};
+
+// The reply to a turn, whether the server answered directly (200) or queued it (202).
+const readTurnResponse = async (response: Response, failure: string): Promise<ApiResponse> => {
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({
+      detail: `${failure} with status: ${response.status}`,
+    }));
+    throw new Error(error.detail);
+  }
+
+  if (response.status === 202) {
+    return await waitForJob(await response.json());
+  }
+  return await response.json();
+};
+
 // POST /sessions/{session_id}/upload
 export const uploadFile = async (sessionId: string, file: File): Promise<ApiResponse> => {
   const formData = new FormData();
@@ -16,14 +63,7 @@ export const uploadFile = async (sessionId: string, file: File): Promise<ApiResp
     body: formData,
   });
 
-  if (!response.ok) {
-    const error = await response.json().catch(() => ({
-      detail: `Upload failed with status: ${response.status}`,
-    }));
-    throw new Error(error.detail);
-  }
-
-  return await response.json();
+  return await readTurnResponse(response, "Upload failed");
 };
 
 // POST /sessions/{session_id}/initial-input
@@ -34,14 +74,7 @@ export const sendInitialInput = async (sessionId: string, input: string): Promis
     body: JSON.stringify({ initial_input: input }),
   });
 
-  if (!response.ok) {
-    const error = await response.json().catch(() => ({
-      detail: `Request failed with status: ${response.status}`,
-    }));
-    throw new Error(error.detail);
-  }
-
-  return await response.json();
+  return await readTurnResponse(response, "Request failed");
 };
 
 // POST /sessions/{session_id}/input
@@ -52,16 +85,87 @@ export const sendInput = async (sessionId: string, input: string): Promise<ApiRe
     body: JSON.stringify({ user_input: input }),
   });
 
+  return await readTurnResponse(response, "Request failed");
+};
+
+export interface SessionSummary {
+  id: string;
+  name: string;
+  type: "folder" | "chat";
+  file_name?: string | null;
+  current_stage?: string | null;
+  message_count: number;
+  updated_at: number;
+}
+
+export interface SessionListResponse {
+  sessions: SessionSummary[];
+  total: number;
+  next_offset: number | null;
+}
+
+export interface HistoryMessage {
+  seq: number;
+  role: "user" | "assistant";
+  content: string;
+  current_stage?: string | null;
+  follow_up_question?: string | null;
+  created_at: number;
+}
+
+export interface SessionMessagesResponse {
+  messages: HistoryMessage[];
+  next_after: number;
+  has_more: boolean;
+}
+
+// GET /sessions
+export const listSessions = async (offset = 0, limit = 20): Promise<SessionListResponse> => {
+  const response = await fetch(`${API_BASE_URL}/sessions?offset=${offset}&limit=${limit}`);
+
   if (!response.ok) {
-    const error = await response.json().catch(() => ({
-      detail: `Request failed with status: ${response.status}`,
-    }));
-    throw new Error(error.detail);
+    throw new Error(`Failed to load sessions: ${response.status}`);
   }
 
   return await response.json();
 };
 
+// GET /sessions/{session_id}; null when the server does not know the session.
+export const getSessionSummary = async (sessionId: string): Promise<SessionSummary | null> => {
+  const response = await fetch(`${API_BASE_URL}/sessions/${sessionId}`);
+
+  if (response.status === 404) return null;
+  if (!response.ok) {
+    throw new Error(`Failed to load session: ${response.status}`);
+  }
+
+  return await response.json();
+};
+
+// GET /sessions/{session_id}/messages; pass the last seen seq as `after` to fetch only new messages.
+export const fetchMessages = async (
+  sessionId: string,
+  after = 0,
+  limit = 50,
+): Promise<SessionMessagesResponse> => {
+  const response = await fetch(`${API_BASE_URL}/sessions/${sessionId}/messages?after=${after}&limit=${limit}`);
+
+  if (!response.ok) {
+    throw new Error(`Failed to load messages: ${response.status}`);
+  }
+
+  return await response.json();
+};
+
+// DELETE /sessions/{session_id}
+export const deleteSession = async (sessionId: string): Promise<void> => {
+  const response = await fetch(`${API_BASE_URL}/sessions/${sessionId}`, { method: "DELETE" });
+
+  if (!response.ok) {
+    throw new Error(`Failed to delete session: ${response.status}`);
+  }
+};
+
 // GET /
 export const checkHealth = async (): Promise<boolean> => {
   try {
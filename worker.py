@@ -0,0 +1,185 @@
+"""
+Worker processes for queue mode (JOB_QUEUE_PATH set): they claim parse and
+graph jobs from the shared SQLite queue and run them off the API process.
+
+    JOB_QUEUE_PATH=jobs.sqlite3 python worker.py --processes 4
+
+Graph jobs carry the session's state and return only the fields that
+changed. The API owns the checkpoints, so workers keep nothing between jobs
+except retrieval indexes for recently seen threads.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.logger import setup_logging  # noqa: E402
+from utils.job_queue import JOB_QUEUE_PATH, WORKER_KINDS, JobQueue  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "0.2"))
+WORKER_INDEX_CACHE_SIZE = int(os.getenv("WORKER_INDEX_CACHE_SIZE", "32"))
+
+# Thread id -> length of the document its index covers.
+_indexed_threads: "OrderedDict[str, int]" = OrderedDict()
+
+
+def ensure_index(thread_id: str, document: str):
+    """
+    Build the retrieval index for a large document once per thread, keeping
+    the most recent few. Documents appended since are added to the index.
+    """
+    from utils.retrieval import should_index, build_session_index, extend_session_index, drop_session_index
+
+    if not should_index(document):
+        return
+    indexed_chars = _indexed_threads.get(thread_id)
+    if indexed_chars == len(document):
+        _indexed_threads.move_to_end(thread_id)
+        return
+    if indexed_chars is not None and indexed_chars < len(document):
+        extend_session_index(thread_id, document, document[indexed_chars:])
+    else:
+        build_session_index(thread_id, document)
+    _indexed_threads[thread_id] = len(document)
+    _indexed_threads.move_to_end(thread_id)
+    while len(_indexed_threads) > WORKER_INDEX_CACHE_SIZE:
+        evicted, _ = _indexed_threads.popitem(last=False)
+        drop_session_index(evicted)
+
+
+def run_parse_job(payload: Dict[str, Any], data: bytes) -> Dict[str, Any]:
+    from utils.helper import parse_file
+
+    return {"file_content": parse_file(data, payload["filename"])}
+
+
+def run_graph_job(payload: Dict[str, Any], data: bytes | None) -> Dict[str, Any]:
+    """
+    Seed a scratch thread with the session's state, run one graph step and
+    return the changed fields. The thread id matches the session's, so
+    retrieval and token accounting see the same thread as in-process runs.
+    The job's priority applies to this run only and is not returned.
+    """
+    from src.graph import get_graph, END
+    from src.checkpoints import thread_config
+    from utils.tokens import TOKEN_USAGE
+    from utils.schemas import artifact_json
+
+    graph = get_graph()
+    thread_id = payload["thread_id"]
+    state = payload.get("state")
+    graph_input = {**payload["input"], "priority": payload.get("priority", "interactive")}
+    config = thread_config(thread_id)
+    config["configurable"]["concise"] = bool(payload.get("concise"))
+
+    try:
+        if state:
+            graph.update_state(config, state, as_node="pause_node")
+        ensure_index(thread_id, graph_input.get("file_content") or (state or {}).get("file_content", ""))
+        result_values = graph.invoke(graph_input, config=config)
+    finally:
+        graph.checkpointer.delete_thread(thread_id)
+
+    # Structured artifacts travel as JSON; compare them in that form.
+    baseline = {**(state or {}), **graph_input}
+    completed = END in result_values
+    result_values = {key: artifact_json(value) for key, value in result_values.items() if key != END}
+    changes = {key: value for key, value in result_values.items() if baseline.get(key) != value}
+    usage = TOKEN_USAGE.thread_report(thread_id)["stages"]
+    TOKEN_USAGE.forget(thread_id)
+    return {"changes": changes, "completed": completed, "usage": usage}
+
+
+JOB_HANDLERS = {
+    "parse": run_parse_job,
+    "graph": run_graph_job,
+}
+
+
+def keep_leased(queue: JobQueue, job_id: str, worker: str, done: threading.Event):
+    while not done.wait(queue.lease_seconds / 3):
+        if not queue.heartbeat(job_id, worker):
+            logger.warning(f"Lost the lease on job {job_id}; its result will be dropped")
+            return
+
+
+def serve(kinds: list, warm_up: bool):
+    setup_logging()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(JOB_QUEUE_PATH)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    if warm_up:
+        from src.graph import get_graph
+        from utils.helper import warm_up_clients
+
+        get_graph()
+        warm_up_clients()
+    logger.info(f"Worker {worker} serving {', '.join(kinds)} jobs from {JOB_QUEUE_PATH}")
+
+    while not stopping.is_set():
+        job = queue.claim(worker, kinds)
+        if job is None:
+            stopping.wait(WORKER_POLL_SECONDS)
+            continue
+
+        start_time = time.time()
+        done = threading.Event()
+        threading.Thread(target=keep_leased, args=(queue, job["id"], worker, done), daemon=True).start()
+        try:
+            result = JOB_HANDLERS[job["kind"]](job["payload"], job["data"])
+            # Once another worker has re-claimed the job, only its result counts.
+            if queue.complete(job["id"], result, worker):
+                logger.info(f"Job {job['id']} ({job['kind']}) finished in {time.time() - start_time:.2f} seconds")
+            else:
+                logger.warning(f"Dropped the result of job {job['id']} ({job['kind']}): its lease was lost")
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['kind']}) failed: {e}", exc_info=True)
+            if not queue.fail(job["id"], {"status_code": 500, "detail": str(e)}, worker):
+                logger.warning(f"Dropped the error of job {job['id']} ({job['kind']}): its lease was lost")
+        finally:
+            done.set()
+
+    queue.close()
+    logger.info(f"Worker {worker} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--kinds", default=",".join(WORKER_KINDS), help="Comma-separated job kinds to run.")
+    parser.add_argument("--no-warm-up", action="store_true", help="Skip building clients before the first job.")
+    args = parser.parse_args()
+
+    if not JOB_QUEUE_PATH:
+        raise SystemExit("Set JOB_QUEUE_PATH to the queue file shared with the API.")
+    kinds = [kind.strip() for kind in args.kinds.split(",") if kind.strip() in JOB_HANDLERS]
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=serve, args=(kinds, not args.no_warm_up), name=f"worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()